@@ -0,0 +1,304 @@
+"""
+acquisition.py
+Adquisición de sensores en un proceso aparte.
+
+El IOManager corre en un proceso hijo con su propio GIL: una consulta
+pesada en la GUI o en SQLite no retrasa el sondeo de sensores. El hijo
+publica los estados en un bloque `multiprocessing.shared_memory` protegido
+por un contador de secuencia (seqlock: impar mientras escribe) y envía los
+cambios por una tubería. El proceso principal lee los estados directamente
+de la memoria compartida, sin serializar ni esperar al hijo.
+
+Uso:
+    io = create_io_manager(config_manager, events=core.events)
+    io.on_sensor_trigger = rule_engine.handle_event
+"""
+
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional
+
+from config import ConfigManager
+from event_buffer import RecentEvents, SENSOR
+from sensor_snapshots import SensorSnapshots, SensorSnapshot
+from anomaly import AnomalyDetector
+
+logger = logging.getLogger("ACQUISITION")
+
+HEADER = struct.Struct('<QI4x')   # secuencia, número de sensores
+ENTRY = struct.Struct('<iB3xd')   # module_id, estado, instante del último cambio
+
+STATE_CODES = {'unknown': 0, 'normal': 1, 'alarm': 2}
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+# Métodos del IOManager que el proceso principal puede invocar en el hijo
+REMOTE_METHODS = ('register_sensor', 'set_sensor_state', 'activate_output', 'get_gpio_info')
+
+
+class SensorStateTable:
+    """Tabla de estados en memoria compartida: un escritor, muchos lectores."""
+
+    def __init__(self, max_sensors: int = 256, name: str = None, create: bool = True):
+        self.max_sensors = max_sensors
+        size = HEADER.size + max_sensors * ENTRY.size
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        else:
+            # El hijo ('spawn') comparte el resource_tracker del padre, que es quien lo libera
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._seq = 0
+
+    def write(self, entries):
+        """Publicar [(module_id, estado, instante)]; solo lo llama el escritor."""
+        buf = self.shm.buf
+        entries = entries[:self.max_sensors]
+        self._seq += 1                     # impar: escritura en curso
+        struct.pack_into('<Q', buf, 0, self._seq)
+        offset = HEADER.size
+        for module_id, state, changed in entries:
+            ENTRY.pack_into(buf, offset, module_id, STATE_CODES.get(state, 0), changed)
+            offset += ENTRY.size
+        self._seq += 1                     # par: datos coherentes
+        HEADER.pack_into(buf, 0, self._seq, len(entries))
+
+    def read(self, retries: int = 1000):
+        """
+        Leer una instantánea coherente.
+
+        Returns:
+            (secuencia, {module_id: (estado, instante)})
+        """
+        buf = self.shm.buf
+        for _ in range(retries):
+            seq, count = HEADER.unpack_from(buf, 0)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            data = bytes(buf[HEADER.size:HEADER.size + count * ENTRY.size])
+            if struct.unpack_from('<Q', buf, 0)[0] != seq:
+                continue  # El escritor la cambió mientras se copiaba
+            return seq, {module_id: (STATE_NAMES.get(code, 'unknown'), changed)
+                         for module_id, code, changed in ENTRY.iter_unpack(data)}
+        raise RuntimeError("could not read a consistent sensor snapshot")
+
+    def close(self, unlink: bool = False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _acquisition_main(conn, table_name: str, max_sensors: int, config_path: Optional[str]):
+    """Bucle del proceso hijo: sondeo por lotes, publicación y órdenes del padre."""
+    from io_manager import IOManager
+    from config import get_config_manager
+
+    table = SensorStateTable(max_sensors, name=table_name, create=False)
+    io = IOManager(config=get_config_manager(config_path) if config_path else None)
+    states: Dict[int, list] = {}  # module_id -> [estado, instante]
+    try:
+        while True:
+            # Órdenes del proceso principal (espera como máximo un intervalo de sondeo)
+            while conn.poll(io.defaults['check_interval']):
+                message = conn.recv()
+                if message[0] == 'stop':
+                    return
+                _, request_id, method, args = message
+                try:
+                    result = getattr(io, method)(*args) if method in REMOTE_METHODS else None
+                    conn.send(('result', request_id, result))
+                except Exception as e:
+                    conn.send(('error', request_id, str(e)))
+                if not conn.poll():
+                    break
+
+            # Una lectura en bloque de todos los sensores
+            now = time.time()
+            changed = False
+            for module_id, state in io.read_all_sensor_states().items():
+                entry = states.get(module_id)
+                if entry is None or entry[0] != state:
+                    previous = entry[0] if entry else None
+                    states[module_id] = [state, now]
+                    changed = True
+                    conn.send(('event', module_id, state, previous, now))
+            if changed:
+                table.write([(m, s, t) for m, (s, t) in states.items()])
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        io.cleanup()
+        table.close()
+
+
+class AcquisitionProcess:
+    """
+    Fachada en el proceso principal con la interfaz del IOManager.
+
+    Los estados se leen de la memoria compartida; los cambios llegan por la
+    tubería y se entregan a `on_sensor_trigger` desde un hilo lector.
+    """
+
+    def __init__(self, config=None, max_sensors: int = 256, events: Optional[RecentEvents] = None,
+                 call_timeout: float = 5.0, anomalies: Optional[AnomalyDetector] = None):
+        """
+        Args:
+            config: ConfigManager o ruta del archivo de configuración (el hijo carga el suyo)
+            events: Últimos eventos donde anotar los cambios de sensores
+            anomalies: Detector de anomalías; aquí lo evalúa su propio hilo
+        """
+        self.config_path = config.path if isinstance(config, ConfigManager) else config
+        self.max_sensors = max_sensors
+        self.events = events
+        self.anomalies = anomalies
+        self.call_timeout = call_timeout
+
+        self.on_sensor_trigger: Optional[Callable] = None
+        self.snapshots = SensorSnapshots()
+        self.table = None
+        self.process = None
+        self._conn = None
+        self._reader = None
+        self._send_lock = threading.Lock()
+        self._results: Dict[int, tuple] = {}
+        self._results_cond = threading.Condition()
+        self._next_request = 0
+
+    # ========== Ciclo de vida ==========
+
+    def start(self):
+        if self.process and self.process.is_alive():
+            return
+        self.table = SensorStateTable(self.max_sensors)
+        # 'spawn': el hijo no hereda hilos ni conexiones SQLite del padre
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_acquisition_main, name="acquisition", daemon=True,
+                                       args=(child_conn, self.table.name, self.max_sensors,
+                                             self.config_path))
+        self.process.start()
+        child_conn.close()
+        self._reader = threading.Thread(target=self._read_loop, name="acquisition-reader", daemon=True)
+        self._reader.start()
+        if self.anomalies is not None:
+            self.anomalies.start()
+        logger.info(f"Acquisition process started (pid {self.process.pid})")
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'event':
+                _, module_id, state, previous, changed = message
+                self.snapshots.update(module_id, state, changed=changed)
+                if self.anomalies is not None:
+                    # `changed` es hora de pared; el detector usa su propio reloj monótono
+                    self.anomalies.record(module_id, state)
+                if self.events is not None:
+                    self.events.append(SENSOR, module_id, state, previous=previous)
+                # El primer estado de un sensor no es un disparo
+                if previous is not None and self.on_sensor_trigger:
+                    try:
+                        self.on_sensor_trigger(module_id, state)
+                    except Exception as e:
+                        logger.error(f"Sensor trigger callback failed: {e}")
+            else:
+                with self._results_cond:
+                    self._results[message[1]] = message
+                    self._results_cond.notify_all()
+
+    def _call(self, method: str, *args):
+        if not self.process or not self.process.is_alive():
+            raise RuntimeError("acquisition process is not running")
+        with self._send_lock:
+            self._next_request += 1
+            request_id = self._next_request
+            self._conn.send(('call', request_id, method, args))
+        with self._results_cond:
+            if not self._results_cond.wait_for(lambda: request_id in self._results, self.call_timeout):
+                raise TimeoutError(f"acquisition process did not answer '{method}'")
+            kind, _, value = self._results.pop(request_id)
+        if kind == 'error':
+            raise RuntimeError(value)
+        return value
+
+    def stop(self):
+        if self.anomalies is not None:
+            self.anomalies.stop()
+        if self.process is None:
+            return
+        try:
+            with self._send_lock:
+                self._conn.send(('stop',))
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._conn.close()
+        self.table.close(unlink=True)
+        self.process = None
+        logger.info("Acquisition process stopped")
+
+    # ========== Interfaz del IOManager ==========
+
+    def register_sensor(self, module_id: int, gpio_pin: int,
+                        sensor_type: str = 'NO', pull_config: str = 'UP') -> bool:
+        return self._call('register_sensor', module_id, gpio_pin, sensor_type, pull_config)
+
+    def set_sensor_state(self, module_id: int, state: str) -> bool:
+        return self._call('set_sensor_state', module_id, state)
+
+    def activate_output(self, output_type: str, duration: float = None) -> bool:
+        return self._call('activate_output', output_type, duration)
+
+    def read_all_sensor_states(self) -> Dict[int, str]:
+        """Estados desde la memoria compartida (sin comunicar con el hijo)."""
+        _, states = self.table.read()
+        return {module_id: state for module_id, (state, _) in states.items()}
+
+    def read_sensor_state(self, module_id: int) -> str:
+        return self.read_all_sensor_states().get(module_id, 'unknown')
+
+    def sensor_snapshot(self) -> SensorSnapshot:
+        return self.snapshots.current()
+
+    def changes_since(self, version: int):
+        return self.snapshots.changes_since(version)
+
+    def get_gpio_info(self) -> dict:
+        info = self._call('get_gpio_info')
+        info['process'] = self.process.pid if self.process else None
+        return info
+
+    # Compatibilidad con IOManager: el hijo sondea siempre
+    def start_monitoring(self):
+        self.start()
+
+    def stop_monitoring(self):
+        pass
+
+    def cleanup(self):
+        self.stop()
+
+
+def create_io_manager(config=None, events: Optional[RecentEvents] = None,
+                      anomalies: Optional[AnomalyDetector] = None):
+    """
+    Crear el gestor de E/S según `io.separate_process`: un IOManager en
+    este proceso o un AcquisitionProcess ya arrancado.
+    """
+    snapshot = config.snapshot if isinstance(config, ConfigManager) else None
+    if snapshot is not None and snapshot.io.separate_process:
+        io = AcquisitionProcess(config, events=events, anomalies=anomalies)
+        io.start()
+        return io
+    from io_manager import IOManager
+    return IOManager(config=config, events=events, anomalies=anomalies)
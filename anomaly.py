@@ -0,0 +1,371 @@
+"""
+anomaly.py
+Detección de sensores defectuosos o manipulados.
+
+`AnomalyDetector` guarda por sensor, en arrays compactos (un índice por
+sensor), los instantes de sus últimas transiciones, el estado actual y
+estadísticas de los intervalos entre eventos. En cada tick evalúa todos
+los sensores de una pasada (vectorizada con numpy si está instalado) y
+genera alarmas de mantenimiento a través de AlarmCore:
+
+- flapping: `flap_threshold` transiciones o más en `window` segundos
+- stuck: en alarma más de `stuck_after` segundos, o sin ninguna
+  transición en `silent_after` segundos (si se configura)
+- tamper: lectura 'unknown' (línea cortada, expansor sin respuesta)
+  durante `tamper_after` segundos, o dos flancos dentro de la ventana más
+  próximos que `min_interval` (más rápido de lo que permite el debounce)
+
+Cada anomalía genera una alarma al aparecer y se rearma cuando desaparece
+(o si no se pudo registrar la alarma, para reintentarlo en el siguiente
+tick). Los instantes usan time.monotonic(): el salto del reloj por NTP al
+arrancar una Pi sin RTC no marca todos los sensores como atascados.
+"""
+
+import logging
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger("ANOMALY")
+
+FLAPPING = 'flapping'
+STUCK = 'stuck'
+TAMPER = 'tamper'
+
+# Tipos de alarma de mantenimiento: no ponen el módulo en estado 'alarm'
+MAINTENANCE_TYPES = (FLAPPING, STUCK, TAMPER)
+
+_BITS = {FLAPPING: 1, STUCK: 2, TAMPER: 4}
+
+UNKNOWN, NORMAL, ALARM = 0, 1, 2
+STATE_CODES = {'unknown': UNKNOWN, 'normal': NORMAL, 'alarm': ALARM}
+
+Anomaly = Tuple[int, str, str]  # (module_id, tipo, detalle)
+
+EMPTY = float('-inf')  # Hueco del anillo de transiciones
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class AnomalyDetector:
+    """Ventanas deslizantes por sensor y evaluación conjunta en cada tick."""
+
+    def __init__(self, core=None, window: float = 60.0, flap_threshold: int = 10,
+                 stuck_after: float = 1800.0, silent_after: Optional[float] = None,
+                 tamper_after: float = 5.0, min_interval: float = 0.02,
+                 scheduler: Optional[Callable[[Callable[[], None]], None]] = None,
+                 initial_capacity: int = 32):
+        """
+        Args:
+            core: AlarmCore donde registrar las alarmas de mantenimiento
+            window: Ventana deslizante en segundos
+            flap_threshold: Transiciones en la ventana que se consideran flapping
+            stuck_after: Segundos seguidos en alarma que se consideran atasco
+            silent_after: Segundos sin transiciones que se consideran atasco (None = no se vigila)
+            tamper_after: Segundos con lectura 'unknown' que se consideran sabotaje
+            min_interval: Separación mínima plausible entre dos flancos
+            scheduler: Ejecuta el registro de alarmas en el hilo del núcleo, p. ej.
+                       ``lambda fn: tk_root.after(0, fn)``; obligatorio con `core`
+                       (SQLite exige ese hilo y la evaluación corre en otro)
+        """
+        if flap_threshold < 2:
+            raise ValueError("flap_threshold must be >= 2")
+        if core is not None and scheduler is None:
+            raise ValueError("a scheduler is required to raise alarms through core")
+        self.core = core
+        self.window = window
+        self.flap_threshold = flap_threshold
+        self.stuck_after = stuck_after
+        self.silent_after = silent_after
+        self.tamper_after = tamper_after
+        self.min_interval = min_interval
+        self.scheduler = scheduler
+        self.on_anomaly: Optional[Callable[[int, str, str], None]] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._slots: Dict[int, int] = {}   # module_id -> índice en los arrays
+        self._module_ids = array('q')
+        self._size = 0
+        self._capacity = 0
+        # Anillo de los últimos `flap_threshold` instantes de transición (plano: sensor * K + j)
+        self._ring = flap_threshold
+        self._allocate(initial_capacity)
+
+    # ========== Almacenamiento ==========
+
+    def _new(self, typecode: str, length: int, fill):
+        if NUMPY_AVAILABLE:
+            dtype = {'d': np.float64, 'q': np.int64, 'b': np.int8, 'B': np.uint8}[typecode]
+            return np.full(length, fill, dtype=dtype)
+        return array(typecode, [fill]) * length
+
+    def _grow(self, values, extra: int, fill):
+        if NUMPY_AVAILABLE:
+            return np.concatenate([values, np.full(extra, fill, dtype=values.dtype)])
+        values.extend(array(values.typecode, [fill]) * extra)
+        return values
+
+    def _allocate(self, capacity: int):
+        if self._capacity == 0:
+            self._times = self._new('d', capacity * self._ring, EMPTY)
+            self._head = self._new('q', capacity, 0)
+            self._count = self._new('q', capacity, 0)
+            self._last = self._new('d', capacity, 0.0)      # Última transición (0 = ninguna)
+            self._mean = self._new('d', capacity, 0.0)      # Media de intervalos (Welford)
+            self._m2 = self._new('d', capacity, 0.0)
+            self._state = self._new('b', capacity, UNKNOWN)
+            self._since = self._new('d', capacity, 0.0)     # Inicio del estado actual
+            self._active = self._new('B', capacity, 0)      # Anomalías activas (bits)
+        else:
+            extra = capacity - self._capacity
+            self._times = self._grow(self._times, extra * self._ring, EMPTY)
+            self._head = self._grow(self._head, extra, 0)
+            self._count = self._grow(self._count, extra, 0)
+            self._last = self._grow(self._last, extra, 0.0)
+            self._mean = self._grow(self._mean, extra, 0.0)
+            self._m2 = self._grow(self._m2, extra, 0.0)
+            self._state = self._grow(self._state, extra, UNKNOWN)
+            self._since = self._grow(self._since, extra, 0.0)
+            self._active = self._grow(self._active, extra, 0)
+        self._capacity = capacity
+
+    def _slot(self, module_id: int, now: float) -> int:
+        slot = self._slots.get(module_id)
+        if slot is None:
+            if self._size == self._capacity:
+                self._allocate(self._capacity * 2)
+            slot = self._size
+            self._size += 1
+            self._slots[module_id] = slot
+            self._module_ids.append(module_id)
+            self._since[slot] = now
+        return slot
+
+    # ========== Registro ==========
+
+    def record(self, module_id: int, state: str, when: Optional[float] = None):
+        """
+        Anotar el estado leído de un sensor (las repeticiones no cuentan como transición).
+
+        Args:
+            when: Instante en la escala de time.monotonic() (por defecto, ahora)
+        """
+        now = time.monotonic() if when is None else when
+        code = STATE_CODES.get(state, UNKNOWN)
+        with self._lock:
+            new_sensor = module_id not in self._slots
+            slot = self._slot(module_id, now)
+            if not new_sensor and self._state[slot] == code:
+                return
+            self._state[slot] = code
+            self._since[slot] = now
+            if new_sensor:
+                return  # El primer estado no es una transición
+
+            # Intervalo desde la transición anterior (Welford)
+            count = int(self._count[slot])
+            if count:
+                interval = now - self._last[slot]
+                delta = interval - self._mean[slot]
+                self._mean[slot] += delta / count
+                self._m2[slot] += delta * (interval - self._mean[slot])
+            self._count[slot] = count + 1
+            self._last[slot] = now
+            head = int(self._head[slot])
+            self._times[slot * self._ring + head] = now
+            self._head[slot] = (head + 1) % self._ring
+
+    def forget(self, module_id: int):
+        """Dejar de vigilar un sensor (su índice queda sin uso)."""
+        with self._lock:
+            slot = self._slots.pop(module_id, None)
+            if slot is not None:
+                self._module_ids[slot] = -1
+                self._state[slot] = NORMAL
+                self._active[slot] = 0
+                for j in range(self._ring):
+                    self._times[slot * self._ring + j] = EMPTY
+                self._last[slot] = 0.0
+                self._since[slot] = float('inf')
+
+    def sensor_stats(self, module_id: int, now: Optional[float] = None) -> Optional[dict]:
+        """Transiciones en la ventana y estadísticas de intervalos de un sensor."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            slot = self._slots.get(module_id)
+            if slot is None:
+                return None
+            ring = [self._times[slot * self._ring + j] for j in range(self._ring)]
+            count = int(self._count[slot])
+            intervals = count - 1
+            return {
+                'transitions': count,
+                'window_transitions': sum(1 for t in ring if t > now - self.window),
+                'mean_interval': float(self._mean[slot]) if intervals > 0 else None,
+                'stdev_interval': (float(self._m2[slot]) / (intervals - 1)) ** 0.5 if intervals > 1 else None,
+                'state_seconds': now - float(self._since[slot]),
+                'anomalies': [kind for kind, bit in _BITS.items() if int(self._active[slot]) & bit],
+            }
+
+    # ========== Evaluación ==========
+
+    def _evaluate_numpy(self, now: float) -> List[Tuple[int, int, int]]:
+        n = self._size
+        times = self._times[:n * self._ring].reshape(n, self._ring)
+        start = now - self.window
+        state = self._state[:n]
+        in_state = now - self._since[:n]
+
+        flapping = (times > start).sum(axis=1) >= self.flap_threshold
+        stuck = (state == ALARM) & (in_state >= self.stuck_after)
+        if self.silent_after is not None:
+            stuck |= (state != UNKNOWN) & (in_state >= self.silent_after)
+        # Flancos consecutivos dentro de la ventana demasiado próximos
+        ordered = np.sort(times, axis=1)
+        with np.errstate(invalid='ignore'):  # Huecos vacíos: -inf - -inf
+            gaps = np.diff(ordered, axis=1)
+        close = (gaps < self.min_interval) & (ordered[:, :-1] > start)
+        tamper = ((state == UNKNOWN) & (in_state >= self.tamper_after)) | close.any(axis=1)
+
+        current = (flapping * _BITS[FLAPPING] + stuck * _BITS[STUCK]
+                   + tamper * _BITS[TAMPER]).astype(np.uint8)
+        previous = self._active[:n]
+        changed = np.nonzero(current != previous)[0]
+        result = [(int(slot), int(previous[slot]), int(current[slot])) for slot in changed]
+        self._active[:n] = current
+        return result
+
+    def _evaluate_python(self, now: float) -> List[Tuple[int, int, int]]:
+        start = now - self.window
+        ring = self._ring
+        result = []
+        for slot in range(self._size):
+            times = sorted(self._times[slot * ring:(slot + 1) * ring])
+            state = self._state[slot]
+            in_state = now - self._since[slot]
+            current = 0
+            if sum(1 for t in times if t > start) >= self.flap_threshold:
+                current |= _BITS[FLAPPING]
+            if (state == ALARM and in_state >= self.stuck_after) or (
+                    self.silent_after is not None and state != UNKNOWN and in_state >= self.silent_after):
+                current |= _BITS[STUCK]
+            if (state == UNKNOWN and in_state >= self.tamper_after) or any(
+                    a > start and b - a < self.min_interval for a, b in zip(times, times[1:])):
+                current |= _BITS[TAMPER]
+            previous = self._active[slot]
+            if current != previous:
+                self._active[slot] = current
+                result.append((slot, previous, current))
+        return result
+
+    def _detail(self, slot: int, kind: str, now: float) -> str:
+        in_state = now - float(self._since[slot])
+        if kind == FLAPPING:
+            recent = sum(1 for j in range(self._ring)
+                         if self._times[slot * self._ring + j] > now - self.window)
+            return f"{recent}+ transitions in {self.window:g} s"
+        if kind == STUCK:
+            if self._state[slot] == ALARM:
+                return f"in alarm for {_format_seconds(in_state)}"
+            return f"no transitions for {_format_seconds(in_state)}"
+        if self._state[slot] == UNKNOWN:
+            return f"no valid reading for {_format_seconds(in_state)}"
+        return f"edges less than {self.min_interval * 1000:.0f} ms apart"
+
+    def evaluate(self, now: Optional[float] = None) -> List[Anomaly]:
+        """
+        Evaluar todos los sensores y registrar las anomalías nuevas.
+
+        Returns:
+            Anomalías que acaban de aparecer: (module_id, tipo, detalle)
+        """
+        now = time.monotonic() if now is None else now
+        raised, cleared = [], []
+        with self._lock:
+            if not self._size:
+                return []
+            changes = self._evaluate_numpy(now) if NUMPY_AVAILABLE else self._evaluate_python(now)
+            for slot, previous, current in changes:
+                module_id = self._module_ids[slot]
+                if module_id < 0:
+                    continue
+                for kind, bit in _BITS.items():
+                    if current & bit and not previous & bit:
+                        raised.append((module_id, kind, self._detail(slot, kind, now)))
+                    elif previous & bit and not current & bit:
+                        cleared.append((module_id, kind))
+
+        for module_id, kind in cleared:
+            logger.info(f"Module {module_id}: {kind} condition cleared")
+        for module_id, kind, detail in raised:
+            self._raise(module_id, kind, detail)
+        return raised
+
+    def _raise(self, module_id: int, kind: str, detail: str):
+        logger.warning(f"Module {module_id}: {kind} ({detail})")
+        if self.on_anomaly:
+            try:
+                self.on_anomaly(module_id, kind, detail)
+            except Exception as e:
+                logger.error(f"Anomaly callback failed: {e}")
+        if self.core is None:
+            return
+
+        def run():
+            try:
+                alarm_id = self.core.trigger_alarm(module_id, kind, f"Maintenance: {detail}")
+            except Exception as e:
+                logger.error(f"Failed to raise {kind} alarm for module {module_id}: {e}")
+                alarm_id = None
+            if alarm_id is None:
+                self._rearm(module_id, kind)
+
+        try:
+            self.scheduler(run)
+        except Exception as e:
+            logger.error(f"Failed to schedule {kind} alarm for module {module_id}: {e}")
+            self._rearm(module_id, kind)
+
+    def _rearm(self, module_id: int, kind: str):
+        """Olvidar una anomalía cuya alarma no se registró: se volverá a generar."""
+        with self._lock:
+            slot = self._slots.get(module_id)
+            if slot is not None:
+                self._active[slot] = int(self._active[slot]) & ~_BITS[kind] & 0xFF
+
+    # ========== Hilo propio (cuando nadie llama a evaluate) ==========
+
+    def start(self, interval: float = 1.0):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="anomaly", daemon=True)
+        self._thread.start()
+
+    def _loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.evaluate()
+            except Exception as e:
+                logger.error(f"Anomaly evaluation failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
@@ -0,0 +1,668 @@
+"""
+api_server.py
+API local HTTP/WebSocket (asyncio, solo biblioteca estándar).
+
+HTTP (JSON):
+    POST /api/login                 {"username", "password"} -> {"token", "username", "role"}
+    GET  /api/status                modo de armado, secuencia del feed, versión de sensores
+    GET  /api/modules               módulos con el estado actual de su sensor
+    GET  /api/alarms/active         ?module_id=&alarm_type=
+    GET  /api/alarms/history        ?limit=&before=&module_id=&alarm_type=  (paginado por ID)
+    POST /api/arm                   {"mode": "away" | "night"}   (sin modo: según night_mode)
+    POST /api/disarm
+    POST /api/alarms/ack            {"alarm_ids": [...]} o {"module_id", "alarm_type", "before"}
+
+Las rutas POST de armar, desarmar y reconocer rechazan (403) las sesiones
+con rol de solo lectura (READ_ONLY_ROLES).
+
+WebSocket (GET /ws?token=&since=):
+    El servidor empuja mensajes JSON de texto:
+    {"type": "hello", "seq", "sensor_version"}
+    {"type": "change", "seq", "kind", "module_id", "timestamp", "payload"}   (changefeed.py)
+    {"type": "sensors", "version", "full", "sensors": [...]}                 (sensor_snapshots.py)
+    {"type": "resync"}   se perdieron eventos: volver a leer el estado por HTTP
+
+Un único hilo lee el feed de cambios y una única tarea sondea los sensores;
+cada mensaje se codifica una vez y se encola en todos los clientes. Un
+cliente inactivo solo cuesta sus dos corrutinas y su cola; si no consume a
+tiempo se vacía su cola y recibe "resync" (nunca frena a los demás).
+
+El núcleo usa SQLite desde su propio hilo: las escrituras (login,
+reconocer, armar) se pasan con `scheduler`, p. ej. ``lambda fn:
+tk_root.after(0, fn)``; las lecturas usan una conexión propia.
+
+    python api_server.py --db alarm_core.db --port 8080
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import sqlite3
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional, Set
+from urllib.parse import parse_qs, urlsplit
+
+from changefeed import OVERFLOW
+from records import Alarm, Module, row_factory
+
+logger = logging.getLogger("API")
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_HEADER = 16 * 1024
+MAX_BODY = 64 * 1024
+MAX_WS_MESSAGE = 64 * 1024
+
+PUBLIC_ROUTES = {('POST', '/api/login')}
+READ_ONLY_ROLES = {'viewer'}
+
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+               403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+               500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    return json.dumps(data, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+# ========== WebSocket (RFC 6455) ==========
+
+def ws_accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def ws_frame(payload: bytes, opcode: int = OP_TEXT) -> bytes:
+    """Trama del servidor: sin máscara y sin fragmentar."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_ws_frame(reader: asyncio.StreamReader):
+    """Leer una trama del cliente (con máscara): (fin, opcode, payload)."""
+    first, second = await reader.readexactly(2)
+    fin, opcode = bool(first & 0x80), first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_WS_MESSAGE:
+        raise HTTPError(413, "WebSocket message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+class _Client:
+    """Conexión WebSocket: cola acotada de tramas ya codificadas."""
+
+    __slots__ = ('writer', 'queue', 'last_seq', 'user')
+
+    def __init__(self, writer: asyncio.StreamWriter, max_pending: int, user: Optional[dict]):
+        self.writer = writer
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.last_seq = 0
+        self.user = user
+
+    def offer(self, frame: bytes) -> bool:
+        """Encolar sin bloquear; si la cola está llena se vacía y se pide resync."""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+            return False
+
+
+RESYNC_FRAME = ws_frame(dumps({'type': 'resync'}))
+
+
+class ApiServer:
+    """Servidor HTTP/WebSocket sobre un AlarmCore (y opcionalmente RuleEngine e IOManager)."""
+
+    def __init__(self, core, rule_engine=None, io_manager=None, host: str = '127.0.0.1',
+                 port: int = 8080, scheduler: Optional[Callable[[Callable[[], None]], None]] = None,
+                 require_auth: bool = True, allow_origin: Optional[str] = None,
+                 max_clients: int = 1000, client_queue: int = 256, sensor_poll: float = 0.2,
+                 ping_interval: float = 30.0, call_timeout: float = 10.0):
+        """
+        Args:
+            core: AlarmCore
+            rule_engine: RuleEngine para armar/desarmar (sin él esos endpoints dan 503)
+            io_manager: IOManager o AcquisitionProcess para estados de sensores y sus deltas;
+                sin él los módulos van con sensor None y no hay mensajes "sensors"
+            scheduler: Ejecuta las llamadas de escritura en el hilo del núcleo; sin él
+                se llaman desde el bucle (solo con serve_forever en ese hilo)
+            require_auth: Exigir un token de sesión (cabecera Bearer o ?token=)
+            allow_origin: Valor de Access-Control-Allow-Origin para paneles web
+            client_queue: Mensajes pendientes por cliente antes de pedirle resync
+            sensor_poll: Segundos entre sondeos de deltas de sensores
+        """
+        self.core = core
+        self.rule_engine = rule_engine
+        self.io_manager = io_manager
+        self.host = host
+        self.port = port
+        self.scheduler = scheduler
+        self.require_auth = require_auth
+        self.allow_origin = allow_origin
+        self.max_clients = max_clients
+        self.client_queue = client_queue
+        self.sensor_poll = sensor_poll
+        self.ping_interval = ping_interval
+        self.call_timeout = call_timeout
+
+        self.clients: Set[_Client] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._subscription = None
+        self._pump = None
+        self._sensor_version = 0
+        # Lecturas en un único hilo con su propia conexión
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-db")
+        self._connection = None
+
+        self.routes = {
+            ('POST', '/api/login'): self._login,
+            ('GET', '/api/status'): self._status,
+            ('GET', '/api/modules'): self._modules,
+            ('GET', '/api/alarms/active'): self._active_alarms,
+            ('GET', '/api/alarms/history'): self._history,
+            ('POST', '/api/arm'): self._arm,
+            ('POST', '/api/disarm'): self._disarm,
+            ('POST', '/api/alarms/ack'): self._acknowledge,
+        }
+
+    # ========== Ciclo de vida ==========
+
+    def start(self):
+        """Servir en un hilo propio."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._ready.clear()
+        self._thread = threading.Thread(target=self.serve_forever, name="api-server", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+
+    def serve_forever(self):
+        """Servir en el hilo actual hasta `stop()`."""
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=MAX_HEADER)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._subscription = self.core.changes.subscribe(max_pending=10000)
+        self._sensor_version = self.io_manager.sensor_snapshot().version if self.io_manager else 0
+        self._pump = threading.Thread(target=self._change_pump, name="api-changes", daemon=True)
+        self._pump.start()
+        sensors = asyncio.ensure_future(self._sensor_pump()) if self.io_manager else None
+        logger.info(f"API listening on http://{self.host}:{self.port}")
+        self._ready.set()
+        try:
+            while not self._stopped.is_set():
+                await asyncio.sleep(0.2)
+        finally:
+            if sensors:
+                sensors.cancel()
+            self._server.close()
+            await self._server.wait_closed()
+            for client in list(self.clients):
+                client.writer.close()
+            self._subscription.close()
+            self._db.submit(self._close_connection).result()
+            logger.info("API stopped")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._pump:
+            self._pump.join(timeout=2)
+            self._pump = None
+
+    # ========== Acceso al núcleo ==========
+
+    def _read_connection(self):
+        if self._connection is None:
+            self._connection = self.core.open_connection()
+        return self._connection
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def _read(self, query: Callable):
+        """Ejecutar `query(connection)` en el hilo de lectura."""
+        return await self._loop.run_in_executor(self._db, lambda: query(self._read_connection()))
+
+    async def _call_core(self, fn: Callable):
+        """Ejecutar `fn()` en el hilo del núcleo (vía scheduler) y esperar su resultado."""
+        if self.scheduler is None:
+            return fn()
+        loop = self._loop
+        future = loop.create_future()
+
+        def deliver(result, error):
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+        def run():
+            try:
+                result = fn()
+            except Exception as e:
+                loop.call_soon_threadsafe(deliver, None, e)
+            else:
+                loop.call_soon_threadsafe(deliver, result, None)
+
+        self.scheduler(run)
+        try:
+            return await asyncio.wait_for(future, self.call_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPError(504, "core did not respond") from None
+
+    # ========== HTTP ==========
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {'error': e.message}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                method, path, query, headers, body = request
+                if headers.get('upgrade', '').lower() == 'websocket' and path == '/ws':
+                    await self._websocket(reader, writer, query, headers)
+                    return
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self._dispatch(method, path, query, headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"API connection error: {e}")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "headers too large") from None
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line") from None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY:
+            raise HTTPError(413, "body too large")
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers, body
+
+    async def _dispatch(self, method, path, query, headers, body):
+        if method == 'OPTIONS':
+            return 204, None
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                return 405, {'error': 'method not allowed'}
+            return 404, {'error': 'not found'}
+        try:
+            user = None if (method, path) in PUBLIC_ROUTES else self._authenticate(headers, query)
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            return 200, await handler(query=query, data=data, user=user)
+        except HTTPError as e:
+            return e.status, {'error': e.message}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except sqlite3.Error as e:
+            logger.error(f"API query failed: {e}")
+            return 500, {'error': 'database error'}
+
+    def _authenticate(self, headers, query) -> Optional[dict]:
+        token = None
+        authorization = headers.get('authorization', '')
+        if authorization.lower().startswith('bearer '):
+            token = authorization[7:].strip()
+        token = token or query.get('token')
+        user = self.core.validate_session(token) if token else None
+        if self.require_auth and user is None:
+            raise HTTPError(401, "valid session token required")
+        return user
+
+    async def _respond(self, writer, status: int, payload, keep_alive: bool = True):
+        body = b'' if payload is None else dumps(payload)
+        headers = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                   f"Content-Length: {len(body)}",
+                   f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if body:
+            headers.append("Content-Type: application/json")
+        if self.allow_origin:
+            headers.append(f"Access-Control-Allow-Origin: {self.allow_origin}")
+            headers.append("Access-Control-Allow-Headers: Authorization, Content-Type")
+            headers.append("Access-Control-Allow-Methods: GET, POST, OPTIONS")
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    # ========== Endpoints ==========
+
+    async def _login(self, query, data, user):
+        username, password = data.get('username'), data.get('password')
+        if not isinstance(username, str) or not isinstance(password, str):
+            raise HTTPError(400, "username and password are required")
+        session = await self._call_core(lambda: self.core.authenticate_user(username, password))
+        if not session:
+            raise HTTPError(401, "invalid credentials")
+        return {'token': session['token'], 'username': session['username'], 'role': session['role']}
+
+    async def _status(self, query, data, user):
+        return {
+            'mode': self.rule_engine.mode if self.rule_engine else None,
+            'armed': self.rule_engine.armed if self.rule_engine else None,
+            'pending_zones': self.rule_engine.pending_zones() if self.rule_engine else [],
+            'seq': self.core.changes.last_seq,
+            'sensor_version': self._sensor_version,
+            'clients': len(self.clients),
+        }
+
+    async def _modules(self, query, data, user):
+        def fetch(connection):
+            cursor = connection.cursor()
+            cursor.row_factory = row_factory(Module)
+            cursor.execute("SELECT id, name, status, last_updated FROM modules ORDER BY id")
+            return cursor.fetchall()
+
+        modules = await self._read(fetch)
+        snapshot = self.io_manager.sensor_snapshot() if self.io_manager else None
+        result = []
+        for module in modules:
+            entry = module.as_dict()
+            sensor = snapshot.get(module.id) if snapshot else None
+            entry['sensor'] = sensor._asdict() if sensor else None
+            result.append(entry)
+        return {'modules': result}
+
+    @staticmethod
+    def _int(query, name) -> Optional[int]:
+        value = query.get(name)
+        return int(value) if value not in (None, '') else None
+
+    async def _alarms(self, where: str, params: list, limit: Optional[int] = None):
+        def fetch(connection):
+            cursor = connection.cursor()
+            cursor.row_factory = row_factory(Alarm)
+            cursor.execute(f'''
+                SELECT a.id, a.module_id, a.alarm_type, a.description, a.timestamp,
+                       a.acknowledged, a.acknowledged_by, a.acknowledged_at,
+                       m.name AS module_name
+                FROM alarms a
+                LEFT JOIN modules m ON a.module_id = m.id
+                WHERE {where}
+                ORDER BY a.id DESC
+                {'LIMIT ?' if limit else ''}
+            ''', params + ([limit] if limit else []))
+            return cursor.fetchall()
+
+        return [alarm.as_dict() for alarm in await self._read(fetch)]
+
+    async def _active_alarms(self, query, data, user):
+        where, params = self.core._alarm_filter(module_id=self._int(query, 'module_id'),
+                                                alarm_type=query.get('alarm_type'))
+        return {'alarms': await self._alarms(where, params)}
+
+    async def _history(self, query, data, user):
+        """Todas las alarmas, de la más reciente a la más antigua, por páginas de ID."""
+        limit = min(max(self._int(query, 'limit') or 50, 1), 500)
+        clauses, params = ['1'], []
+        before = self._int(query, 'before')
+        if before is not None:
+            clauses.append('a.id < ?')
+            params.append(before)
+        module_id = self._int(query, 'module_id')
+        if module_id is not None:
+            clauses.append('a.module_id = ?')
+            params.append(module_id)
+        if query.get('alarm_type'):
+            clauses.append('a.alarm_type = ?')
+            params.append(query['alarm_type'])
+        items = await self._alarms(' AND '.join(clauses), params, limit)
+        return {'alarms': items, 'next_before': items[-1]['id'] if len(items) == limit else None}
+
+    def _require_rules(self):
+        if self.rule_engine is None:
+            raise HTTPError(503, "no rule engine attached")
+
+    @staticmethod
+    def _require_write(user):
+        # Sin autenticación (require_auth=False) no hay rol que comprobar
+        if user is not None and user.get('role') in READ_ONLY_ROLES:
+            raise HTTPError(403, f"role '{user['role']}' cannot change the system")
+
+    async def _arm(self, query, data, user):
+        self._require_write(user)
+        self._require_rules()
+        mode = data.get('mode')
+        if mode == 'disarmed':
+            raise HTTPError(400, "use /api/disarm")
+        await self._call_core(lambda: self.rule_engine.arm(mode))
+        logger.info(f"Armed ({self.rule_engine.mode}) via API by {user['username'] if user else 'anonymous'}")
+        return {'mode': self.rule_engine.mode}
+
+    async def _disarm(self, query, data, user):
+        self._require_write(user)
+        self._require_rules()
+        await self._call_core(self.rule_engine.disarm)
+        logger.info(f"Disarmed via API by {user['username'] if user else 'anonymous'}")
+        return {'mode': self.rule_engine.mode}
+
+    async def _acknowledge(self, query, data, user):
+        self._require_write(user)
+        alarm_ids = data.get('alarm_ids')
+        if alarm_ids is not None and not (isinstance(alarm_ids, list)
+                                          and all(isinstance(i, int) for i in alarm_ids)):
+            raise HTTPError(400, "alarm_ids must be a list of integers")
+        filters = {'module_id': data.get('module_id'), 'alarm_type': data.get('alarm_type'),
+                   'before': data.get('before')}
+        if alarm_ids is None and all(value is None for value in filters.values()):
+            raise HTTPError(400, "alarm_ids or a filter is required")
+        acknowledged_by = user['username'] if user else data.get('acknowledged_by')
+        count = await self._call_core(lambda: self.core.acknowledge_alarms(
+            alarm_ids=alarm_ids, acknowledged_by=acknowledged_by, **filters))
+        return {'acknowledged': count}
+
+    # ========== WebSocket ==========
+
+    async def _websocket(self, reader, writer, query, headers):
+        try:
+            user = self._authenticate(headers, query)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {'error': e.message}, keep_alive=False)
+            return
+        key = headers.get('sec-websocket-key')
+        if not key or len(self.clients) >= self.max_clients:
+            status = 400 if not key else 503
+            await self._respond(writer, status, {'error': 'cannot open WebSocket'}, keep_alive=False)
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept_key(key)}\r\n\r\n").encode('latin-1'))
+
+        client = _Client(writer, self.client_queue, user)
+        feed = self.core.changes
+        client.last_seq = feed.last_seq
+        client.offer(ws_frame(dumps({'type': 'hello', 'seq': client.last_seq,
+                                     'sensor_version': self._sensor_version})))
+        since = self._int(query, 'since')
+        if since is not None and since < client.last_seq:
+            # Reanudar desde el historial del feed, si aún cubre lo pedido
+            missed = feed.history(since)
+            if not missed or missed[0].seq > since + 1:
+                client.offer(RESYNC_FRAME)
+            for event in missed:
+                client.offer(self._change_frame(event))
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._ws_sender(client))
+        try:
+            await self._ws_receiver(reader, client)
+        except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    async def _ws_sender(self, client: _Client):
+        writer = client.writer
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(client.queue.get(), self.ping_interval)
+                except asyncio.TimeoutError:
+                    frame = ws_frame(b'', OP_PING)
+                writer.write(frame)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _ws_receiver(self, reader, client: _Client):
+        """Atender ping/close; los mensajes de texto del cliente se ignoran."""
+        while True:
+            fin, opcode, payload = await read_ws_frame(reader)
+            if opcode == OP_CLOSE:
+                # Directo, no por la cola: al volver se cancela el emisor
+                client.writer.write(ws_frame(payload[:2], OP_CLOSE))
+                await client.writer.drain()
+                return
+            if opcode == OP_PING:
+                client.offer(ws_frame(payload, OP_PONG))
+
+    @staticmethod
+    def _change_frame(event) -> bytes:
+        return ws_frame(dumps({'type': 'change', 'seq': event.seq, 'kind': event.kind,
+                               'module_id': event.module_id, 'timestamp': event.timestamp,
+                               'payload': event.payload}))
+
+    def _broadcast_changes(self, events):
+        if any(event.kind == OVERFLOW for event in events):
+            for client in self.clients:
+                client.offer(RESYNC_FRAME)
+            events = [event for event in events if event.kind != OVERFLOW]
+        for event in events:
+            frame = self._change_frame(event)  # Una codificación para todos los clientes
+            for client in self.clients:
+                if event.seq > client.last_seq:
+                    client.last_seq = event.seq
+                    client.offer(frame)
+
+    def _change_pump(self):
+        """Hilo: leer el feed de cambios del núcleo y pasarlo al bucle asyncio."""
+        subscription = self._subscription
+        while not self._stopped.is_set() and not subscription.closed:
+            event = subscription.get(timeout=0.5)
+            if event is None:
+                continue
+            events = [event] + subscription.drain(limit=500)
+            try:
+                self._loop.call_soon_threadsafe(self._broadcast_changes, events)
+            except RuntimeError:
+                break  # Bucle cerrado
+
+    async def _sensor_pump(self):
+        """Un único sondeo de deltas de sensores para todos los clientes."""
+        while True:
+            await asyncio.sleep(self.sensor_poll)
+            try:
+                version, states, full = self.io_manager.changes_since(self._sensor_version)
+            except Exception as e:
+                logger.error(f"Sensor delta poll failed: {e}")
+                continue
+            if version == self._sensor_version:
+                continue
+            self._sensor_version = version
+            if self.clients:
+                frame = ws_frame(dumps({'type': 'sensors', 'version': version, 'full': full,
+                                        'sensors': [state._asdict() for state in states]}))
+                for client in self.clients:
+                    client.offer(frame)
+
+
+if __name__ == "__main__":
+    import argparse
+    from core import AlarmCore
+    from rules import RuleEngine
+
+    parser = argparse.ArgumentParser(description="Serve the local alarm API")
+    parser.add_argument("--db", default="alarm_core.db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-auth", action="store_true", help="Do not require a session token")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Sin scheduler: el núcleo y el bucle asyncio comparten este hilo
+    alarm_core = AlarmCore(args.db)
+    server = ApiServer(alarm_core, rule_engine=RuleEngine(alarm_core), host=args.host,
+                       port=args.port, require_auth=not args.no_auth)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        alarm_core.close()
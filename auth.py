@@ -0,0 +1,188 @@
+"""
+auth.py
+Autenticación de usuarios: hash de contraseñas con scrypt (coste de
+memoria ajustable), caché de sesiones en memoria con caducidad y
+limitación de intentos fallidos con contadores O(1) por usuario.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger("AUTH")
+
+HASH_PREFIX = "scrypt"
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class PasswordHasher:
+    """
+    Hash de contraseñas con scrypt.
+
+    Formato almacenado: ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` (base64). Los
+    parámetros viajan con el hash, así que se pueden subir los costes sin
+    invalidar las contraseñas existentes (se rehacen al iniciar sesión).
+    """
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1,
+                 salt_bytes: int = 16, key_bytes: int = 32):
+        """
+        Args:
+            n: Factor de coste CPU/memoria (potencia de 2); memoria ≈ 128 * n * r bytes
+            r: Tamaño de bloque
+            p: Paralelismo
+        """
+        if n < 2 or n & (n - 1):
+            raise ValueError("n must be a power of 2 greater than 1")
+        self.n = n
+        self.r = r
+        self.p = p
+        self.salt_bytes = salt_bytes
+        self.key_bytes = key_bytes
+
+    def _derive(self, password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p + 1024 * 1024, dklen=dklen)
+
+    def hash(self, password: str) -> str:
+        salt = secrets.token_bytes(self.salt_bytes)
+        key = self._derive(password, salt, self.n, self.r, self.p, self.key_bytes)
+        return f"{HASH_PREFIX}${self.n}${self.r}${self.p}${_b64(salt)}${_b64(key)}"
+
+    @staticmethod
+    def is_hashed(stored: str) -> bool:
+        return isinstance(stored, str) and stored.startswith(HASH_PREFIX + "$")
+
+    def verify(self, password: str, stored: str) -> bool:
+        """Comprobar una contraseña en tiempo constante (acepta texto plano heredado)."""
+        if not self.is_hashed(stored):
+            return hmac.compare_digest(password.encode('utf-8'), str(stored).encode('utf-8'))
+        try:
+            _, n, r, p, salt, key = stored.split('$')
+            expected = _unb64(key)
+            actual = self._derive(password, _unb64(salt), int(n), int(r), int(p), len(expected))
+        except (ValueError, TypeError) as e:
+            logger.error(f"Malformed password hash: {e}")
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, stored: str) -> bool:
+        if not self.is_hashed(stored):
+            return True
+        try:
+            _, n, r, p, _, _ = stored.split('$')
+        except ValueError:
+            return True
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+class SessionCache:
+    """Sesiones en memoria: token -> usuario, con caducidad deslizante."""
+
+    def __init__(self, ttl: float = 900.0, max_sessions: int = 256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()  # token -> [user, expira]
+
+    def create(self, user: dict) -> str:
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            self._sessions[token] = [dict(user), time.monotonic() + self.ttl]
+            # Descartar las sesiones más antiguas si se supera el máximo
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return token
+
+    def validate(self, token: Optional[str]) -> Optional[dict]:
+        """Usuario de una sesión válida (renueva su caducidad), o None."""
+        if not token:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session[1] < now:
+                del self._sessions[token]
+                return None
+            session[1] = now + self.ttl
+            self._sessions.move_to_end(token)
+            return dict(session[0])
+
+    def invalidate(self, token: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(token, None) is not None
+
+    def invalidate_user(self, username: str) -> int:
+        with self._lock:
+            tokens = [t for t, s in self._sessions.items() if s[0].get('username') == username]
+            for token in tokens:
+                del self._sessions[token]
+        return len(tokens)
+
+
+class LoginThrottle:
+    """
+    Bloqueo temporal tras varios intentos fallidos.
+
+    Por usuario se guarda solo [fallos, bloqueado_hasta]; el bloqueo se
+    duplica con cada fallo adicional hasta `max_lockout` segundos. Al
+    superar `max_tracked` se descarta el contador más antiguo que no esté
+    bloqueado: inundar con nombres inventados no desbloquea a nadie.
+    """
+
+    def __init__(self, max_failures: int = 5, base_lockout: float = 30.0,
+                 max_lockout: float = 900.0, max_tracked: int = 1024):
+        self.max_failures = max_failures
+        self.base_lockout = base_lockout
+        self.max_lockout = max_lockout
+        self.max_tracked = max_tracked
+        self._lock = threading.Lock()
+        self._counters: "OrderedDict[str, list]" = OrderedDict()
+
+    def retry_after(self, username: str) -> float:
+        """Segundos que faltan para poder volver a intentarlo (0 si no está bloqueado)."""
+        with self._lock:
+            counter = self._counters.get(username)
+            if counter is None:
+                return 0.0
+            return max(0.0, counter[1] - time.monotonic())
+
+    def record_failure(self, username: str):
+        with self._lock:
+            counter = self._counters.get(username)
+            if counter is None:
+                counter = self._counters[username] = [0, 0.0]
+                if len(self._counters) > self.max_tracked:
+                    self._evict(time.monotonic(), keep=username)
+            counter[0] += 1
+            excess = counter[0] - self.max_failures
+            if excess >= 0:
+                lockout = min(self.base_lockout * (2 ** excess), self.max_lockout)
+                counter[1] = time.monotonic() + lockout
+                logger.warning(f"User '{username}' locked out for {lockout:.0f}s "
+                               f"after {counter[0]} failed attempts.")
+
+    def _evict(self, now: float, keep: str):
+        for name, (_, locked_until) in self._counters.items():
+            if name != keep and locked_until <= now:
+                del self._counters[name]
+                return
+
+    def record_success(self, username: str):
+        with self._lock:
+            self._counters.pop(username, None)
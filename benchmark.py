@@ -0,0 +1,205 @@
+"""
+benchmark.py
+Banco de pruebas de AlarmCore por perfil de durabilidad.
+
+Ejecuta la misma carga (cambios de estado de módulos, alarmas y
+reconocimientos) con cada perfil de durability.py sobre una BD temporal y
+muestra la contrapartida: latencia por operación, operaciones por segundo,
+bytes escritos en el almacenamiento y la ventana de pérdida ante un corte
+de luz.
+
+Con --gpio somete a carga el camino de hardware real de IOManager
+(RPiGPIOBackend, add_event_detect, _gpio_event_callback) sobre fake_gpio.
+
+    python benchmark.py --modules 20 --operations 2000
+    python benchmark.py --profile balanced --profile sd-card-saver --dir /media/sd
+    python benchmark.py --gpio --sensors 16 --rate 5000 --seconds 5
+"""
+
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import durability
+from core import AlarmCore
+from fake_gpio import FakeGPIO
+from io_backends import RPiGPIOBackend
+from io_manager import IOManager
+from journal import EventJournal
+
+
+def storage_write_bytes() -> Optional[int]:
+    """Bytes enviados al almacenamiento por este proceso (Linux); None si no se sabe."""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def loss_window(profile: durability.DurabilityProfile) -> str:
+    if profile.in_memory:
+        return f"<= {profile.checkpoint_interval:g} s / {profile.checkpoint_changes} changes"
+    if profile.synchronous.upper() in ('FULL', 'EXTRA') and profile.journal_sync:
+        return "none"
+    return "last commits"
+
+
+def run_profile(name: str, directory: str, modules: int, operations: int) -> Dict:
+    """Ejecutar la carga con un perfil en un subdirectorio nuevo de `directory`."""
+    profile = durability.get_profile(name)
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-", dir=directory)
+    db_path = os.path.join(workdir, 'alarm_core.db')
+    journal = EventJournal(os.path.join(workdir, 'alarm_events.journal'),
+                           sync_writes=profile.journal_sync, batch_size=profile.journal_batch)
+    core = AlarmCore(db_path, journal=journal, durability=profile)
+    try:
+        module_ids = [core.register_module(f"bench-{i}", 'normal') for i in range(modules)]
+        latencies = {'status': [], 'alarm': [], 'ack': []}
+        written_before = storage_write_bytes()
+        start = time.perf_counter()
+        for i in range(operations):
+            module_id = module_ids[i % modules]
+            t = time.perf_counter()
+            core.update_module_status(module_id, 'alarm' if (i // modules) % 2 == 0 else 'normal')
+            latencies['status'].append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            core.trigger_alarm(module_id, 'bench', f"operation {i}")
+            latencies['alarm'].append(time.perf_counter() - t)
+
+            if i % modules == modules - 1:
+                t = time.perf_counter()
+                core.acknowledge_alarms(alarm_type='bench', acknowledged_by='bench')
+                latencies['ack'].append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        status = core.get_durability_status()
+    finally:
+        close_start = time.perf_counter()
+        core.close()  # Incluye el volcado del diario y el último checkpoint
+        close_time = time.perf_counter() - close_start
+        if core.checkpoint:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(core.checkpoint.work_path + suffix):
+                    os.remove(core.checkpoint.work_path + suffix)
+    written_after = storage_write_bytes()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    total_ops = sum(len(samples) for samples in latencies.values())
+    return {
+        'profile': name,
+        'ops_per_second': total_ops / elapsed if elapsed else 0.0,
+        'latency_ms': {kind: (statistics.median(samples) * 1000, _percentile(samples, 0.99) * 1000)
+                       for kind, samples in latencies.items() if samples},
+        'close_ms': close_time * 1000,
+        'written_bytes': (written_after - written_before
+                          if written_before is not None and written_after is not None else None),
+        'settings': status['settings'],
+        'loss_window': loss_window(profile),
+    }
+
+
+def print_results(results: List[Dict]):
+    header = (f"{'profile':<14} {'ops/s':>8} {'status p50/p99':>16} {'alarm p50/p99':>16} "
+              f"{'ack p50/p99':>16} {'close':>8} {'written':>10}  loss window")
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        cells = []
+        for kind in ('status', 'alarm', 'ack'):
+            p50, p99 = result['latency_ms'].get(kind, (0.0, 0.0))
+            cells.append(f"{p50:6.2f}/{p99:6.2f}ms")
+        written = result['written_bytes']
+        written_text = f"{written / 1024:.0f} KiB" if written is not None else "n/a"
+        print(f"{result['profile']:<14} {result['ops_per_second']:>8.0f} "
+              f"{cells[0]:>16} {cells[1]:>16} {cells[2]:>16} {result['close_ms']:>6.0f}ms "
+              f"{written_text:>10}  {result['loss_window']}")
+
+
+def run_gpio_load(sensors: int, rate: float, seconds: float, bouncetime: int = 0) -> Dict:
+    """Generar flancos a `rate`/s repartidos entre `sensors` pines y medir su entrega."""
+    gpio = FakeGPIO(max_channel=max(40, sensors))
+    io = IOManager(config={'io': {'bounce_time': bouncetime}}, backend=RPiGPIOBackend(gpio))
+    triggers = [0]
+
+    def on_trigger(module_id, state):
+        triggers[0] += 1
+
+    io.on_sensor_trigger = on_trigger
+    pins = list(range(sensors))
+    for pin in pins:
+        io.register_sensor(module_id=pin + 1, gpio_pin=pin)
+    io.start_monitoring()  # El sondeo compite con los callbacks, como en producción
+
+    gpio.reset_stats()
+    gpio.record_latency = True
+    start = time.perf_counter()
+    gpio.generate_edges(pins, rate, duration=seconds)
+    generated = time.perf_counter() - start
+    idle = gpio.wait_idle(timeout=30)
+    drained = time.perf_counter() - start
+    latencies = gpio.callback_latencies
+    stats = dict(gpio.stats)
+    io.cleanup()
+
+    return {
+        'sensors': sensors,
+        'target_rate': rate,
+        'edge_rate': stats['edges'] / generated if generated else 0.0,
+        'callback_rate': stats['callbacks'] / drained if drained else 0.0,
+        'stats': stats,
+        'triggers': triggers[0],
+        'backlog_cleared': idle,
+        'latency_ms': ((statistics.median(latencies) * 1000, _percentile(latencies, 0.99) * 1000)
+                       if latencies else (0.0, 0.0)),
+    }
+
+
+def print_gpio_result(result: Dict):
+    stats = result['stats']
+    p50, p99 = result['latency_ms']
+    print(f"sensors={result['sensors']} target={result['target_rate']:.0f}/s "
+          f"edges={stats['edges']} ({result['edge_rate']:.0f}/s) accepted={stats['accepted']} "
+          f"bounced={stats['bounced']}")
+    print(f"callbacks={stats['callbacks']} ({result['callback_rate']:.0f}/s) errors={stats['callback_errors']} "
+          f"triggers={result['triggers']} latency p50/p99={p50:.2f}/{p99:.2f}ms"
+          f"{'' if result['backlog_cleared'] else ' (callback backlog not drained)'}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Benchmark AlarmCore durability profiles")
+    parser.add_argument("--profile", action="append", choices=list(durability.PROFILES),
+                        help="Profile to run (repeatable; default: all)")
+    parser.add_argument("--modules", type=int, default=20)
+    parser.add_argument("--operations", type=int, default=1000)
+    parser.add_argument("--dir", default=None,
+                        help="Directory for the on-disk database (default: system temp dir)")
+    parser.add_argument("--gpio", action="store_true",
+                        help="Load-test the GPIO edge path with fake_gpio instead")
+    parser.add_argument("--sensors", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2000, help="Edges per second (all sensors)")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--bouncetime", type=int, default=0, help="Debounce in ms")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    if args.gpio:
+        print_gpio_result(run_gpio_load(args.sensors, args.rate, args.seconds, args.bouncetime))
+        raise SystemExit(0)
+    directory = args.dir or tempfile.gettempdir()
+    print_results([run_profile(name, directory, args.modules, args.operations)
+                   for name in (args.profile or list(durability.PROFILES))])
@@ -0,0 +1,194 @@
+"""
+changefeed.py
+Feed de cambios de AlarmCore (publicación/suscripción).
+
+AlarmCore publica eventos tipados (alarma creada/reconocida, módulo
+registrado/actualizado/eliminado) con un número de secuencia global. Cada
+suscriptor tiene sus propios filtros y un búfer acotado: si no consume a
+tiempo se descartan eventos y recibe una señal de desbordamiento con el
+hueco perdido, sin frenar nunca al publicador. Con `resume_from` un
+suscriptor continúa desde la última secuencia que vio, mientras siga en el
+historial del feed.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger("CHANGEFEED")
+
+# Tipos de evento
+ALARM_CREATED = 'alarm_created'
+ALARM_ACKNOWLEDGED = 'alarm_acknowledged'
+MODULE_REGISTERED = 'module_registered'
+MODULE_UPDATED = 'module_updated'
+MODULE_REMOVED = 'module_removed'
+OVERFLOW = 'overflow'  # Señal: se perdieron eventos entre payload['from_seq'] y payload['to_seq']
+
+EVENT_KINDS = (ALARM_CREATED, ALARM_ACKNOWLEDGED, MODULE_REGISTERED, MODULE_UPDATED, MODULE_REMOVED)
+
+
+class ChangeEvent(NamedTuple):
+    seq: int
+    kind: str
+    timestamp: float
+    module_id: Optional[int]
+    payload: dict
+
+
+class Subscription:
+    """Cola acotada de eventos de un suscriptor; se lee con `get` o `drain`."""
+
+    def __init__(self, feed: "ChangeFeed", kinds: Optional[Iterable[str]] = None,
+                 module_ids: Optional[Iterable[int]] = None,
+                 predicate: Optional[Callable[[ChangeEvent], bool]] = None,
+                 max_pending: int = 1000):
+        self.feed = feed
+        self.kinds = frozenset(kinds) if kinds else None
+        self.module_ids = frozenset(module_ids) if module_ids else None
+        self.predicate = predicate
+        self.max_pending = max_pending
+        self.last_seq = 0          # Última secuencia entregada (para reanudar)
+        self.closed = False
+        self._queue: deque = deque()
+        self._overflow = None      # [primera, última] secuencia descartada
+        self._gap = None           # Hueco previo al reanudar (fuera del historial)
+        self._cond = threading.Condition(threading.Lock())
+
+    def matches(self, event: ChangeEvent) -> bool:
+        if self.kinds is not None and event.kind not in self.kinds:
+            return False
+        if self.module_ids is not None and event.module_id not in self.module_ids:
+            return False
+        return self.predicate is None or self.predicate(event)
+
+    def _offer(self, event: ChangeEvent):
+        """Llamado por el feed; nunca bloquea."""
+        with self._cond:
+            if self.closed:
+                return
+            if self._overflow is not None or len(self._queue) >= self.max_pending:
+                if self._overflow is None:
+                    self._overflow = [event.seq, event.seq]
+                self._overflow[1] = event.seq
+            else:
+                self._queue.append(event)
+            self._cond.notify_all()
+
+    def _mark_gap(self, from_seq: int, to_seq: int):
+        with self._cond:
+            self._gap = [from_seq, to_seq]
+
+    def _next(self) -> Optional[ChangeEvent]:
+        if self._gap is not None:
+            first, last = self._gap
+            self._gap = None
+            return ChangeEvent(last, OVERFLOW, time.time(), None, {'from_seq': first, 'to_seq': last})
+        if self._queue:
+            event = self._queue.popleft()
+            self.last_seq = event.seq
+            return event
+        if self._overflow is not None:
+            first, last = self._overflow
+            self._overflow = None
+            self.last_seq = last
+            return ChangeEvent(last, OVERFLOW, time.time(), None, {'from_seq': first, 'to_seq': last})
+        return None
+
+    @property
+    def overflowed(self) -> bool:
+        return self._overflow is not None or self._gap is not None
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[ChangeEvent]:
+        """Siguiente evento; espera hasta `timeout` segundos (None si no llega)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._overflow is not None
+                                or self._gap is not None or self.closed, timeout)
+            return self._next()
+
+    def drain(self, limit: Optional[int] = None) -> List[ChangeEvent]:
+        """Todos los eventos pendientes sin esperar."""
+        events = []
+        with self._cond:
+            while limit is None or len(events) < limit:
+                event = self._next()
+                if event is None:
+                    break
+                events.append(event)
+        return events
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """Publicador de eventos de cambio con historial para reanudar."""
+
+    def __init__(self, history_size: int = 1000):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: deque = deque(maxlen=history_size)
+        self._subscriptions: List[Subscription] = []
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, kind: str, module_id: Optional[int] = None, **payload) -> ChangeEvent:
+        with self._lock:
+            self._seq += 1
+            event = ChangeEvent(self._seq, kind, time.time(), module_id, payload)
+            self._history.append(event)
+            # Entrega bajo el lock para conservar el orden; _offer nunca bloquea
+            for subscription in self._subscriptions:
+                try:
+                    if subscription.matches(event):
+                        subscription._offer(event)
+                except Exception as e:
+                    logger.error(f"Subscriber filter failed: {e}")
+        return event
+
+    def subscribe(self, kinds: Optional[Iterable[str]] = None, module_ids: Optional[Iterable[int]] = None,
+                  predicate: Optional[Callable[[ChangeEvent], bool]] = None,
+                  max_pending: int = 1000, resume_from: Optional[int] = None) -> Subscription:
+        """
+        Crear una suscripción.
+
+        Args:
+            kinds: Tipos de evento a recibir (None = todos)
+            module_ids: Solo eventos de estos módulos
+            predicate: Filtro adicional sobre cada ChangeEvent
+            max_pending: Tamaño del búfer; al llenarse se señala OVERFLOW
+            resume_from: Reentregar los eventos del historial posteriores a esta secuencia
+        """
+        subscription = Subscription(self, kinds, module_ids, predicate, max_pending)
+        with self._lock:
+            if resume_from is not None:
+                subscription.last_seq = resume_from
+                oldest = self._history[0].seq if self._history else self._seq + 1
+                if resume_from + 1 < oldest and resume_from < self._seq:
+                    # Parte de lo pedido ya salió del historial
+                    subscription._mark_gap(resume_from + 1, oldest - 1)
+                for event in self._history:
+                    if event.seq > resume_from and subscription.matches(event):
+                        subscription._offer(event)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        with subscription._cond:
+            subscription.closed = True
+            subscription._cond.notify_all()
+
+    def history(self, since: int = 0) -> List[ChangeEvent]:
+        with self._lock:
+            return [event for event in self._history if event.seq > since]
@@ -0,0 +1,682 @@
+"""
+config.py
+Configuración central del sistema de alarma.
+
+`AlarmConfig` es una instantánea inmutable y validada de `alarm_config.json`.
+`ConfigManager` la carga una sola vez, la comparte entre componentes
+(GUI, IOManager, ...), detecta cambios en el archivo por mtime y la recarga
+de forma atómica notificando a los suscriptores.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, fields, asdict
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional
+
+from durability import PROFILES as DURABILITY_PROFILES, DEFAULT_PROFILE as DEFAULT_DURABILITY
+
+logger = logging.getLogger("CONFIG")
+
+DEFAULT_CONFIG_FILE = "alarm_config.json"
+DEFAULT_HISTORY_DIR = "config_history"
+
+DEFAULT_OUTPUT_PINS = {
+    'siren': 17,       # Pin para sirena
+    'status_led': 27,  # LED de estado
+    'relay_1': 22,     # Relé 1
+    'relay_2': 23,     # Relé 2
+}
+
+
+IO_BACKENDS = ('auto', 'rpi', 'mcp23017', 'mcp23s17', 'fake')
+
+ARM_MODES = ('disarmed', 'away', 'night')
+
+
+class ConfigError(ValueError):
+    """La configuración no es válida."""
+
+
+def _require(condition: bool, message: str):
+    if not condition:
+        raise ConfigError(message)
+
+
+def _section(data: Mapping, name: str, cls):
+    value = data.get(name, {})
+    return value if isinstance(value, cls) else cls.from_dict(value)
+
+
+@dataclass(frozen=True)
+class ApnSettings:
+    apn: str = ""
+    username: str = ""
+    password: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "ApnSettings":
+        _require(isinstance(data, Mapping), "apn_settings must be an object")
+        values = {}
+        for name in ('apn', 'username', 'password'):
+            value = data.get(name, "")
+            _require(isinstance(value, str), f"apn_settings.{name} must be a string")
+            values[name] = value
+        return cls(**values)
+
+
+@dataclass(frozen=True)
+class IOSettings:
+    check_interval: float = 0.1   # segundos
+    bounce_time: int = 300        # milisegundos
+    output_pins: Mapping[str, int] = field(
+        default_factory=lambda: MappingProxyType(dict(DEFAULT_OUTPUT_PINS)))
+    backend: str = 'auto'         # 'auto', 'rpi', 'mcp23017', 'mcp23s17' o 'fake'
+    expander_addresses: tuple = (0x20,)   # MCP23017: direcciones I2C
+    expander_bus: int = 1                 # MCP23017: bus I2C
+    separate_process: bool = False  # Adquisición en un proceso aparte (acquisition.py)
+    spi_addresses: tuple = (0,)     # MCP23S17: direcciones hardware (A2..A0, 0-7)
+    spi_bus: int = 0
+    spi_device: int = 0             # Chip select
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "IOSettings":
+        _require(isinstance(data, Mapping), "io must be an object")
+        check_interval = data.get('check_interval', 0.1)
+        _require(isinstance(check_interval, (int, float)) and not isinstance(check_interval, bool)
+                 and 0 < check_interval <= 60, "io.check_interval must be a number in (0, 60]")
+
+        bounce_time = data.get('bounce_time', 300)
+        _require(isinstance(bounce_time, int) and not isinstance(bounce_time, bool)
+                 and 0 <= bounce_time <= 10000, "io.bounce_time must be an integer in [0, 10000] ms")
+
+        output_pins = data.get('output_pins', DEFAULT_OUTPUT_PINS)
+        _require(isinstance(output_pins, Mapping), "io.output_pins must be an object")
+        for name, pin in output_pins.items():
+            _require(isinstance(pin, int) and not isinstance(pin, bool) and 0 <= pin <= 255,
+                     f"io.output_pins.{name} must be a pin number")
+
+        backend = data.get('backend', 'auto')
+        _require(backend in IO_BACKENDS, f"io.backend must be one of {', '.join(IO_BACKENDS)}")
+
+        addresses = data.get('expander_addresses', [0x20])
+        _require(isinstance(addresses, (list, tuple)) and addresses
+                 and all(isinstance(a, int) and 0 <= a <= 0x7F for a in addresses),
+                 "io.expander_addresses must be a list of bus addresses")
+
+        expander_bus = data.get('expander_bus', 1)
+        _require(isinstance(expander_bus, int) and expander_bus >= 0, "io.expander_bus must be an integer")
+
+        separate_process = data.get('separate_process', False)
+        _require(isinstance(separate_process, bool), "io.separate_process must be true or false")
+
+        spi_addresses = data.get('spi_addresses', [0])
+        _require(isinstance(spi_addresses, (list, tuple)) and spi_addresses
+                 and all(isinstance(a, int) and 0 <= a <= 7 for a in spi_addresses),
+                 "io.spi_addresses must be a list of hardware addresses (0-7)")
+
+        spi_bus = data.get('spi_bus', 0)
+        _require(isinstance(spi_bus, int) and spi_bus >= 0, "io.spi_bus must be an integer")
+
+        spi_device = data.get('spi_device', 0)
+        _require(isinstance(spi_device, int) and spi_device >= 0, "io.spi_device must be an integer")
+
+        return cls(float(check_interval), bounce_time, MappingProxyType(dict(output_pins)),
+                   backend, tuple(addresses), expander_bus, separate_process,
+                   tuple(spi_addresses), spi_bus, spi_device)
+
+    def to_dict(self) -> dict:
+        return {
+            'check_interval': self.check_interval,
+            'bounce_time': self.bounce_time,
+            'output_pins': dict(self.output_pins),
+            'backend': self.backend,
+            'expander_addresses': list(self.expander_addresses),
+            'expander_bus': self.expander_bus,
+            'separate_process': self.separate_process,
+            'spi_addresses': list(self.spi_addresses),
+            'spi_bus': self.spi_bus,
+            'spi_device': self.spi_device,
+        }
+
+
+@dataclass(frozen=True)
+class ApiSettings:
+    enabled: bool = False         # API HTTP/WebSocket local (api_server.py); se aplica al reiniciar
+    host: str = '127.0.0.1'
+    port: int = 8080
+    allow_origin: str = ""        # Access-Control-Allow-Origin para paneles web; vacío = sin CORS
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "ApiSettings":
+        _require(isinstance(data, Mapping), "api must be an object")
+        enabled = data.get('enabled', False)
+        _require(isinstance(enabled, bool), "api.enabled must be true or false")
+        host = data.get('host', '127.0.0.1')
+        _require(isinstance(host, str) and host, "api.host must be a non-empty string")
+        port = data.get('port', 8080)
+        _require(isinstance(port, int) and not isinstance(port, bool) and 0 <= port <= 65535,
+                 "api.port must be an integer in [0, 65535]")
+        allow_origin = data.get('allow_origin', "")
+        _require(isinstance(allow_origin, str), "api.allow_origin must be a string")
+        return cls(enabled, host, port, allow_origin)
+
+
+@dataclass(frozen=True)
+class RetentionSettings:
+    enabled: bool = True          # Archivar alarmas antiguas en segundo plano (retention.py)
+    max_age_days: int = 365
+    archive_dir: str = 'archive'
+    interval_hours: float = 24.0  # Entre ciclos de archivado y poda
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "RetentionSettings":
+        _require(isinstance(data, Mapping), "retention must be an object")
+        enabled = data.get('enabled', True)
+        _require(isinstance(enabled, bool), "retention.enabled must be true or false")
+        max_age_days = data.get('max_age_days', 365)
+        _require(isinstance(max_age_days, int) and not isinstance(max_age_days, bool) and max_age_days >= 1,
+                 "retention.max_age_days must be an integer >= 1")
+        archive_dir = data.get('archive_dir', 'archive')
+        _require(isinstance(archive_dir, str) and archive_dir, "retention.archive_dir must be a non-empty string")
+        interval_hours = data.get('interval_hours', 24.0)
+        _require(isinstance(interval_hours, (int, float)) and not isinstance(interval_hours, bool)
+                 and 0 < interval_hours <= 24 * 30, "retention.interval_hours must be a number in (0, 720]")
+        return cls(enabled, max_age_days, archive_dir, float(interval_hours))
+
+
+@dataclass(frozen=True)
+class ZoneSettings:
+    """Zona de detección: qué módulos agrupa, cuándo está armada y qué hace."""
+
+    name: str
+    modules: tuple = ()                 # IDs de módulo; vacío = módulos sin zona
+    modes: tuple = ('away', 'night')    # Modos en los que la zona está armada
+    entry_delay: int = 0                # segundos antes de disparar
+    exit_delay: int = 0                 # segundos tras armar en que se ignora
+    actions: tuple = ('alarm', 'siren')
+    alarm_type: str = 'intrusion'
+
+    @classmethod
+    def from_dict(cls, data: Mapping, valid_actions=None) -> "ZoneSettings":
+        """
+        Args:
+            valid_actions: Nombres de acción admitidos ('alarm' y las salidas de
+                           `io.output_pins`); None = sin comprobar
+        """
+        _require(isinstance(data, Mapping), "zones entries must be objects")
+        name = data.get('name')
+        _require(isinstance(name, str) and name, "zones[].name must be a non-empty string")
+
+        def int_list(key, default):
+            value = data.get(key, default)
+            _require(isinstance(value, (list, tuple))
+                     and all(isinstance(v, int) and not isinstance(v, bool) for v in value),
+                     f"zones[{name}].{key} must be a list of integers")
+            return tuple(value)
+
+        def str_list(key, default):
+            value = data.get(key, default)
+            _require(isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value),
+                     f"zones[{name}].{key} must be a list of strings")
+            return tuple(value)
+
+        modes = str_list('modes', ['away', 'night'])
+        _require(all(m in ARM_MODES for m in modes),
+                 f"zones[{name}].modes must be among {', '.join(ARM_MODES)}")
+
+        delays = {}
+        for key in ('entry_delay', 'exit_delay'):
+            value = data.get(key, 0)
+            _require(isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 600,
+                     f"zones[{name}].{key} must be an integer in [0, 600] s")
+            delays[key] = value
+
+        alarm_type = data.get('alarm_type', 'intrusion')
+        _require(isinstance(alarm_type, str) and alarm_type, f"zones[{name}].alarm_type must be a string")
+
+        actions = str_list('actions', ['alarm', 'siren'])
+        if valid_actions is not None:
+            unknown = [a for a in actions if a not in valid_actions]
+            _require(not unknown, f"zones[{name}].actions: unknown action(s) {', '.join(unknown)}; "
+                                  f"use 'alarm' or an io.output_pins name")
+
+        return cls(name, int_list('modules', []), modes, delays['entry_delay'], delays['exit_delay'],
+                   actions, alarm_type)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'modules': list(self.modules),
+            'modes': list(self.modes),
+            'entry_delay': self.entry_delay,
+            'exit_delay': self.exit_delay,
+            'actions': list(self.actions),
+            'alarm_type': self.alarm_type,
+        }
+
+
+def _zones(data: Mapping, io: "IOSettings") -> tuple:
+    value = data.get('zones', [])
+    _require(isinstance(value, (list, tuple)), "zones must be a list")
+    valid_actions = ('alarm', 'siren') + tuple(io.output_pins)
+    zones = tuple(ZoneSettings.from_dict(z.to_dict() if isinstance(z, ZoneSettings) else z, valid_actions)
+                  for z in value)
+    names = [z.name for z in zones]
+    _require(len(names) == len(set(names)), "zones names must be unique")
+    seen = {}
+    for zone in zones:
+        for module_id in zone.modules:
+            _require(module_id not in seen,
+                     f"module {module_id} is in zones '{seen.get(module_id)}' and '{zone.name}'")
+            seen[module_id] = zone.name
+    return zones
+
+
+@dataclass(frozen=True)
+class AlarmConfig:
+    """Instantánea inmutable de la configuración del sistema."""
+
+    telegram_token: str = ""
+    telegram_chat_id: str = ""
+    alarm_duration: int = 60
+    deactivation_code: str = "1234"
+    night_mode: bool = False
+    email_notifications: bool = False
+    email_address: str = ""
+    apn_settings: ApnSettings = field(default_factory=ApnSettings)
+    io: IOSettings = field(default_factory=IOSettings)
+    zones: tuple = ()  # ZoneSettings; vacío = una zona única con todos los módulos
+    durability: str = DEFAULT_DURABILITY  # Perfil de la BD (durability.py); se aplica al reiniciar
+    api: ApiSettings = field(default_factory=ApiSettings)
+    retention: RetentionSettings = field(default_factory=RetentionSettings)  # Se aplica al reiniciar
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "AlarmConfig":
+        """Construir y validar una configuración; las claves ausentes toman su valor por defecto."""
+        _require(isinstance(data, Mapping), "configuration must be a JSON object")
+        defaults = cls()
+
+        def get(name, types, message):
+            value = data.get(name, getattr(defaults, name))
+            _require(isinstance(value, types) and not (types is int and isinstance(value, bool)), message)
+            return value
+
+        alarm_duration = get('alarm_duration', int, "alarm_duration must be an integer")
+        _require(alarm_duration >= 0, "alarm_duration must be >= 0")
+        deactivation_code = get('deactivation_code', str, "deactivation_code must be a string")
+        _require(deactivation_code.isdigit() and 4 <= len(deactivation_code) <= 12,
+                 "deactivation_code must be 4-12 digits")
+        io = _section(data, 'io', IOSettings)
+        durability = get('durability', str, "durability must be a string")
+        _require(durability in DURABILITY_PROFILES,
+                 f"durability must be one of {', '.join(DURABILITY_PROFILES)}")
+
+        return cls(
+            telegram_token=get('telegram_token', str, "telegram_token must be a string"),
+            telegram_chat_id=str(get('telegram_chat_id', (str, int), "telegram_chat_id must be a string")),
+            alarm_duration=alarm_duration,
+            deactivation_code=deactivation_code,
+            night_mode=get('night_mode', bool, "night_mode must be true or false"),
+            email_notifications=get('email_notifications', bool, "email_notifications must be true or false"),
+            email_address=get('email_address', str, "email_address must be a string"),
+            apn_settings=_section(data, 'apn_settings', ApnSettings),
+            io=io,
+            zones=_zones(data, io),
+            durability=durability,
+            api=_section(data, 'api', ApiSettings),
+            retention=_section(data, 'retention', RetentionSettings),
+        )
+
+    def to_dict(self) -> dict:
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data['apn_settings'] = asdict(self.apn_settings)
+        data['io'] = self.io.to_dict()
+        data['api'] = asdict(self.api)
+        data['retention'] = asdict(self.retention)
+        data['zones'] = [zone.to_dict() for zone in self.zones]
+        return data
+
+    def get(self, key: str, default=None):
+        """Acceso estilo diccionario para código que aún usa claves."""
+        return getattr(self, key, default)
+
+    def with_changes(self, **changes) -> "AlarmConfig":
+        """Devolver una copia con los campos indicados cambiados (validada)."""
+        return AlarmConfig.from_dict({**self.to_dict(), **changes})
+
+
+Subscriber = Callable[[AlarmConfig, AlarmConfig], None]
+
+
+def serialize(config: AlarmConfig) -> bytes:
+    """Representación canónica en disco de una configuración."""
+    return json.dumps(config.to_dict(), indent=4).encode('utf-8')
+
+
+def atomic_write(path: str, data: bytes):
+    """
+    Escribir un archivo de forma atómica: archivo temporal en el mismo
+    directorio, fsync y os.replace. Un corte de luz deja el archivo viejo
+    o el nuevo, nunca uno a medias.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Persistir también la entrada del directorio (no disponible en Windows)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class ConfigSnapshotStore:
+    """
+    Historial de versiones de la configuración, direccionado por contenido.
+
+    Cada contenido distinto se guarda una sola vez en `objects/<sha256>.json`;
+    `index.json` lista las versiones (número, hash, fecha, etiqueta). Las
+    versiones automáticas se limitan a `max_versions` y las copias de
+    seguridad etiquetadas a `max_backups`; los objetos sin referencias se borran.
+    """
+
+    def __init__(self, directory: str = DEFAULT_HISTORY_DIR,
+                 max_versions: int = 50, max_backups: int = 20):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_versions = max_versions
+        self.max_backups = max_backups
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self) -> List[dict]:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"Config history index unreadable, starting a new one: {e}")
+            return []
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, f"{digest}.json")
+
+    def commit(self, data: bytes, label: str = "") -> dict:
+        """
+        Registrar un contenido como nueva versión.
+
+        Si el contenido es idéntico a la última versión y no hay etiqueta,
+        no se crea versión nueva.
+
+        Returns:
+            Entrada del índice de la versión
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if self._index and self._index[-1]['hash'] == digest and not label:
+                return self._index[-1]
+
+            object_path = self._object_path(digest)
+            if not os.path.exists(object_path):
+                atomic_write(object_path, data)
+
+            entry = {
+                'version': self._index[-1]['version'] + 1 if self._index else 1,
+                'hash': digest,
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'label': label,
+            }
+            self._index.append(entry)
+            self._apply_retention()
+            atomic_write(self.index_path, json.dumps(self._index, indent=2).encode('utf-8'))
+            return entry
+
+    def _apply_retention(self):
+        backups = [e for e in self._index if e['label']]
+        autosaves = [e for e in self._index if not e['label']]
+        keep = set(id(e) for e in autosaves[-self.max_versions:])
+        keep.update(id(e) for e in backups[-self.max_backups:])
+        # La última versión siempre se conserva
+        keep.add(id(self._index[-1]))
+        removed = [e for e in self._index if id(e) not in keep]
+        if not removed:
+            return
+        self._index = [e for e in self._index if id(e) in keep]
+
+        referenced = {e['hash'] for e in self._index}
+        for digest in {e['hash'] for e in removed} - referenced:
+            try:
+                os.remove(self._object_path(digest))
+            except OSError:
+                pass
+
+    def versions(self) -> List[dict]:
+        """Versiones disponibles, de la más antigua a la más reciente."""
+        with self._lock:
+            return [dict(e) for e in self._index]
+
+    def get(self, version: int) -> bytes:
+        """Contenido de una versión (KeyError si no existe)."""
+        with self._lock:
+            entry = next((e for e in self._index if e['version'] == version), None)
+        if entry is None:
+            raise KeyError(f"Unknown config version {version}")
+        with open(self._object_path(entry['hash']), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry['hash']:
+            raise ConfigError(f"Config version {version} is corrupted")
+        return data
+
+
+class ConfigManager:
+    """Carga, comparte y recarga en caliente la configuración del sistema."""
+
+    def __init__(self, path: str = DEFAULT_CONFIG_FILE,
+                 store: Optional[ConfigSnapshotStore] = None):
+        """
+        Args:
+            path: Archivo JSON de configuración
+            store: Historial de versiones; por defecto `config_history/`
+                   junto al archivo
+        """
+        self.path = path
+        if store is None:
+            directory = os.path.join(os.path.dirname(os.path.abspath(path)), DEFAULT_HISTORY_DIR)
+            store = ConfigSnapshotStore(directory)
+        self.store = store
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscriber] = []
+        self._file_signature = None
+        self._watch_stop = threading.Event()
+        self._watch_thread = None
+        self._snapshot = self._load_initial()
+
+    @property
+    def snapshot(self) -> AlarmConfig:
+        """Configuración vigente (inmutable; se reemplaza completa al recargar)."""
+        return self._snapshot
+
+    # ===== CARGA Y GUARDADO =====
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read_file(self) -> AlarmConfig:
+        with open(self.path, 'r') as f:
+            return AlarmConfig.from_dict(json.load(f))
+
+    def _load_initial(self) -> AlarmConfig:
+        if not os.path.exists(self.path):
+            config = AlarmConfig()
+            self._write(config)
+            return config
+        try:
+            self._file_signature = self._signature()
+            config = self._read_file()
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading config {self.path}: {e}. Using defaults.")
+            return AlarmConfig()
+        self._commit_version(config)
+        return config
+
+    def _write(self, config: AlarmConfig, label: str = ""):
+        data = serialize(config)
+        atomic_write(self.path, data)
+        self._file_signature = self._signature()
+        self._commit_version(config, label)
+
+    def _commit_version(self, config: AlarmConfig, label: str = ""):
+        try:
+            self.store.commit(serialize(config), label)
+        except OSError as e:
+            # El historial no debe impedir usar la configuración
+            logger.error(f"Failed to record config version: {e}")
+
+    def reload(self) -> bool:
+        """
+        Releer el archivo si cambió en disco.
+
+        Returns:
+            True si la configuración cambió. Si el archivo nuevo no es válido
+            se mantiene la instantánea anterior.
+        """
+        signature = self._signature()
+        if signature is None or signature == self._file_signature:
+            return False
+        try:
+            config = self._read_file()
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring invalid config change in {self.path}: {e}")
+            self._file_signature = signature
+            return False
+        self._file_signature = signature
+        self._commit_version(config)
+        return self._publish(config)
+
+    def save(self, config, label: str = "") -> AlarmConfig:
+        """Validar, guardar de forma atómica, versionar y publicar una configuración."""
+        if not isinstance(config, AlarmConfig):
+            config = AlarmConfig.from_dict(config)
+        with self._lock:
+            self._write(config, label)
+        self._publish(config)
+        return config
+
+    def backup(self, label: str = "backup") -> dict:
+        """Crear una versión etiquetada de la configuración vigente."""
+        return self.store.commit(serialize(self._snapshot), label)
+
+    def restore(self, version: int) -> AlarmConfig:
+        """Restaurar una versión del historial (queda registrada como versión nueva)."""
+        config = AlarmConfig.from_dict(json.loads(self.store.get(version)))
+        return self.save(config, label=f"restore of v{version}")
+
+    def restore_defaults(self) -> AlarmConfig:
+        """Volver a los valores por defecto; la configuración anterior queda en el historial."""
+        return self.save(AlarmConfig(), label="defaults")
+
+    def update(self, **changes) -> AlarmConfig:
+        """Guardar la configuración vigente con algunos campos cambiados."""
+        return self.save(self._snapshot.with_changes(**changes))
+
+    # ===== SUSCRIPTORES =====
+
+    def subscribe(self, callback: Subscriber) -> Callable[[], None]:
+        """
+        Registrar un callback(old, new) que se llama tras cada cambio.
+
+        Returns:
+            Función para cancelar la suscripción
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _publish(self, config: AlarmConfig) -> bool:
+        with self._lock:
+            old = self._snapshot
+            if config == old:
+                return False
+            # Sustitución atómica de la referencia: los lectores ven la
+            # instantánea vieja o la nueva, nunca una mezcla
+            self._snapshot = config
+            subscribers = list(self._subscribers)
+
+        logger.info("Configuration reloaded.")
+        for callback in subscribers:
+            try:
+                callback(old, config)
+            except Exception as e:
+                logger.error(f"Config subscriber {callback!r} failed: {e}")
+        return True
+
+    # ===== VIGILANCIA DEL ARCHIVO =====
+
+    def start_watching(self, interval: float = 1.0):
+        """Comprobar periódicamente el mtime del archivo y recargar si cambia."""
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(interval,), daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._watch_stop.set()
+        if self._watch_thread:
+            self._watch_thread.join(timeout=2)
+
+    def _watch_loop(self, interval: float):
+        while not self._watch_stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error watching config: {e}")
+
+
+_managers: Dict[str, ConfigManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_config_manager(path: str = DEFAULT_CONFIG_FILE) -> ConfigManager:
+    """Obtener el ConfigManager compartido para un archivo de configuración."""
+    key = os.path.abspath(path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConfigManager(path)
+        return manager
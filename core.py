@@ -1,63 +1,126 @@
 # Alarm core engine 
+import json
 import sqlite3
+import time
 import logging
 from datetime import datetime
 from io_manager import IOManager
+from profiler import QueryProfiler
+from exporter import export_alarms as _export_alarms, ExportCancelled
+import history
+import schema
+import stats
+from records import Alarm, Module, User, row_factory
+from auth import PasswordHasher, SessionCache, LoginThrottle
+from escalation import EscalationScheduler
+from journal import EventJournal, JournalError, RecordTooLarge
+from checkpoint import CheckpointManager
+from evidence import EvidenceStore
+from retention import RetentionManager
+import durability as durability_profiles
+from anomaly import MAINTENANCE_TYPES
+from event_buffer import RecentEvents, ALARM, ACKNOWLEDGE, MODULE_STATUS
+from changefeed import (ChangeFeed, ALARM_CREATED, ALARM_ACKNOWLEDGED, MODULE_REGISTERED,
+                        MODULE_UPDATED, MODULE_REMOVED)
 
 # Configure logging
 logger = logging.getLogger("CORE")
 
 class AlarmCore:
-    def __init__(self, db_name='alarm_core.db'):
+    def __init__(self, db_name='alarm_core.db', profiler=None, password_hasher=None,
+                 session_ttl=900, escalation=None, journal=None, events=None, checkpoint=None,
+                 durability=None, evidence=None, retention=None):
         self.db_name = db_name
         self.connection = None
+        # Perfil de durabilidad (nombre o DurabilityProfile); None = valores por defecto de SQLite
+        self.durability = durability_profiles.get_profile(durability) if durability else None
+        if checkpoint is None and self.durability and self.durability.in_memory:
+            checkpoint = True
+        # BD de trabajo en memoria (tmpfs) con checkpoints a disco: True o un CheckpointManager
+        if checkpoint is True:
+            checkpoint = (CheckpointManager(db_name, interval=self.durability.checkpoint_interval,
+                                            max_changes=self.durability.checkpoint_changes)
+                          if self.durability else CheckpointManager(db_name))
+        self.checkpoint = checkpoint
+        self.database_path = self.checkpoint.restore() if self.checkpoint else db_name
+        self._committed_changes = 0
+        # Últimos eventos en memoria (compartible con IOManager)
+        self.events = events if events is not None else RecentEvents()
+        # Feed de cambios con suscripciones (ver changefeed.py)
+        self.changes = ChangeFeed()
+        # Autenticación: hash scrypt, sesiones en memoria y bloqueo por fallos
+        self.password_hasher = password_hasher or PasswordHasher()
+        self.sessions = SessionCache(ttl=session_ttl)
+        self.login_throttle = LoginThrottle()
+        self._dummy_password_hash = None
+        # Perfilado opcional: True para valores por defecto o un QueryProfiler
+        self.profiler = QueryProfiler() if profiler is True else profiler
         self._initialize_db()  # Cambié el nombre a inglés para consistencia
+        if self.profiler:
+            self.profiler.instrument(
+                self, exclude=('close', 'get_profile_report', 'dump_profile'))
+        # Diario opcional delante de trigger_alarm: True o un EventJournal
+        if journal is True:
+            journal = (EventJournal(sync_writes=self.durability.journal_sync,
+                                    batch_size=self.durability.journal_batch)
+                       if self.durability else EventJournal())
+        self.journal = journal
+        if self.journal:
+            self.journal.sink = self._write_journal_batch
+            self.journal.reserve_ids(self._last_alarm_id())
+            self.journal.drain()  # Reproducir lo que no llegó a la BD
+            if self.durability:
+                self.journal.start(interval=self.durability.journal_interval)
+            else:
+                self.journal.start()
+        # Escalado opcional de alarmas sin reconocer: True o un EscalationScheduler
+        self.escalation = EscalationScheduler() if escalation is True else escalation
+        if self.escalation:
+            if self.escalation.connect is None:
+                self.escalation.connect = self.open_connection
+            self.escalation.rebuild()
+            self.escalation.start()
+        # Almacén opcional de evidencias (capturas, clips): True o un EvidenceStore
+        self.evidence = EvidenceStore() if evidence is True else evidence
+        if self.evidence and self.evidence.protect is None:
+            self.evidence.protect = self._unacknowledged_alarm_ids
+        # Archivado periódico de alarmas antiguas y poda del historial: True o un RetentionManager
+        self.retention = RetentionManager(self) if retention is True else retention
+        if self.retention:
+            if self.retention.core is None:
+                self.retention.core = self
+            self.retention.start()
+        if self.checkpoint:
+            self.checkpoint.start()
         
     def _initialize_db(self):
         """Initialize the database and create necessary tables if they don't exist."""
         try:
-            self.connection = sqlite3.connect(self.db_name)
+            if self.profiler:
+                self.connection = sqlite3.connect(
+                    self.database_path, factory=self.profiler.connection_factory())
+            else:
+                self.connection = sqlite3.connect(self.database_path)
+            if self.durability:
+                durability_profiles.apply(self.connection, self.durability)
             cursor = self.connection.cursor()
-            
-            # Tabla de módulos
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS modules (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Tabla de alarmas
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS alarms (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    module_id INTEGER,
-                    alarm_type TEXT NOT NULL,
-                    description TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    acknowledged BOOLEAN DEFAULT 0,
-                    FOREIGN KEY(module_id) REFERENCES modules(id)
-                )
-            ''')
-            
-            # Tabla de usuarios
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            self.connection.commit()
+
+            # Vacuum incremental para que la retención recupere espacio
+            # poco a poco (en una BD existente requiere un VACUUM inicial)
+            cursor.execute("PRAGMA auto_vacuum")
+            if cursor.fetchone()[0] != 2:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+
+            # Tablas e índices: migraciones versionadas (PRAGMA user_version)
+            schema.migrate(self.connection)
+
+            self._commit()
             logging.info("Database initialized successfully.")
             
             # Crear usuario admin por defecto si no existe
             self._create_default_admin()
+            self._migrate_plaintext_passwords()
             
         except sqlite3.Error as e:
             logging.error(f"Database initialization failed: {e}")
@@ -72,16 +135,27 @@ class AlarmCore:
         count = cursor.fetchone()[0]
         
         if count == 0:
-            # Crear usuario admin por defecto
-            # ¡EN PRODUCCIÓN DEBES USAR HASH PARA LAS CONTRASEÑAS!
+            # Crear usuario admin por defecto (contraseña guardada con hash)
             default_password = "admin123"  # Cambia esto
             cursor.execute('''
                 INSERT INTO users (username, password, role)
                 VALUES (?, ?, ?)
-            ''', ('admin', default_password, 'administrator'))
+            ''', ('admin', self.password_hasher.hash(default_password), 'administrator'))
             
-            self.connection.commit()
-            logging.info("Default admin user created.")
+            self._commit()
+            logging.warning("Default admin user created with the default password; change it.")
+    
+    def _migrate_plaintext_passwords(self):
+        """Replace any plaintext passwords left by older versions with hashes."""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT id, password FROM users")
+        legacy = [(self.password_hasher.hash(password), user_id)
+                  for user_id, password in cursor.fetchall()
+                  if not self.password_hasher.is_hashed(password)]
+        if legacy:
+            cursor.executemany("UPDATE users SET password = ? WHERE id = ?", legacy)
+            self._commit()
+            logging.info(f"Hashed {len(legacy)} plaintext password(s).")
     
     # ===== MÉTODOS PARA USUARIOS =====
     
@@ -92,9 +166,9 @@ class AlarmCore:
             cursor.execute('''
                 INSERT INTO users (username, password, role)
                 VALUES (?, ?, ?)
-            ''', (username, password, role))
+            ''', (username, self.password_hasher.hash(password), role))
             
-            self.connection.commit()
+            self._commit()
             logging.info(f"User '{username}' created with role '{role}'.")
             return cursor.lastrowid
             
@@ -106,30 +180,75 @@ class AlarmCore:
             return None
     
     def authenticate_user(self, username, password):
-        """Authenticate a user."""
+        """
+        Authenticate a user.
+        
+        Returns the user dict with a session 'token' that can be passed to
+        validate_session() and to operator actions, or None on failure or
+        while the user is locked out after repeated failures.
+        """
+        retry_after = self.login_throttle.retry_after(username)
+        if retry_after > 0:
+            # Mismo coste que una verificación: una respuesta rápida delataría que el usuario existe
+            self.password_hasher.verify(password, self._dummy_hash())
+            logging.warning(f"Authentication for '{username}' rejected: locked out for {retry_after:.0f}s.")
+            return None
+        
         try:
             cursor = self.connection.cursor()
             cursor.execute('''
-                SELECT id, username, role FROM users 
-                WHERE username = ? AND password = ?
-            ''', (username, password))
+                SELECT id, username, role, password FROM users 
+                WHERE username = ?
+            ''', (username,))
             
             user = cursor.fetchone()
             if user:
-                logging.info(f"User '{username}' authenticated successfully.")
-                return {
-                    'id': user[0],
-                    'username': user[1],
-                    'role': user[2]
-                }
+                valid = self.password_hasher.verify(password, user[3])
             else:
+                # Mismo coste que un usuario existente para no revelar cuáles existen
+                self.password_hasher.verify(password, self._dummy_hash())
+                valid = False
+            
+            if not valid:
+                # Solo usuarios existentes: los nombres inventados no ocupan contadores
+                if user:
+                    self.login_throttle.record_failure(username)
                 logging.warning(f"Failed authentication attempt for user '{username}'.")
                 return None
+            
+            # Rehacer el hash si cambió el coste configurado
+            if self.password_hasher.needs_rehash(user[3]):
+                cursor.execute("UPDATE users SET password = ? WHERE id = ?",
+                               (self.password_hasher.hash(password), user[0]))
+                self._commit()
+            
+            self.login_throttle.record_success(username)
+            session_user = {
+                'id': user[0],
+                'username': user[1],
+                'role': user[2]
+            }
+            session_user['token'] = self.sessions.create(session_user)
+            logging.info(f"User '{username}' authenticated successfully.")
+            return session_user
                 
         except sqlite3.Error as e:
             logging.error(f"Authentication error: {e}")
             return None
     
+    def _dummy_hash(self):
+        if self._dummy_password_hash is None:
+            self._dummy_password_hash = self.password_hasher.hash("dummy-password")
+        return self._dummy_password_hash
+    
+    def validate_session(self, token):
+        """Return the user for a valid session token (no hashing, no DB access), else None."""
+        return self.sessions.validate(token)
+    
+    def logout(self, token):
+        """End a session."""
+        return self.sessions.invalidate(token)
+    
     # ===== MÉTODOS PARA MÓDULOS =====
     
     def register_module(self, name, initial_status='inactive'):
@@ -140,9 +259,13 @@ class AlarmCore:
                 INSERT INTO modules (name, status)
                 VALUES (?, ?)
             ''', (name, initial_status))
-            
-            self.connection.commit()
             module_id = cursor.lastrowid
+
+            # Estado inicial en el historial
+            history.record_transition(cursor, module_id, None, initial_status, None)
+
+            self._commit()
+            self.changes.publish(MODULE_REGISTERED, module_id, name=name, status=initial_status)
             logging.info(f"Module '{name}' registered with ID {module_id}.")
             return module_id
             
@@ -154,21 +277,41 @@ class AlarmCore:
         """Update the status of a module."""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('''
-                UPDATE modules 
-                SET status = ?, last_updated = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (status, module_id))
-            
-            self.connection.commit()
-            if cursor.rowcount > 0:
+            updated = self._apply_module_status(cursor, module_id, status)
+            self._commit()
+            if updated:
+                self.events.append(MODULE_STATUS, module_id, status)
+                self.changes.publish(MODULE_UPDATED, module_id, status=status)
                 logging.info(f"Module {module_id} status updated to '{status}'.")
                 return True
             return False
-            
+
         except sqlite3.Error as e:
             logging.error(f"Failed to update module status: {e}")
+            self.connection.rollback()
             return False
+
+    @staticmethod
+    def _apply_module_status(cursor, module_id, status, now=None):
+        """Update a module's status and record the transition, without committing."""
+        cursor.execute('''
+            SELECT status, last_updated FROM modules WHERE id = ?
+        ''', (module_id,))
+        previous = cursor.fetchone()
+
+        cursor.execute('''
+            UPDATE modules
+            SET status = ?, last_updated = COALESCE(?, CURRENT_TIMESTAMP)
+            WHERE id = ?
+        ''', (status, now.strftime(history.TIMESTAMP_FORMAT) if now else None, module_id))
+        updated = cursor.rowcount > 0
+
+        # Registrar la transición solo si el estado cambió
+        if updated and previous and previous[0] != status:
+            last = history.last_transition(cursor, module_id)
+            since = last[1] if last else history.parse_timestamp(previous[1])
+            history.record_transition(cursor, module_id, previous[0], status, since, now)
+        return updated
     
     def unregister_module(self, module_id):
         """Remove a module from the system by its ID."""
@@ -191,7 +334,8 @@ class AlarmCore:
                 DELETE FROM modules WHERE id = ?
             ''', (module_id,))
             
-            self.connection.commit()
+            self._commit()
+            self.changes.publish(MODULE_REMOVED, module_id, name=module[0])
             logging.info(f"Module '{module[0]}' (ID {module_id}) has been removed.")
             return True
             
@@ -201,49 +345,95 @@ class AlarmCore:
             return False
 
     def get_all_modules(self):
-        """Get all registered modules as a dictionary."""
+        """Get all registered modules as {module_id: Module}, ordered by name."""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('SELECT * FROM modules ORDER BY name')
-            rows = cursor.fetchall()
-            
-            # Convertir a diccionario
-            modules_dict = {}
-            
-            # Asumiendo que la tabla tiene: id, name, type, pin, state, description, etc.
-            for row in rows:
-                module_id = row[0]  # ID del módulo
-                modules_dict[module_id] = {
-                    "id": row[0],
-                    "name": row[1],
-                    "type": row[2] if len(row) > 2 else "unknown",
-                    "pin": row[3] if len(row) > 3 else 0,
-                    "state": row[4] if len(row) > 4 else "unknown",
-                    "description": row[5] if len(row) > 5 else ""
-                }
-            
-            return modules_dict
+            cursor.row_factory = row_factory(Module)
+            cursor.execute('SELECT id, name, status, last_updated FROM modules ORDER BY name')
+            return {module.id: module for module in cursor.fetchall()}
             
         except sqlite3.Error as e:
             logging.error(f"Failed to get modules: {e}")
             return {}
+
+    def get_module(self, module_id):
+        """Get one module as a Module record, or None."""
+        cursor = self.connection.cursor()
+        cursor.row_factory = row_factory(Module)
+        cursor.execute('SELECT id, name, status, last_updated FROM modules WHERE id = ?', (module_id,))
+        return cursor.fetchone()
+
+    def get_users(self):
+        """Get all users as User records (without password hashes)."""
+        cursor = self.connection.cursor()
+        cursor.row_factory = row_factory(User)
+        cursor.execute('SELECT id, username, role, created_at FROM users ORDER BY username')
+        return cursor.fetchall()
     
+    def get_module_history(self, module_id, granularity='day', start=None, end=None):
+        """Get per-bucket transition counts and time in alarm for a module."""
+        try:
+            return history.get_rollups(self.connection, module_id, granularity, start, end)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get module history: {e}")
+            return []
+
+    def get_module_transitions(self, module_id, limit=50):
+        """Get the latest state transitions of a module, newest first."""
+        try:
+            return history.get_transitions(self.connection, module_id, limit)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get module transitions: {e}")
+            return []
+
     # ===== MÉTODOS PARA ALARMAS =====
     
     def trigger_alarm(self, module_id, alarm_type, description=""):
-        """Trigger a new alarm."""
+        """
+        Trigger a new alarm.
+
+        With a journal the event is appended there and written to the
+        database asynchronously; the returned ID is already final, and
+        escalation, recent events and the change feed follow once the row
+        is committed (see _write_journal_batch).
+        """
+        if self.journal:
+            try:
+                alarm_id = self.journal.append(module_id, alarm_type, description)
+            except RecordTooLarge as e:
+                # No cabe en un registro del diario: volcar lo pendiente y escribir directamente
+                logging.info(f"Alarm written without the journal: {e}")
+                if not self._flush_journal():
+                    return None
+            except JournalError as e:
+                logging.error(f"Failed to trigger alarm: {e}")
+                return None
+            else:
+                logging.warning(f"Alarm triggered: {alarm_type} on module {module_id}")
+                return alarm_id
+
         try:
             cursor = self.connection.cursor()
             cursor.execute('''
                 INSERT INTO alarms (module_id, alarm_type, description)
                 VALUES (?, ?, ?)
             ''', (module_id, alarm_type, description))
+            stats.record_raised(cursor, module_id, alarm_type)
             
-            self.connection.commit()
+            self._commit()
             alarm_id = cursor.lastrowid
+            if self.journal:
+                self.journal.reserve_ids(alarm_id)
             
-            # También actualizar el estado del módulo
-            self.update_module_status(module_id, 'alarm')
+            # También actualizar el estado del módulo (no en alarmas de mantenimiento)
+            if alarm_type not in MAINTENANCE_TYPES:
+                self.update_module_status(module_id, 'alarm')
+
+            if self.escalation:
+                self.escalation.schedule_alarm(alarm_id, module_id, alarm_type, description)
+            self.events.append(ALARM, module_id, alarm_type, alarm_id=alarm_id, description=description)
+            self.changes.publish(ALARM_CREATED, module_id, alarm_id=alarm_id, alarm_type=alarm_type,
+                                 description=description)
             
             logging.warning(f"Alarm triggered: {alarm_type} on module {module_id}")
             return alarm_id
@@ -251,50 +441,317 @@ class AlarmCore:
         except sqlite3.Error as e:
             logging.error(f"Failed to trigger alarm: {e}")
             return None
+
+    def _flush_journal(self):
+        """Write every journaled alarm to the database now (before reading or updating them)."""
+        try:
+            self.journal.drain()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to flush the event journal: {e}")
+            return False
+
+    def _last_alarm_id(self):
+        """Highest alarm ID ever assigned (AUTOINCREMENT never reuses IDs)."""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'alarms'")
+        row = cursor.fetchone()
+        cursor.execute("SELECT MAX(id) FROM alarms")
+        return max(row[0] if row else 0, cursor.fetchone()[0] or 0)
+
+    def _write_journal_batch(self, records):
+        """Journal sink: insert a batch of events idempotently in one transaction."""
+        connection = self.open_connection()
+        updated = set()
+        inserted = []
+        try:
+            cursor = connection.cursor()
+            for record in records:
+                created = datetime.utcfromtimestamp(record.created).replace(microsecond=0)
+                cursor.execute('''
+                    INSERT OR IGNORE INTO alarms (id, module_id, alarm_type, description, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (record.alarm_id, record.module_id, record.alarm_type, record.description,
+                      created.strftime(history.TIMESTAMP_FORMAT)))
+                # Ya insertado en un volcado anterior: no contarlo ni repetir la transición
+                if not cursor.rowcount:
+                    continue
+                inserted.append(record)
+                stats.record_raised(cursor, record.module_id, record.alarm_type, created)
+                if record.alarm_type in MAINTENANCE_TYPES:
+                    continue
+                if self._apply_module_status(cursor, record.module_id, 'alarm', created):
+                    updated.add(record.module_id)
+            connection.commit()
+            self._note_changes(connection.total_changes)
+        finally:
+            connection.close()
+        # Solo ahora la alarma es visible en la BD: avisar a escalado, eventos y suscriptores
+        now = time.time()
+        for record in inserted:
+            if self.escalation:
+                self.escalation.schedule_alarm(record.alarm_id, record.module_id, record.alarm_type,
+                                               record.description, age=max(0.0, now - record.created))
+            self.events.append(ALARM, record.module_id, record.alarm_type, alarm_id=record.alarm_id,
+                               description=record.description)
+            self.changes.publish(ALARM_CREATED, record.module_id, alarm_id=record.alarm_id,
+                                 alarm_type=record.alarm_type, description=record.description)
+        for module_id in updated:
+            self.changes.publish(MODULE_UPDATED, module_id, status='alarm')
     
-    def acknowledge_alarm(self, alarm_id):
-        """Mark an alarm as acknowledged."""
+    def acknowledge_alarm(self, alarm_id, session_token=None, acknowledged_by=None):
+        """
+        Mark an alarm as acknowledged.
+        
+        If a session token is given it must belong to a valid session.
+        """
+        return self.acknowledge_alarms(alarm_ids=[alarm_id], session_token=session_token,
+                                       acknowledged_by=acknowledged_by) > 0
+
+    @staticmethod
+    def _alarm_filter(alarm_ids=None, module_id=None, alarm_type=None, before=None, since=None):
+        """Build the WHERE clause shared by bulk acknowledge and active alarm queries."""
+        clauses, params = ['a.acknowledged = 0'], []
+        if alarm_ids is not None:
+            # Un único parámetro JSON en lugar de un IN (?, ?, ...) por ID
+            clauses.append('a.id IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps([int(i) for i in alarm_ids]))
+        if module_id is not None:
+            clauses.append('a.module_id = ?')
+            params.append(module_id)
+        if alarm_type is not None:
+            clauses.append('a.alarm_type = ?')
+            params.append(alarm_type)
+        if before is not None:
+            clauses.append('a.timestamp < ?')
+            params.append(str(before))
+        if since is not None:
+            clauses.append('a.timestamp >= ?')
+            params.append(str(since))
+        return ' AND '.join(clauses), params
+
+    def acknowledge_alarms(self, alarm_ids=None, module_id=None, alarm_type=None,
+                           before=None, acknowledged_by=None, session_token=None):
+        """
+        Acknowledge many alarms in one set-based UPDATE and one transaction.
+
+        Predicates are combined with AND and at least one is required:
+        an ID list, a module, an alarm type or a 'YYYY-MM-DD HH:MM:SS'
+        timestamp (alarms strictly before it). If a session token is given it
+        must be valid, and its user is recorded as `acknowledged_by`.
+
+        Returns:
+            Number of alarms acknowledged
+        """
+        if session_token is not None:
+            user = self.validate_session(session_token)
+            if not user:
+                logging.warning("Bulk acknowledge rejected: invalid session.")
+                return 0
+            acknowledged_by = acknowledged_by or user['username']
+        if alarm_ids is None and module_id is None and alarm_type is None and before is None:
+            logging.error("acknowledge_alarms needs at least one predicate.")
+            return 0
+        if alarm_ids is not None and not alarm_ids:
+            return 0
+        # Las alarmas aún en el diario también se pueden reconocer
+        if self.journal and self.journal.backlog():
+            self._flush_journal()
+
+        where, params = self._alarm_filter(alarm_ids, module_id, alarm_type, before)
         try:
             cursor = self.connection.cursor()
-            cursor.execute('''
-                UPDATE alarms 
-                SET acknowledged = 1 
-                WHERE id = ?
-            ''', (alarm_id,))
-            
-            self.connection.commit()
-            if cursor.rowcount > 0:
-                logging.info(f"Alarm {alarm_id} acknowledged.")
-                return True
-            return False
-            
+            cursor.execute("BEGIN IMMEDIATE")
+            # Alarmas afectadas: para anular su escalado y publicarlas en el feed
+            cursor.execute(f"SELECT a.id, a.module_id FROM alarms a WHERE {where}", params)
+            affected = cursor.fetchall()
+            cursor.execute(f'''
+                UPDATE alarms
+                SET acknowledged = 1,
+                    acknowledged_by = ?,
+                    acknowledged_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT a.id FROM alarms a WHERE {where})
+            ''', [acknowledged_by] + params)
+            count = cursor.rowcount
+            if affected:
+                stats.record_acknowledged(cursor, json.dumps([alarm_id for alarm_id, _ in affected]))
+            self._commit()
         except sqlite3.Error as e:
-            logging.error(f"Failed to acknowledge alarm: {e}")
-            return False
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            logging.error(f"Failed to acknowledge alarms: {e}")
+            return 0
+
+        if self.escalation:
+            self.escalation.cancel_many(alarm_id for alarm_id, _ in affected)
+        for alarm_id, alarm_module_id in affected:
+            self.changes.publish(ALARM_ACKNOWLEDGED, alarm_module_id, alarm_id=alarm_id,
+                                 acknowledged_by=acknowledged_by)
+        if count:
+            self.events.append(ACKNOWLEDGE, module_id, f"{count} alarm(s)", count=count,
+                               acknowledged_by=acknowledged_by)
+            logging.info(f"{count} alarm(s) acknowledged by {acknowledged_by or 'unknown'}.")
+        return count
     
-    def get_active_alarms(self):
-        """Get all unacknowledged alarms."""
+    def get_alarm_stats(self):
+        """
+        Alarm counters per module and type over the last hour, day and week,
+        with the mean time to acknowledge (see stats.py).
+        """
         try:
             cursor = self.connection.cursor()
-            cursor.execute('''
-                SELECT a.*, m.name as module_name 
+            if stats.prune(cursor):
+                self._commit()
+            return stats.summary(self.connection)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to read alarm statistics: {e}")
+            return None
+
+    def get_active_alarms(self, module_id=None, alarm_type=None, since=None):
+        """
+        Get unacknowledged alarms, newest first, as Alarm records.
+        """
+        where, params = self._alarm_filter(module_id=module_id, alarm_type=alarm_type, since=since)
+        try:
+            cursor = self.connection.cursor()
+            cursor.row_factory = row_factory(Alarm)
+            cursor.execute(f'''
+                SELECT a.id, a.module_id, a.alarm_type, a.description, a.timestamp,
+                       a.acknowledged, a.acknowledged_by, a.acknowledged_at,
+                       m.name AS module_name
                 FROM alarms a
-                JOIN modules m ON a.id = m.id
-                WHERE a.acknowledged = 0
-                ORDER BY a.timestamp DESC
-            ''')
+                LEFT JOIN modules m ON a.module_id = m.id
+                WHERE {where}
+                ORDER BY a.timestamp DESC, a.id DESC
+            ''', params)
             return cursor.fetchall()
         except sqlite3.Error as e:
             logging.error(f"Failed to get active alarms: {e}")
             return []
     
+    # ===== EVIDENCIAS =====
+
+    def attach_evidence(self, alarm_id, source, name=None, content_type=None):
+        """
+        Store a snapshot or clip for an alarm in the evidence store.
+
+        `source` may be bytes, a file path, a binary file object or an
+        iterable of chunks; it is streamed to disk, never loaded whole.
+        Returns the content hash, or None on failure.
+        """
+        if not self.evidence:
+            logging.warning("Evidence store is not enabled.")
+            return None
+        try:
+            digest = self.evidence.put(source, alarm_id=alarm_id, name=name, content_type=content_type)
+            logging.info(f"Evidence {digest[:12]} attached to alarm {alarm_id}.")
+            return digest
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Failed to attach evidence to alarm {alarm_id}: {e}")
+            return None
+
+    def get_evidence(self, alarm_id):
+        """List the evidence attached to an alarm (evidence.Evidence tuples)."""
+        if not self.evidence:
+            return []
+        try:
+            return self.evidence.for_alarm(alarm_id)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get evidence for alarm {alarm_id}: {e}")
+            return []
+
+    def _unacknowledged_alarm_ids(self):
+        """Alarms whose evidence must survive eviction (own connection: any thread)."""
+        connection = self.open_connection()
+        try:
+            return [alarm_id for alarm_id, in connection.execute(
+                "SELECT id FROM alarms WHERE acknowledged = 0")]
+        finally:
+            connection.close()
+
+    def export_alarms(self, path, fmt='csv', start=None, end=None,
+                      progress=None, cancel_event=None, batch_size=1000):
+        """
+        Stream alarms in [start, end) to a 'csv', 'jsonl' or 'columnar' file.
+        
+        Uses its own connection, so it can run in a worker thread. Raises
+        ExportCancelled if cancel_event is set during the export.
+        """
+        connection = self.open_connection()
+        try:
+            return _export_alarms(connection, path, fmt, start, end, batch_size,
+                                  progress, cancel_event)
+        except ExportCancelled:
+            raise
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Failed to export alarms: {e}")
+            return None
+        finally:
+            connection.close()
+    
     # ===== MÉTODOS DE UTILIDAD =====
+
+    def _commit(self):
+        """Commit the main connection and report the written rows to the checkpointer."""
+        self.connection.commit()
+        total = self.connection.total_changes
+        self._note_changes(total - self._committed_changes)
+        self._committed_changes = total
+
+    def _note_changes(self, count):
+        if self.checkpoint:
+            self.checkpoint.note_changes(count)
+
+    def open_connection(self):
+        """Open an independent connection to the same database (for background workers)."""
+        if self.profiler:
+            connection = sqlite3.connect(self.database_path, timeout=10,
+                                         factory=self.profiler.connection_factory())
+        else:
+            connection = sqlite3.connect(self.database_path, timeout=10)
+        if self.durability:
+            durability_profiles.apply(connection, self.durability)
+        return connection
+
+    def get_durability_status(self):
+        """Durability profile, effective pragmas and the data-loss window of the in-memory mode."""
+        return {
+            'profile': self.durability.name if self.durability else None,
+            'mode': 'memory' if self.checkpoint else 'disk',
+            'database_path': self.database_path,
+            'settings': durability_profiles.effective_settings(self.connection),
+            'journal_backlog': self.journal.backlog() if self.journal else None,
+            'checkpoint': self.checkpoint.status() if self.checkpoint else None,
+        }
+    
+    def get_profile_report(self):
+        """Get the collected profiling data, or None if profiling is disabled."""
+        if not self.profiler:
+            return None
+        return self.profiler.report()
+    
+    def dump_profile(self, path='alarm_profile.json'):
+        """Write the profiling report to a JSON file (see `python profiler.py`)."""
+        if not self.profiler:
+            logging.warning("Profiling is not enabled.")
+            return None
+        return self.profiler.dump(path)
     
     def close(self):
         """Close the database connection."""
+        if self.retention:
+            self.retention.stop()
+        if self.escalation:
+            self.escalation.stop()
+        if self.journal:
+            self.journal.close()
+        if self.evidence:
+            self.evidence.close()
         if self.connection:
             self.connection.close()
             logging.info("Database connection closed.")
+        if self.checkpoint:
+            self.checkpoint.stop()  # Último checkpoint a disco
     
     def __enter__(self):
         """Support for context manager."""
@@ -326,7 +783,7 @@ if __name__ == "__main__":
     active_alarms = alarm_system.get_active_alarms()
     print("Active Alarms:")
     for alarm in active_alarms:
-        print(f"  - {alarm[3]} on {alarm[7]} at {alarm[4]}")
+        print(f"  - {alarm.description} on {alarm.module_name} at {alarm.timestamp}")
     
     # Autenticar usuario
     user = alarm_system.authenticate_user("admin", "admin123")
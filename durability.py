@@ -0,0 +1,100 @@
+"""
+durability.py
+Perfiles de durabilidad/rendimiento de la BD.
+
+Cada perfil fija a la vez los pragmas de SQLite (journal_mode, synchronous,
+cache_size, mmap_size), el agrupamiento de commits del diario de eventos y,
+si procede, la copia de trabajo en memoria (checkpoint.py):
+
+- paranoid: cada commit llega al disco (WAL + synchronous=EXTRA) y cada
+  alarma se sincroniza en el diario antes de volver. No se pierde nada
+  confirmado; es el perfil más lento y el que más escribe.
+- balanced: WAL + synchronous=NORMAL; un corte de luz puede perder los
+  últimos commits pero nunca corrompe la BD. Las alarmas se vuelcan del
+  diario a la BD en lotes.
+- sd-card-saver: la BD trabaja en tmpfs y se copia a la tarjeta SD por
+  checkpoints; un corte de luz pierde como mucho la ventana del checkpoint.
+"""
+
+import logging
+from dataclasses import asdict, dataclass
+from typing import Union
+
+logger = logging.getLogger("DURABILITY")
+
+
+@dataclass(frozen=True)
+class DurabilityProfile:
+    name: str
+    journal_mode: str          # PRAGMA journal_mode (persistente en la BD)
+    synchronous: str           # PRAGMA synchronous (por conexión)
+    cache_size_kib: int        # Caché de páginas por conexión
+    mmap_size: int             # Bytes mapeados en memoria (0 = sin mmap)
+    journal_sync: bool         # msync de cada alarma en el diario de eventos
+    journal_batch: int         # Alarmas por transacción al volcar el diario
+    journal_interval: float    # Segundos entre volcados del diario
+    in_memory: bool = False    # Copia de trabajo en tmpfs con checkpoints
+    checkpoint_interval: float = 60.0
+    checkpoint_changes: int = 100
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+PROFILES = {
+    'paranoid': DurabilityProfile(
+        'paranoid', journal_mode='WAL', synchronous='EXTRA', cache_size_kib=2048, mmap_size=0,
+        journal_sync=True, journal_batch=1, journal_interval=0.05),
+    'balanced': DurabilityProfile(
+        'balanced', journal_mode='WAL', synchronous='NORMAL', cache_size_kib=8192,
+        mmap_size=32 * 1024 * 1024, journal_sync=False, journal_batch=256, journal_interval=0.5),
+    'sd-card-saver': DurabilityProfile(
+        'sd-card-saver', journal_mode='WAL', synchronous='OFF', cache_size_kib=8192,
+        mmap_size=32 * 1024 * 1024, journal_sync=False, journal_batch=1024, journal_interval=2.0,
+        in_memory=True, checkpoint_interval=300.0, checkpoint_changes=1000),
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+
+def get_profile(profile: Union[str, DurabilityProfile, None]) -> DurabilityProfile:
+    """Resolver un nombre de perfil (None = perfil por defecto)."""
+    if isinstance(profile, DurabilityProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown durability profile '{name}' "
+                         f"(expected one of {', '.join(PROFILES)})") from None
+
+
+def apply(connection, profile: DurabilityProfile):
+    """Aplicar los pragmas del perfil a una conexión (fuera de transacción)."""
+    mode = connection.execute(f"PRAGMA journal_mode = {profile.journal_mode}").fetchone()[0]
+    if mode.lower() != profile.journal_mode.lower():
+        logger.warning(f"journal_mode {profile.journal_mode} not available, using {mode}")
+    connection.execute(f"PRAGMA synchronous = {profile.synchronous}")
+    # Valor negativo: tamaño en KiB en lugar de páginas
+    connection.execute(f"PRAGMA cache_size = {-int(profile.cache_size_kib)}")
+    connection.execute(f"PRAGMA mmap_size = {int(profile.mmap_size)}")
+
+
+SYNCHRONOUS_NAMES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def effective_settings(connection) -> dict:
+    """Pragmas en vigor en una conexión (para diagnóstico)."""
+    def pragma(name):
+        return connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    cache_size = pragma('cache_size')
+    page_size = pragma('page_size')
+    mmap_row = connection.execute("PRAGMA mmap_size").fetchone()
+    return {
+        'journal_mode': pragma('journal_mode').upper(),
+        'synchronous': SYNCHRONOUS_NAMES.get(pragma('synchronous'), '?'),
+        'cache_size_kib': -cache_size if cache_size < 0 else cache_size * page_size // 1024,
+        'mmap_size': mmap_row[0] if mmap_row else 0,
+        'page_size': page_size,
+    }
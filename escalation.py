@@ -0,0 +1,303 @@
+"""
+escalation.py
+Escalado de alarmas no reconocidas.
+
+Cada tipo de alarma tiene una política: una lista de pasos ("a los 120 s
+volver a notificar", "a los 300 s activar la sirena", ...). Los pasos
+pendientes viven en una única rueda de temporizadores jerárquica: insertar
+y cancelar son O(1) y cada tick solo toca la ranura actual, así que miles
+de alarmas pendientes no cuestan nada mientras no venzan. Al reiniciar, los
+temporizadores se reconstruyen a partir de las alarmas no reconocidas de la BD;
+cada paso ejecutado se guarda en `alarms.escalation_step` para no repetirlo.
+
+Las alarmas de mantenimiento (flapping, stuck, tamper) no escalan con la
+política por defecto: solo si tienen una política propia.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from anomaly import MAINTENANCE_TYPES
+
+logger = logging.getLogger("ESCALATION")
+
+
+class EscalationStep(NamedTuple):
+    after: float   # segundos desde que se disparó la alarma
+    action: str    # nombre de la acción ('renotify', 'siren', 'call_secondary', ...)
+
+
+DEFAULT_POLICY = (
+    EscalationStep(120, 'renotify'),
+    EscalationStep(300, 'siren'),
+    EscalationStep(600, 'call_secondary'),
+)
+
+Action = Callable[[dict, EscalationStep], None]
+
+
+class WheelTimer:
+    """Temporizador de la rueda; `TimerWheel.cancel` lo anula en O(1)."""
+
+    __slots__ = ('expires', 'callback', 'args', '_slot')
+
+    def __init__(self, expires: int, callback: Callable, args: tuple):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._slot = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+
+class TimerWheel:
+    """
+    Rueda de temporizadores jerárquica.
+
+    El nivel 0 tiene `slots` ranuras de un tick; cada nivel siguiente cubre
+    `slots` veces más tiempo. Al dar la vuelta un nivel, la ranura que toca
+    del nivel superior se reparte ("cascada") en los inferiores. Con los
+    valores por defecto (tick 1 s, 64 ranuras, 4 niveles) cubre ~194 días;
+    plazos más largos se reinsertan hasta vencer.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4):
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("slots must be a power of 2")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[set]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._now = 0  # ticks transcurridos
+        self._origin = time.monotonic()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _insert(self, timer: WheelTimer):
+        remaining = timer.expires - self._now
+        level = 0
+        while level < self.levels - 1 and remaining >= 1 << (self._bits * (level + 1)):
+            level += 1
+        index = (timer.expires >> (self._bits * level)) & self._mask
+        slot = self._wheels[level][index]
+        slot.add(timer)
+        timer._slot = slot
+
+    def schedule(self, delay: float, callback: Callable, *args) -> WheelTimer:
+        """Programar `callback(*args)` dentro de `delay` segundos (redondeado al tick)."""
+        with self._lock:
+            ticks = max(1, math.ceil(delay / self.tick))
+            timer = WheelTimer(self._now + ticks, callback, args)
+            self._insert(timer)
+            self._count += 1
+        return timer
+
+    def cancel(self, timer: WheelTimer) -> bool:
+        with self._lock:
+            if timer._slot is None:
+                return False
+            timer._slot.discard(timer)
+            timer._slot = None
+            self._count -= 1
+            return True
+
+    def _cascade(self, level: int):
+        index = (self._now >> (self._bits * level)) & self._mask
+        slot = self._wheels[level][index]
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._insert(timer)
+        return index
+
+    def advance(self, now: float = None) -> int:
+        """
+        Avanzar la rueda hasta `now` (time.monotonic()) y ejecutar lo vencido.
+
+        Returns:
+            Número de temporizadores ejecutados
+        """
+        target = int(((time.monotonic() if now is None else now) - self._origin) / self.tick)
+        due = []
+        with self._lock:
+            while self._now < target:
+                self._now += 1
+                # Cascada de los niveles superiores al completar cada vuelta
+                level = 1
+                while level < self.levels and (self._now & ((1 << (self._bits * level)) - 1)) == 0:
+                    if self._cascade(level) != 0:
+                        break
+                    level += 1
+                slot = self._wheels[0][self._now & self._mask]
+                for timer in list(slot):
+                    if timer.expires <= self._now:
+                        slot.discard(timer)
+                        timer._slot = None
+                        self._count -= 1
+                        due.append(timer)
+        for timer in due:
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logger.error(f"Timer callback failed: {e}")
+        return len(due)
+
+
+class EscalationScheduler:
+    """
+    Escala las alarmas que siguen sin reconocer según su política.
+
+    AlarmCore llama a `schedule_alarm` al disparar una alarma y a `cancel`
+    al reconocerla. Solo el siguiente paso de cada alarma está en la rueda.
+    """
+
+    def __init__(self, connect: Callable = None,
+                 policies: Optional[Dict[str, Sequence[EscalationStep]]] = None,
+                 actions: Optional[Dict[str, Action]] = None,
+                 wheel: Optional[TimerWheel] = None):
+        """
+        Args:
+            connect: Abre una conexión propia a la BD (p. ej. core.open_connection)
+            policies: {alarm_type: pasos}; la clave '*' es la política por defecto
+            actions: {nombre: callable(alarma, paso)}; las que falten solo se registran en el log
+        """
+        self.connect = connect
+        self.policies = {'*': DEFAULT_POLICY}
+        self.policies.update({k: tuple(sorted(v)) for k, v in (policies or {}).items()})
+        self.actions: Dict[str, Action] = dict(actions or {})
+        self.wheel = wheel or TimerWheel()
+        self._pending: Dict[int, WheelTimer] = {}  # alarm_id -> siguiente paso
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def policy_for(self, alarm_type: str) -> Sequence[EscalationStep]:
+        return self.policies.get(alarm_type, self.policies['*'])
+
+    def schedule_alarm(self, alarm_id: int, module_id: int = None, alarm_type: str = '',
+                       description: str = '', age: float = 0.0, catch_up: bool = False,
+                       done: int = 0):
+        """
+        Programar el escalado de una alarma.
+
+        Args:
+            age: Segundos transcurridos desde que se disparó
+            catch_up: Ejecutar el último paso ya vencido (tras un reinicio)
+            done: Pasos ya ejecutados antes del reinicio (no se repiten)
+        """
+        if alarm_type in MAINTENANCE_TYPES and alarm_type not in self.policies:
+            return
+        alarm = {'id': alarm_id, 'module_id': module_id, 'alarm_type': alarm_type,
+                 'description': description}
+        steps = self.policy_for(alarm_type)
+        overdue = [i for i, step in enumerate(steps) if step.after <= age]
+        if catch_up and overdue and overdue[-1] >= done:
+            self._run_step(alarm, steps, overdue[-1], age, schedule_next=False)
+        self._schedule_step(alarm, steps, max(len(overdue), done), age)
+
+    def _schedule_step(self, alarm: dict, steps, index: int, age: float):
+        if index >= len(steps):
+            with self._lock:
+                self._pending.pop(alarm['id'], None)
+            return
+        timer = self.wheel.schedule(steps[index].after - age, self._run_step,
+                                    alarm, steps, index, steps[index].after)
+        with self._lock:
+            previous = self._pending.get(alarm['id'])
+            self._pending[alarm['id']] = timer
+        if previous is not None and previous is not timer:
+            self.wheel.cancel(previous)
+
+    def _run_step(self, alarm: dict, steps, index: int, age: float, schedule_next: bool = True):
+        step = steps[index]
+        logger.warning(f"Alarm {alarm['id']} unacknowledged after {step.after:.0f}s: {step.action}")
+        action = self.actions.get(step.action)
+        if action:
+            try:
+                action(alarm, step)
+            except Exception as e:
+                logger.error(f"Escalation action '{step.action}' failed for alarm {alarm['id']}: {e}")
+        self._save_step(alarm['id'], index + 1)
+        if schedule_next:
+            self._schedule_step(alarm, steps, index + 1, age)
+
+    def _save_step(self, alarm_id: int, done: int):
+        """Guardar cuántos pasos se ejecutaron (nunca hacia atrás)."""
+        if self.connect is None:
+            return
+        try:
+            connection = self.connect()
+            try:
+                connection.execute("UPDATE alarms SET escalation_step = ? WHERE id = ? AND escalation_step < ?",
+                                   (done, alarm_id, done))
+                connection.commit()
+            finally:
+                connection.close()
+        except Exception as e:
+            logger.error(f"Failed to save escalation step of alarm {alarm_id}: {e}")
+
+    def cancel(self, alarm_id: int) -> bool:
+        """Anular el escalado pendiente de una alarma (O(1))."""
+        with self._lock:
+            timer = self._pending.pop(alarm_id, None)
+        return timer is not None and self.wheel.cancel(timer)
+
+    def cancel_many(self, alarm_ids) -> int:
+        return sum(1 for alarm_id in alarm_ids if self.cancel(alarm_id))
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def rebuild(self, catch_up: bool = True) -> int:
+        """
+        Reconstruir los temporizadores desde las alarmas no reconocidas de la BD.
+
+        Con `catch_up` se ejecuta el último paso que venció con el sistema
+        parado, salvo que ya se hubiera ejecutado antes de parar.
+        """
+        if self.connect is None:
+            return 0
+        connection = self.connect()
+        try:
+            # La antigüedad la calcula SQLite: `timestamp` está en UTC
+            rows = connection.execute('''
+                SELECT id, module_id, alarm_type, description,
+                       (julianday('now') - julianday(timestamp)) * 86400.0, escalation_step
+                FROM alarms
+                WHERE acknowledged = 0
+            ''').fetchall()
+        finally:
+            connection.close()
+        for alarm_id, module_id, alarm_type, description, age, done in rows:
+            self.schedule_alarm(alarm_id, module_id, alarm_type, description or '',
+                                max(0.0, age or 0.0), catch_up=catch_up, done=done or 0)
+        logger.info(f"Escalation rebuilt for {len(rows)} unacknowledged alarm(s)")
+        return len(rows)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="escalation", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.wheel.tick):
+            self.wheel.advance()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
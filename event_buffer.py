@@ -0,0 +1,81 @@
+"""
+event_buffer.py
+Últimos eventos del sistema en memoria.
+
+Anillo de capacidad fija con los N eventos más recientes (alarmas,
+reconocimientos, cambios de estado de módulos y de sensores). AlarmCore e
+IOManager escriben en él; la vista "Last events", la barra de estado y los
+clientes remotos leen instantáneas baratas o esperan a eventos nuevos sin
+tocar la base de datos.
+"""
+
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+# Tipos de evento
+ALARM = 'alarm'
+ACKNOWLEDGE = 'acknowledge'
+MODULE_STATUS = 'module_status'
+SENSOR = 'sensor'
+
+
+class Event(NamedTuple):
+    seq: int          # secuencia global, creciente
+    timestamp: float  # epoch
+    kind: str
+    module_id: Optional[int]
+    detail: str
+    data: dict = {}
+
+
+class RecentEvents:
+    """
+    Anillo de los últimos `capacity` eventos.
+
+    La sección crítica de `append` es una asignación en una lista
+    preasignada; los lectores copian como mucho `capacity` referencias.
+    """
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self._ring: List[Optional[Event]] = [None] * capacity
+        self._seq = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def append(self, kind: str, module_id: Optional[int] = None, detail: str = "", **data) -> Event:
+        with self._cond:
+            self._seq += 1
+            event = Event(self._seq, time.time(), kind, module_id, detail, data)
+            self._ring[self._seq % self.capacity] = event
+            self._cond.notify_all()
+        return event
+
+    def _collect(self, since: int, limit: Optional[int]) -> List[Event]:
+        first = max(since + 1, self._seq - self.capacity + 1, 1)
+        if limit is not None:
+            first = max(first, self._seq - limit + 1)
+        return [self._ring[i % self.capacity] for i in range(first, self._seq + 1)]
+
+    def snapshot(self, since: int = 0, limit: Optional[int] = None) -> List[Event]:
+        """Eventos con secuencia > `since`, del más antiguo al más reciente."""
+        with self._cond:
+            return self._collect(since, limit)
+
+    def latest(self) -> Optional[Event]:
+        with self._cond:
+            return self._ring[self._seq % self.capacity] if self._seq else None
+
+    def wait_for(self, since: int, timeout: Optional[float] = None) -> List[Event]:
+        """
+        Bloquear hasta que haya eventos con secuencia > `since` (o venza el
+        plazo) y devolverlos. Si el lector se quedó atrás más de `capacity`
+        eventos, recibe solo los que siguen en el anillo.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > since, timeout)
+            return self._collect(since, None)
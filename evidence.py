@@ -0,0 +1,423 @@
+"""
+evidence.py
+Almacén de evidencias de alarmas (capturas, clips) direccionado por contenido.
+
+Los archivos viven fuera de la BD de alarmas, en `objects/ab/<sha256>`: un
+mismo contenido se guarda una sola vez aunque se adjunte a varias alarmas.
+La escritura es en streaming (por bloques, calculando el hash sobre la
+marcha) a un temporal en el mismo sistema de archivos, con fsync y
+os.replace; un corte de luz nunca deja un objeto a medias.
+
+Un índice SQLite propio (`index.db`) guarda tamaño, tipo y último acceso de
+cada objeto y sus enlaces a IDs de alarma. El espacio queda acotado:
+primero caducan los objetos más antiguos que `max_age_days` y después se
+expulsan los de acceso menos reciente (LRU) hasta bajar de `max_bytes`.
+Las evidencias de alarmas devueltas por `protect` (p. ej. las aún sin
+reconocer) no se expulsan. Un objeto mayor que `max_bytes` se rechaza al
+escribirlo (EvidenceTooLarge): nunca cabría y expulsaría todo lo demás.
+
+    python evidence.py --root evidence --usage
+    python evidence.py --root evidence --attach 42 snapshot.jpg
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger("EVIDENCE")
+
+CHUNK_SIZE = 64 * 1024
+TMP_GRACE = 3600.0  # Segundos sin tocar tras los que un temporal se da por abandonado
+
+
+class EvidenceTooLarge(ValueError):
+    """El objeto supera `max_bytes` del almacén."""
+
+
+class Evidence(NamedTuple):
+    hash: str
+    size: int
+    content_type: Optional[str]
+    name: Optional[str]
+    attached: float       # epoch del enlace a la alarma
+
+
+class EvidenceWriter:
+    """
+    Escritura en streaming de un objeto: ``write`` por bloques y ``commit``.
+
+    Se usa como context manager; si el bloque falla el temporal se descarta.
+    """
+
+    def __init__(self, store: "EvidenceStore", alarm_id: Optional[int] = None,
+                 name: Optional[str] = None, content_type: Optional[str] = None):
+        self.store = store
+        self.alarm_id = alarm_id
+        self.name = name
+        self.content_type = content_type
+        self.size = 0
+        self.hash = None
+        self._digest = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(prefix='upload-', dir=store.tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        self._check_size()
+        self._digest.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def _check_size(self):
+        if self.size > self.store.max_bytes:
+            self.abort()
+            raise EvidenceTooLarge(f"Evidence exceeds {self.store.max_bytes} bytes")
+
+    def commit(self) -> str:
+        """Cerrar, mover a su dirección definitiva e indexar; devuelve el hash."""
+        self._check_size()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.hash = self._digest.hexdigest()
+        self.store._store(self._tmp_path, self.hash, self.size, self.content_type,
+                          self.alarm_id, self.name)
+        return self.hash
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self.hash is None:
+            self.commit()
+        elif exc_type is not None:
+            self.abort()
+
+
+class EvidenceStore:
+    """Objetos por hash SHA-256 con índice propio, enlaces a alarmas y expulsión LRU/antigüedad."""
+
+    def __init__(self, root: str = 'evidence', max_bytes: int = 512 * 1024 * 1024,
+                 max_age_days: Optional[float] = 30, chunk_size: int = CHUNK_SIZE,
+                 protect: Optional[Callable[[], Iterable[int]]] = None,
+                 age_check_interval: float = 3600.0, tmp_grace: float = TMP_GRACE):
+        """
+        Args:
+            root: Directorio del almacén (objetos, temporales e índice)
+            max_bytes: Tamaño máximo del contenido almacenado
+            max_age_days: Antigüedad a partir de la cual caduca un objeto (None = nunca)
+            protect: Devuelve los IDs de alarma cuyas evidencias no se pueden expulsar
+            age_check_interval: Segundos mínimos entre barridos de antigüedad al escribir
+            tmp_grace: Antigüedad mínima (s) de un temporal para borrarlo al abrir
+        """
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.chunk_size = chunk_size
+        self.protect = protect
+        self.age_check_interval = age_check_interval
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # Temporales de escrituras interrumpidas; los recientes pueden ser de
+        # otro proceso que comparte el almacén y escribe en este momento
+        cutoff = time.time() - tmp_grace
+        for leftover in os.listdir(self.tmp_dir):
+            leftover = os.path.join(self.tmp_dir, leftover)
+            try:
+                if os.path.getmtime(leftover) < cutoff:
+                    os.unlink(leftover)
+            except FileNotFoundError:
+                pass
+
+        # Índice compartido entre hilos (cámaras, GUI, API) bajo un lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+        self._total = self._db.execute("SELECT IFNULL(SUM(size), 0) FROM blobs").fetchone()[0]
+        self._last_age_check = 0.0
+
+    def _create_tables(self):
+        with self._db:
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    content_type TEXT,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs(accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_blobs_created ON blobs(created)")
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS links (
+                    alarm_id INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    name TEXT,
+                    attached REAL NOT NULL,
+                    PRIMARY KEY (alarm_id, hash)
+                ) WITHOUT ROWID
+            ''')
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_links_hash ON links(hash)")
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    # ===== ESCRITURA =====
+
+    def writer(self, alarm_id: Optional[int] = None, name: Optional[str] = None,
+               content_type: Optional[str] = None) -> EvidenceWriter:
+        """Escritor incremental, p. ej. para una cámara que entrega un clip por trozos."""
+        return EvidenceWriter(self, alarm_id, name, content_type)
+
+    def put(self, source, alarm_id: Optional[int] = None, name: Optional[str] = None,
+            content_type: Optional[str] = None) -> str:
+        """
+        Guardar una evidencia y, opcionalmente, enlazarla a una alarma.
+
+        Args:
+            source: bytes, ruta de archivo, objeto con `read()` o iterable de bloques
+
+        Returns:
+            Hash SHA-256 (hex) del contenido
+        """
+        with self.writer(alarm_id, name, content_type) as writer:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                writer.write(bytes(source))
+            elif isinstance(source, str):
+                if name is None:
+                    writer.name = os.path.basename(source)
+                with open(source, 'rb') as f:
+                    self._copy(f, writer)
+            elif hasattr(source, 'read'):
+                self._copy(source, writer)
+            else:
+                for chunk in source:
+                    writer.write(chunk)
+            return writer.commit()
+
+    def _copy(self, f, writer: EvidenceWriter):
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                break
+            writer.write(chunk)
+
+    def _store(self, tmp_path: str, digest: str, size: int, content_type: Optional[str],
+               alarm_id: Optional[int], name: Optional[str]):
+        """Mover el temporal a su dirección (o descartarlo si ya existe) e indexarlo."""
+        target = self.path(digest)
+        now = time.time()
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if known and os.path.exists(target):
+                os.unlink(tmp_path)  # Duplicado: solo se actualiza el acceso
+            else:
+                directory = os.path.dirname(target)
+                os.makedirs(directory, exist_ok=True)
+                os.replace(tmp_path, target)
+                _fsync_directory(directory)
+            with self._db:
+                if known:
+                    self._db.execute("UPDATE blobs SET accessed = ? WHERE hash = ?", (now, digest))
+                else:
+                    self._db.execute('''
+                        INSERT INTO blobs (hash, size, content_type, created, accessed)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (digest, size, content_type, now, now))
+                    self._total += size
+                if alarm_id is not None:
+                    self._link(alarm_id, digest, name, now)
+        logger.debug(f"Stored {digest[:12]} ({size} bytes){' (duplicate)' if known else ''}")
+        if self._total > self.max_bytes or now - self._last_age_check >= self.age_check_interval:
+            self.evict(keep=(digest,))
+
+    # ===== ENLACES =====
+
+    def _link(self, alarm_id: int, digest: str, name: Optional[str], now: float):
+        self._db.execute('''
+            INSERT INTO links (alarm_id, hash, name, attached) VALUES (?, ?, ?, ?)
+            ON CONFLICT(alarm_id, hash) DO UPDATE SET name = IFNULL(excluded.name, name)
+        ''', (alarm_id, digest, name, now))
+
+    def link(self, alarm_id: int, digest: str, name: Optional[str] = None) -> bool:
+        """Enlazar un objeto ya almacenado a otra alarma."""
+        with self._lock, self._db:
+            if not self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+                return False
+            self._link(alarm_id, digest, name, time.time())
+        return True
+
+    def unlink(self, alarm_id: int, digest: Optional[str] = None) -> int:
+        """Quitar enlaces de una alarma; los objetos quedan hasta que se expulsen."""
+        with self._lock, self._db:
+            if digest is None:
+                cursor = self._db.execute("DELETE FROM links WHERE alarm_id = ?", (alarm_id,))
+            else:
+                cursor = self._db.execute("DELETE FROM links WHERE alarm_id = ? AND hash = ?",
+                                          (alarm_id, digest))
+            return cursor.rowcount
+
+    def for_alarm(self, alarm_id: int) -> List[Evidence]:
+        with self._lock:
+            rows = self._db.execute('''
+                SELECT b.hash, b.size, b.content_type, l.name, l.attached
+                FROM links l JOIN blobs b ON b.hash = l.hash
+                WHERE l.alarm_id = ?
+                ORDER BY l.attached
+            ''', (alarm_id,)).fetchall()
+        return [Evidence(*row) for row in rows]
+
+    # ===== LECTURA =====
+
+    def contains(self, digest: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def open(self, digest: str):
+        """Abrir un objeto en binario para leerlo en streaming (cuenta como acceso para LRU)."""
+        with self._lock, self._db:
+            cursor = self._db.execute("UPDATE blobs SET accessed = ? WHERE hash = ?", (time.time(), digest))
+            if not cursor.rowcount:
+                raise KeyError(digest)
+        return open(self.path(digest), 'rb')
+
+    def usage(self) -> dict:
+        with self._lock:
+            blobs, links = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM blobs), (SELECT COUNT(*) FROM links)").fetchone()
+        return {'blobs': blobs, 'links': links, 'bytes': self._total, 'max_bytes': self.max_bytes}
+
+    # ===== EXPULSIÓN =====
+
+    def _protected_hashes(self) -> set:
+        if self.protect is None:
+            return set()
+        try:
+            alarm_ids = [int(alarm_id) for alarm_id in self.protect()]
+        except Exception as e:
+            logger.error(f"Evidence protect callback failed: {e}")
+            return set()
+        rows = self._db.execute('''
+            SELECT DISTINCT hash FROM links
+            WHERE alarm_id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(alarm_ids),)).fetchall()
+        return {digest for digest, in rows}
+
+    def evict(self, now: Optional[float] = None, keep: Iterable[str] = ()) -> dict:
+        """
+        Expulsar objetos caducados y, si aún se supera `max_bytes`, los de
+        acceso menos reciente.
+
+        Returns:
+            Diccionario con objetos expulsados por antigüedad y por LRU y bytes liberados
+        """
+        now = now or time.time()
+        expired, lru, freed = [], [], 0
+        with self._lock:
+            self._last_age_check = now
+            skip = set(keep)
+            protected = None
+            if self.max_age_days is not None:
+                cutoff = now - self.max_age_days * 86400
+                candidates = self._db.execute(
+                    "SELECT hash, size FROM blobs WHERE created < ? ORDER BY created", (cutoff,)).fetchall()
+                if candidates:
+                    protected = self._protected_hashes()
+                    expired = [(digest, size) for digest, size in candidates
+                               if digest not in skip and digest not in protected]
+                    skip.update(digest for digest, _ in expired)
+            excess = self._total - sum(size for _, size in expired) - self.max_bytes
+            if excess > 0:
+                if protected is None:
+                    protected = self._protected_hashes()
+                for digest, size in self._db.execute("SELECT hash, size FROM blobs ORDER BY accessed"):
+                    if excess <= 0:
+                        break
+                    if digest in skip or digest in protected:
+                        continue
+                    lru.append((digest, size))
+                    excess -= size
+            for digest, size in expired + lru:
+                freed += self._delete(digest, size)
+        if expired or lru:
+            logger.info(f"Evicted {len(expired)} expired and {len(lru)} least recently used "
+                        f"evidence object(s), {freed} bytes")
+        return {'expired': len(expired), 'lru': len(lru), 'bytes_freed': freed}
+
+    def _delete(self, digest: str, size: int) -> int:
+        """Borrar un objeto y sus enlaces (con el lock tomado)."""
+        with self._db:
+            self._db.execute("DELETE FROM links WHERE hash = ?", (digest,))
+            self._db.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+        self._total -= size
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove evidence {digest[:12]}: {e}")
+        return size
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _fsync_directory(directory: str):
+    """Persistir la entrada del directorio tras os.replace (no disponible en Windows)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the alarm evidence store")
+    parser.add_argument("--root", default="evidence")
+    parser.add_argument("--attach", nargs=2, metavar=("ALARM_ID", "FILE"), help="Store FILE for an alarm")
+    parser.add_argument("--list", type=int, metavar="ALARM_ID", help="List evidence of an alarm")
+    parser.add_argument("--evict", action="store_true", help="Run age/LRU eviction")
+    parser.add_argument("--usage", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = EvidenceStore(args.root)
+    try:
+        if args.attach:
+            print(store.put(args.attach[1], alarm_id=int(args.attach[0])))
+        if args.list is not None:
+            for item in store.for_alarm(args.list):
+                print(f"{item.hash}  {item.size:>10}  {item.content_type or '-'}  {item.name or ''}")
+        if args.evict:
+            print(store.evict())
+        if args.usage:
+            print(store.usage())
+    finally:
+        store.close()
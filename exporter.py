@@ -0,0 +1,269 @@
+"""
+exporter.py
+Exportación en streaming del registro de alarmas a CSV, JSONL o a un
+formato columnar binario compacto (.almc).
+
+Las filas se leen por bloques con paginación por clave (timestamp, id), de
+modo que la memoria usada es constante y la base de datos no queda
+bloqueada para los escritores durante toda la exportación.
+"""
+
+import csv
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from array import array
+from typing import Callable, Iterator, List, Optional
+
+logger = logging.getLogger("EXPORTER")
+
+FORMATS = ('csv', 'jsonl', 'columnar')
+
+EXPORT_COLUMNS = ('id', 'timestamp', 'module_id', 'module_name',
+                  'alarm_type', 'description', 'acknowledged')
+
+COLUMNAR_MAGIC = b'ALMC'
+COLUMNAR_VERSION = 1
+
+
+class ExportCancelled(Exception):
+    """La exportación fue cancelada por el usuario."""
+
+
+# ===== ESCRITORES =====
+
+class CsvExportWriter:
+    def __init__(self, f, columns):
+        self.writer = csv.writer(f)
+        self.writer.writerow(columns)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class JsonlExportWriter:
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+
+    def write_batch(self, rows):
+        columns = self.columns
+        self.f.write("".join(json.dumps(dict(zip(columns, row)), default=str) + "\n"
+                             for row in rows))
+
+    def close(self):
+        pass
+
+
+class ColumnarExportWriter:
+    """
+    Formato columnar por grupos de filas:
+
+        cabecera: b'ALMC' | u8 versión | u16 ncols | (u16 len + nombre utf-8) * ncols
+        grupo:    u32 nfilas | por columna: u8 tipo | u32 len | bloque zlib
+        final:    u32 0
+
+    Tipos: 'q' enteros de 64 bits, 'd' reales, 's' texto (longitudes u32 + bytes).
+    Cada bloque empieza con un mapa de nulos de un byte por fila.
+    """
+
+    def __init__(self, f, columns):
+        self.f = f
+        self.columns = columns
+        header = [COLUMNAR_MAGIC, struct.pack('<BH', COLUMNAR_VERSION, len(columns))]
+        for name in columns:
+            encoded = name.encode('utf-8')
+            header.append(struct.pack('<H', len(encoded)) + encoded)
+        f.write(b''.join(header))
+
+    def write_batch(self, rows):
+        if not rows:
+            return
+        out = [struct.pack('<I', len(rows))]
+        for index in range(len(self.columns)):
+            tag, payload = _encode_column([row[index] for row in rows])
+            block = zlib.compress(payload, 6)
+            out.append(struct.pack('<cI', tag, len(block)) + block)
+        self.f.write(b''.join(out))
+
+    def close(self):
+        self.f.write(struct.pack('<I', 0))
+
+
+def _encode_column(values):
+    nulls = bytes(1 if v is None else 0 for v in values)
+    present = [v for v in values if v is not None]
+
+    if all(isinstance(v, int) for v in present):
+        return b'q', nulls + array('q', (0 if v is None else v for v in values)).tobytes()
+    if all(isinstance(v, (int, float)) for v in present):
+        return b'd', nulls + array('d', (0.0 if v is None else v for v in values)).tobytes()
+
+    encoded = [b'' if v is None else str(v).encode('utf-8') for v in values]
+    lengths = array('I', (len(e) for e in encoded))
+    return b's', nulls + lengths.tobytes() + b''.join(encoded)
+
+
+def _decode_column(tag, payload, count):
+    nulls = payload[:count]
+    body = payload[count:]
+    if tag == b'q' or tag == b'd':
+        values = array(tag.decode())
+        values.frombytes(body)
+    else:
+        lengths = array('I')
+        lengths.frombytes(body[:4 * count])
+        offset = 4 * count
+        values = []
+        for length in lengths:
+            values.append(body[offset:offset + length].decode('utf-8'))
+            offset += length
+    return [None if nulls[i] else values[i] for i in range(count)]
+
+
+def read_columnar(path: str) -> Iterator[dict]:
+    """Leer un archivo .almc fila a fila (un grupo de filas en memoria a la vez)."""
+    with open(path, 'rb') as f:
+        if f.read(4) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar alarm export")
+        version, ncols = struct.unpack('<BH', f.read(3))
+        if version != COLUMNAR_VERSION:
+            raise ValueError(f"Unsupported columnar version {version}")
+        columns = []
+        for _ in range(ncols):
+            (length,) = struct.unpack('<H', f.read(2))
+            columns.append(f.read(length).decode('utf-8'))
+
+        while True:
+            (count,) = struct.unpack('<I', f.read(4))
+            if count == 0:
+                return
+            data = []
+            for _ in range(ncols):
+                tag, length = struct.unpack('<cI', f.read(5))
+                data.append(_decode_column(tag, zlib.decompress(f.read(length)), count))
+            for i in range(count):
+                yield {name: data[c][i] for c, name in enumerate(columns)}
+
+
+# ===== EXPORTACIÓN =====
+
+def iter_alarm_batches(connection, start: Optional[str] = None, end: Optional[str] = None,
+                       batch_size: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Recorrer las alarmas del rango [start, end) en bloques de `batch_size`.
+
+    Cada bloque es una consulta independiente que continúa desde la última
+    clave (timestamp, id), por lo que no se mantiene abierto ningún cursor
+    entre bloques.
+    """
+    conditions = []
+    params = []
+    if start:
+        conditions.append("a.timestamp >= ?")
+        params.append(start)
+    if end:
+        conditions.append("a.timestamp < ?")
+        params.append(end)
+
+    last_key = None
+    while True:
+        where = list(conditions)
+        query_params = list(params)
+        if last_key is not None:
+            where.append("(a.timestamp, a.id) > (?, ?)")
+            query_params.extend(last_key)
+
+        cursor = connection.cursor()
+        cursor.execute(f'''
+            SELECT a.id, a.timestamp, a.module_id, m.name, a.alarm_type,
+                   a.description, a.acknowledged
+            FROM alarms a
+            LEFT JOIN modules m ON a.module_id = m.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY a.timestamp, a.id
+            LIMIT ?
+        ''', query_params + [batch_size])
+        rows = cursor.fetchmany(batch_size)
+        cursor.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last_key = (rows[-1][1], rows[-1][0])
+
+
+def count_alarms(connection, start: Optional[str] = None, end: Optional[str] = None) -> int:
+    conditions = []
+    params = []
+    if start:
+        conditions.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        conditions.append("timestamp < ?")
+        params.append(end)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    return connection.execute(f"SELECT COUNT(*) FROM alarms {where}", params).fetchone()[0]
+
+
+def export_alarms(connection, path: str, fmt: str = 'csv', start: Optional[str] = None,
+                  end: Optional[str] = None, batch_size: int = 1000,
+                  progress: Optional[Callable[[int, int], None]] = None,
+                  cancel_event: Optional[threading.Event] = None) -> int:
+    """
+    Exportar alarmas a un archivo en streaming.
+
+    Args:
+        connection: Conexión sqlite3 a la base de datos de alarmas
+        path: Archivo de destino
+        fmt: 'csv', 'jsonl' o 'columnar'
+        start: Timestamp inicial (incluido), 'YYYY-MM-DD[ HH:MM:SS]'
+        end: Timestamp final (excluido)
+        batch_size: Filas leídas y escritas por bloque
+        progress: Callback progress(filas_exportadas, total)
+        cancel_event: Si se activa, la exportación se detiene con ExportCancelled
+
+    Returns:
+        Número de filas exportadas
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    total = count_alarms(connection, start, end)
+    exported = 0
+
+    if fmt == 'columnar':
+        f = open(path, 'wb')
+        writer = ColumnarExportWriter(f, EXPORT_COLUMNS)
+    else:
+        f = open(path, 'w', newline='', encoding='utf-8')
+        writer_cls = CsvExportWriter if fmt == 'csv' else JsonlExportWriter
+        writer = writer_cls(f, EXPORT_COLUMNS)
+
+    try:
+        for rows in iter_alarm_batches(connection, start, end, batch_size):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled(f"Export cancelled after {exported} rows")
+            writer.write_batch(rows)
+            exported += len(rows)
+            if progress:
+                progress(exported, max(total, exported))
+        writer.close()
+    except ExportCancelled:
+        f.close()
+        # No dejar archivos a medias
+        os.remove(path)
+        logger.info(f"Export to {path} cancelled after {exported} rows")
+        raise
+    finally:
+        f.close()
+
+    logger.info(f"Exported {exported} alarms to {path} ({fmt})")
+    return exported
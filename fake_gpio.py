@@ -0,0 +1,379 @@
+"""
+fake_gpio.py
+Sustituto de `RPi.GPIO` para probar y medir el camino de hardware real.
+
+En modo simulación IOManager usa el backend en memoria y nunca pasa por
+`GPIO.setup`, `add_event_detect` ni `_gpio_event_callback`. `FakeGPIO`
+implementa la API de RPi.GPIO (modos, pull-ups/downs, detección de
+flancos con bouncetime, un único hilo de callbacks como la librería real)
+y añade el lado del "mundo exterior": `drive` fija el nivel de una
+entrada y `generate_edges` produce miles de flancos por segundo desde un
+hilo propio.
+
+Uso:
+    gpio = FakeGPIO()
+    io = IOManager(backend=RPiGPIOBackend(gpio))     # inyectado
+    # o bien, para código que hace `import RPi.GPIO`:
+    install(gpio)
+"""
+
+import queue
+import sys
+import threading
+import time
+import types
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+Channels = Union[int, Iterable[int]]
+
+
+class _Pin:
+    __slots__ = ('direction', 'pull', 'driven', 'output', 'edge', 'bouncetime',
+                 'callbacks', 'last_accepted', 'detected')
+
+    def __init__(self, direction: int, pull: int):
+        self.direction = direction
+        self.pull = pull
+        self.driven: Optional[int] = None   # Nivel impuesto desde fuera (None = flotante)
+        self.output = 0
+        self.edge: Optional[int] = None     # Detección de flancos activa
+        self.bouncetime = 0.0               # segundos
+        self.callbacks: List[Callable] = []
+        self.last_accepted = float('-inf')
+        self.detected = False
+
+
+class FakeGPIO:
+    """Instancia con la misma interfaz que el módulo RPi.GPIO."""
+
+    # Constantes de RPi.GPIO
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    VERSION = '0.7.1-fake'
+    RPI_INFO = {'P1_REVISION': 3, 'REVISION': 'fake', 'TYPE': 'Fake', 'MANUFACTURER': 'none',
+                'PROCESSOR': 'none', 'RAM': 'none'}
+
+    def __init__(self, max_channel: int = 40):
+        self.max_channel = max_channel
+        self._lock = threading.RLock()
+        self._mode: Optional[int] = None
+        self._warnings = True
+        self._pins: Dict[int, _Pin] = {}
+        # Un único hilo de callbacks, como en la librería real
+        self._queue: "queue.Queue" = queue.Queue()
+        self._callback_thread: Optional[threading.Thread] = None
+        self._generators: List[threading.Thread] = []
+        self._stop_generators = threading.Event()
+        self._queued = 0
+        self._handled = 0
+        self._idle = threading.Condition()
+        self.stats = {'edges': 0, 'accepted': 0, 'bounced': 0, 'callbacks': 0, 'callback_errors': 0}
+        self.callback_latencies: List[float] = []   # segundos entre flanco y callback
+        self.record_latency = False
+
+    # ========== API de RPi.GPIO ==========
+
+    def setmode(self, mode: int):
+        if mode not in (self.BOARD, self.BCM):
+            raise ValueError("An invalid mode was passed to setmode()")
+        if self._mode is not None and self._mode != mode:
+            raise ValueError("A different mode has already been set!")
+        self._mode = mode
+
+    def getmode(self) -> Optional[int]:
+        return self._mode
+
+    def setwarnings(self, flag: bool):
+        self._warnings = bool(flag)
+
+    def _channels(self, channel: Channels) -> List[int]:
+        channels = list(channel) if isinstance(channel, (list, tuple)) else [channel]
+        for c in channels:
+            if not isinstance(c, int) or not 0 <= c <= self.max_channel:
+                raise ValueError("The channel sent is invalid on a Raspberry Pi")
+        return channels
+
+    def _pin(self, channel: int) -> _Pin:
+        if self._mode is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) "
+                               "or GPIO.setmode(GPIO.BCM)")
+        pin = self._pins.get(channel)
+        if pin is None:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return pin
+
+    def setup(self, channel: Channels, direction: int, pull_up_down: int = PUD_OFF,
+              initial: Optional[int] = None):
+        if self._mode is None:
+            raise RuntimeError("Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) "
+                               "or GPIO.setmode(GPIO.BCM)")
+        if direction not in (self.IN, self.OUT):
+            raise ValueError("An invalid direction was passed to setup()")
+        if direction == self.OUT and pull_up_down != self.PUD_OFF:
+            raise ValueError("pull_up_down parameter is not valid for outputs")
+        with self._lock:
+            for c in self._channels(channel):
+                previous = self._pins.get(c)
+                pin = _Pin(direction, pull_up_down)
+                if previous is not None:
+                    pin.driven = previous.driven
+                if direction == self.OUT and initial is not None:
+                    pin.output = 1 if initial else 0
+                self._pins[c] = pin
+
+    def _level(self, pin: _Pin) -> int:
+        if pin.direction == self.OUT:
+            return pin.output
+        if pin.driven is not None:
+            return pin.driven
+        return self.HIGH if pin.pull == self.PUD_UP else self.LOW
+
+    def input(self, channel: int) -> int:
+        with self._lock:
+            return self._level(self._pin(channel))
+
+    def output(self, channel: Channels, value):
+        with self._lock:
+            channels = self._channels(channel)
+            values = list(value) if isinstance(value, (list, tuple)) else [value] * len(channels)
+            for c, v in zip(channels, values):
+                pin = self._pin(c)
+                if pin.direction != self.OUT:
+                    raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+                pin.output = 1 if v else 0
+
+    def add_event_detect(self, channel: int, edge: int, callback: Optional[Callable] = None,
+                         bouncetime: Optional[int] = None):
+        if edge not in (self.RISING, self.FALLING, self.BOTH):
+            raise ValueError("The edge must be set to RISING, FALLING or BOTH")
+        with self._lock:
+            pin = self._pin(channel)
+            if pin.direction != self.IN:
+                raise RuntimeError("You must setup() the GPIO channel as an input first")
+            if pin.edge is not None:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            pin.edge = edge
+            pin.bouncetime = (bouncetime or 0) / 1000.0
+            pin.callbacks = [callback] if callback else []
+            pin.detected = False
+            pin.last_accepted = float('-inf')
+        self._ensure_callback_thread()
+
+    def add_event_callback(self, channel: int, callback: Callable):
+        with self._lock:
+            pin = self._pin(channel)
+            if pin.edge is None:
+                raise RuntimeError("Add event detection using add_event_detect first before adding a callback")
+            pin.callbacks.append(callback)
+
+    def remove_event_detect(self, channel: int):
+        with self._lock:
+            pin = self._pins.get(channel)
+            if pin is not None:
+                pin.edge = None
+                pin.callbacks = []
+
+    def event_detected(self, channel: int) -> bool:
+        with self._lock:
+            pin = self._pin(channel)
+            detected, pin.detected = pin.detected, False
+            return detected
+
+    def wait_for_edge(self, channel: int, edge: int, bouncetime: Optional[int] = None,
+                      timeout: Optional[int] = None) -> Optional[int]:
+        """Bloquear hasta un flanco del tipo pedido; `timeout` en milisegundos."""
+        event = threading.Event()
+        with self._lock:
+            pin = self._pin(channel)
+            if pin.edge is not None:
+                raise RuntimeError("Conflicting edge detection events already exist for this GPIO channel")
+        self.add_event_detect(channel, edge, lambda c: event.set(), bouncetime)
+        try:
+            return channel if event.wait(None if timeout is None else timeout / 1000.0) else None
+        finally:
+            self.remove_event_detect(channel)
+
+    def gpio_function(self, channel: int) -> int:
+        with self._lock:
+            pin = self._pins.get(channel)
+            return pin.direction if pin else self.IN
+
+    def cleanup(self, channel: Optional[Channels] = None):
+        self.stop_generators()
+        with self._lock:
+            if channel is None:
+                self._pins.clear()
+                self._mode = None
+            else:
+                for c in self._channels(channel):
+                    self._pins.pop(c, None)
+        self._queue.put(None)
+        if self._callback_thread is not None and channel is None:
+            self._callback_thread.join(timeout=2)
+            self._callback_thread = None
+
+    # ========== Hilo de callbacks ==========
+
+    def _ensure_callback_thread(self):
+        if self._callback_thread is None or not self._callback_thread.is_alive():
+            self._callback_thread = threading.Thread(target=self._callback_loop,
+                                                     name="fake-gpio-callbacks", daemon=True)
+            self._callback_thread.start()
+
+    def _callback_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if self._mode is None:
+                    return
+                continue
+            channel, edge_time, callbacks = item
+            if self.record_latency:
+                self.callback_latencies.append(time.perf_counter() - edge_time)
+            for callback in callbacks:
+                try:
+                    callback(channel)
+                    self.stats['callbacks'] += 1
+                except Exception:
+                    self.stats['callback_errors'] += 1
+            with self._idle:
+                self._handled += 1
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """Esperar a que el hilo de callbacks procese todos los flancos encolados."""
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            return self._idle.wait_for(lambda: self._handled >= self._queued,
+                                       max(0.0, deadline - time.monotonic()))
+
+    def pending_callbacks(self) -> int:
+        return self._queue.qsize()
+
+    # ========== Mundo exterior ==========
+
+    def drive(self, channel: int, level: Optional[int]):
+        """
+        Imponer el nivel de una entrada (None = dejarla flotante: manda el pull).
+
+        Genera el flanco correspondiente si la detección está activa.
+        """
+        with self._lock:
+            pin = self._pin(channel)
+            before = self._level(pin)
+            pin.driven = None if level is None else (1 if level else 0)
+            after = self._level(pin)
+            if before == after or pin.edge is None:
+                return
+            self.stats['edges'] += 1
+            rising = after == self.HIGH
+            if pin.edge == self.RISING and not rising or pin.edge == self.FALLING and rising:
+                return
+            now = time.perf_counter()
+            # Igual que RPi.GPIO: se ignoran flancos dentro de `bouncetime` desde el último aceptado
+            if now - pin.last_accepted < pin.bouncetime:
+                self.stats['bounced'] += 1
+                return
+            pin.last_accepted = now
+            pin.detected = True
+            self.stats['accepted'] += 1
+            callbacks = list(pin.callbacks)
+        if callbacks:
+            with self._idle:
+                self._queued += 1
+            self._queue.put((channel, now, callbacks))
+
+    def toggle(self, channel: int):
+        with self._lock:
+            level = self._level(self._pin(channel))
+        self.drive(channel, 0 if level else 1)
+
+    def generate_edges(self, channels: Channels, rate: float, count: Optional[int] = None,
+                       duration: Optional[float] = None, wait: bool = True) -> threading.Thread:
+        """
+        Conmutar los canales a `rate` flancos por segundo en total (repartidos
+        en turno) desde un hilo, hasta `count` flancos o `duration` segundos.
+        """
+        channels = self._channels(channels)
+        if count is None and duration is None:
+            raise ValueError("count or duration is required")
+
+        def run():
+            start = time.perf_counter()
+            period = 1.0 / rate
+            i = 0
+            while not self._stop_generators.is_set():
+                if count is not None and i >= count:
+                    break
+                target = start + i * period
+                now = time.perf_counter()
+                if duration is not None and now - start >= duration:
+                    break
+                if target - now > 0.001:
+                    time.sleep(target - now)
+                try:
+                    self.toggle(channels[i % len(channels)])
+                except RuntimeError:
+                    break  # cleanup() mientras se generaban flancos
+                i += 1
+
+        self._stop_generators.clear()
+        thread = threading.Thread(target=run, name="fake-gpio-edges", daemon=True)
+        self._generators.append(thread)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def stop_generators(self):
+        self._stop_generators.set()
+        for thread in self._generators:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+        self._generators = []
+
+    def reset_stats(self):
+        for key in self.stats:
+            self.stats[key] = 0
+        self.callback_latencies = []
+
+
+# ========== Instalación como RPi.GPIO ==========
+
+_saved_modules: Dict[str, object] = {}
+
+
+def install(gpio: Optional[FakeGPIO] = None) -> FakeGPIO:
+    """
+    Registrar `gpio` como `RPi.GPIO` en sys.modules para que
+    ``import RPi.GPIO as GPIO`` lo devuelva (instalar antes de importar io_manager
+    si se quiere que `GPIO_AVAILABLE` sea True).
+    """
+    gpio = gpio or FakeGPIO()
+    for name in ('RPi', 'RPi.GPIO'):
+        if name in sys.modules and name not in _saved_modules:
+            _saved_modules[name] = sys.modules[name]
+    package = types.ModuleType('RPi')
+    package.__path__ = []
+    package.GPIO = gpio
+    sys.modules['RPi'] = package
+    sys.modules['RPi.GPIO'] = gpio
+    return gpio
+
+
+def uninstall():
+    """Quitar el sustituto y restaurar los módulos que hubiera antes."""
+    for name in ('RPi', 'RPi.GPIO'):
+        sys.modules.pop(name, None)
+        if name in _saved_modules:
+            sys.modules[name] = _saved_modules.pop(name)
@@ -2,11 +2,19 @@ import logging
 import tkinter as tk 
 from tkinter import ttk
 from datetime import datetime
-import json
-import os
 from tkinter import messagebox
 from tkinter import simpledialog
+from tkinter import filedialog
+import threading
+import getpass
+from datetime import timedelta
 from core import AlarmCore  # Importa el módulo core.py
+from exporter import ExportCancelled
+from config import get_config_manager, ConfigError
+from rules import RuleEngine
+from retention import RetentionManager
+from api_server import ApiServer
+from changefeed import ALARM_CREATED, ALARM_ACKNOWLEDGED, OVERFLOW
 
 # Configure logging
 logging.basicConfig(
@@ -28,7 +36,19 @@ class AlarmSystemGUI(tk.Tk):
         self.title("Alarm System GUI")
         self.geometry("800x600")
 
-        self.nucleo_alarma = AlarmCore()  # Instancia del núcleo de la alarma
+        # Config file path
+        self.config_file = "alarm_config.json"
+        self.system_config = None  # Instantánea inmutable (config.AlarmConfig)
+        self.load_config()
+
+        # Instancia del núcleo de la alarma, con el perfil de durabilidad configurado
+        # y el archivado periódico de alarmas antiguas
+        retention = self.system_config.retention
+        self.nucleo_alarma = AlarmCore(
+            escalation=True, journal=True, durability=self.system_config.durability,
+            retention=RetentionManager(None, retention.archive_dir, retention.max_age_days,
+                                       interval=retention.interval_hours * 3600)
+            if retention.enabled else None)
 
         # Alarm states
         self.active_alarm = False
@@ -37,51 +57,51 @@ class AlarmSystemGUI(tk.Tk):
         
         # Sensor states
         self.sensor_states = self.nucleo_alarma.get_all_modules()
-        
 
-        # Config file path
-        self.config_file = "alarm_config.json"
-        self.system_config = {}  # Cambia el nombre para evitar conflicto
-        self.load_config()
+        # Motor de reglas: zonas y modos de armado; las acciones se ejecutan en el hilo de Tk
+        self.rule_engine = RuleEngine(self.nucleo_alarma, config=self.config_manager,
+                                      scheduler=lambda fn: self.after(0, fn))
+        self.rule_engine.on_trigger = self.on_zone_triggered
+
+        # API local para clientes remotos; las escrituras pasan por el hilo de Tk.
+        # La GUI no gestiona la E/S (sin io_manager): /api/modules devuelve
+        # sensor: null y no se empujan deltas de sensores, solo el feed de cambios
+        self.api_server = None
+        api = self.system_config.api
+        if api.enabled:
+            self.api_server = ApiServer(self.nucleo_alarma, self.rule_engine, host=api.host,
+                                        port=api.port, allow_origin=api.allow_origin or None,
+                                        scheduler=lambda fn: self.after(0, fn))
+            self.api_server.start()
 
         # GUI Elements
         self.setup_interface()
 
+        # Cambios de alarmas por suscripción: el registro se refresca solo cuando hay novedades
+        self.change_subscription = self.nucleo_alarma.changes.subscribe(
+            kinds=(ALARM_CREATED, ALARM_ACKNOWLEDGED), max_pending=200)
+        self.process_changes()
+
         # Safe close
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def load_config(self):
-        config_default = {
-            "telegram_token": "",
-            "telegram_chat_id": "",
-            "alarm_duration": 60,
-            "deactivation_code": "1234",
-            "night_mode": False,
-            "email_notifications": False,
-            "email_address": "",
-            "apn_settings": {
-                "apn": "",
-                "username": "",
-                "password": ""
-            }
-        }
+        """Carga la configuración compartida y se suscribe a sus cambios"""
+        # Un único ConfigManager por archivo, compartido con IOManager y demás
+        self.config_manager = get_config_manager(self.config_file)
+        self.system_config = self.config_manager.snapshot
+        self.config_manager.subscribe(self.on_config_changed)
+        self.config_manager.start_watching()
+
+    def on_config_changed(self, old_config, new_config):
+        """Recibe la nueva instantánea tras una recarga en caliente"""
+        # Se llama desde el hilo del watcher: solo se reemplaza la referencia
+        self.system_config = new_config
 
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    self.system_config = json.load(f)  # Cambiado a system_config
-            else:
-                self.system_config = config_default
-                self.save_config()
-        except Exception as e:
-            logging.error(f"Error loading config: {e}")
-            self.system_config = config_default
-        
     def save_config(self):
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(self.system_config, f, indent=4)  # Cambiado a system_config
-        except Exception as e:
+            self.system_config = self.config_manager.save(self.system_config)
+        except (OSError, ConfigError) as e:
             logging.error(f"Error saving config: {e}")
     
     def setup_interface(self):
@@ -108,6 +128,11 @@ class AlarmSystemGUI(tk.Tk):
         self.notebook.add(self.frame_registry, text="Registry")
         self.create_registry_frame()
 
+        # Dashboard Frame
+        self.frame_dashboard = tk.Frame(self.notebook)
+        self.notebook.add(self.frame_dashboard, text="Dashboard")
+        self.create_dashboard_frame()
+
         # status bar
         self.create_status_bar()
 
@@ -120,6 +145,7 @@ class AlarmSystemGUI(tk.Tk):
         system_menu.add_command(label="Settings", command=self.open_settings_window)
         system_menu.add_command(label="Restart", command=self.restart_system)
         system_menu.add_command(label="Shutdown", command=self.shutdown_system)
+        system_menu.add_command(label="Database Status", command=self.show_database_status)
         system_menu.add_command(label="About", command=self.show_about_info)
         system_menu.add_separator()
         system_menu.add_command(label="Exit", command=self.on_close)
@@ -218,7 +244,7 @@ class AlarmSystemGUI(tk.Tk):
         self.sensor_widgets = {}
 
         for i, (sensor_id, info) in enumerate(self.sensor_states.items()):
-            frame_sensor = tk.LabelFrame(grid_frame, text=info["name"], padx=5, pady=5)
+            frame_sensor = tk.LabelFrame(grid_frame, text=info.name, padx=5, pady=5)
 
             row = i // 2
             col = i % 2
@@ -286,24 +312,40 @@ class AlarmSystemGUI(tk.Tk):
         frame_controls.pack(fill=tk.X, padx=10, pady=5)
         
         # Botones de filtrado
-        tk.Button(frame_controls, text="Today", width=10).pack(side=tk.LEFT, padx=2)
-        tk.Button(frame_controls, text="Last 7 days", width=10).pack(side=tk.LEFT, padx=2)
-        tk.Button(frame_controls, text="All", width=10).pack(side=tk.LEFT, padx=2)
-        
-        # Campo de búsqueda
+        self.registry_since = None  # None = todas las alarmas activas
+        tk.Button(frame_controls, text="Today", width=10,
+                  command=lambda: self.set_registry_range(days=0)).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame_controls, text="Last 7 days", width=10,
+                  command=lambda: self.set_registry_range(days=7)).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame_controls, text="All", width=10,
+                  command=lambda: self.set_registry_range(days=None)).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame_controls, text="Export...", width=10, command=self.export_registry).pack(side=tk.LEFT, padx=8)
+        
+        # Campo de búsqueda (módulo, tipo o descripción)
         search_frame = tk.Frame(frame_controls)
         search_frame.pack(side=tk.RIGHT)
         tk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
-        tk.Entry(search_frame, width=20).pack(side=tk.LEFT, padx=5)
-        
-        # AJUSTAR COLUMNAS según estructura de la BD
-        # Tu consulta SQL devuelve: a.* (todos campos de alarms) + m.name (como module_name)
-        # Campos típicos: id, module_id, description, priority, timestamp, acknowledged
-        columns = ("ID", "Fecha", "Hora", "Módulo", "Descripción", "Prioridad")
-        self.tree_events = ttk.Treeview(self.frame_registry, columns=columns, show="headings", height=15)
+        self.registry_search = tk.StringVar()
+        self.registry_search.trace_add("write", lambda *args: self.refresh_registry())
+        tk.Entry(search_frame, width=20, textvariable=self.registry_search).pack(side=tk.LEFT, padx=5)
+
+        # Reconocimiento de alarmas
+        frame_ack = tk.Frame(self.frame_registry)
+        frame_ack.pack(fill=tk.X, padx=10)
+        tk.Button(frame_ack, text="Acknowledge selected", width=20,
+                  command=self.acknowledge_selected).pack(side=tk.LEFT, padx=2)
+        tk.Button(frame_ack, text="Acknowledge all filtered", width=20,
+                  command=self.acknowledge_filtered).pack(side=tk.LEFT, padx=2)
+        self.label_registry_count = tk.Label(frame_ack, text="", anchor=tk.E)
+        self.label_registry_count.pack(side=tk.RIGHT)
+        
+        # Columnas a partir de los registros Alarm de get_active_alarms
+        columns = ("ID", "Fecha", "Hora", "Módulo", "Tipo", "Descripción")
+        self.tree_events = ttk.Treeview(self.frame_registry, columns=columns, show="headings",
+                                        height=15, selectmode="extended")
         
         # Configurar columnas
-        col_widths = {"ID": 50, "Fecha": 100, "Hora": 80, "Módulo": 120, "Descripción": 200, "Prioridad": 80}
+        col_widths = {"ID": 50, "Fecha": 100, "Hora": 80, "Módulo": 120, "Tipo": 90, "Descripción": 200}
         for col in columns:
             self.tree_events.heading(col, text=col)
             self.tree_events.column(col, width=col_widths.get(col, 120))
@@ -317,46 +359,254 @@ class AlarmSystemGUI(tk.Tk):
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 10), pady=10)
         
         # OBTENER Y MOSTRAR DATOS REALES
+        self.refresh_registry()
+
+    def create_dashboard_frame(self):
+        """Crea el frame de estadísticas: alarmas y MTTA por ventana (última hora, día y semana)"""
+        label_title = tk.Label(self.frame_dashboard, text="Alarm Statistics", font=("Arial", 16))
+        label_title.pack(pady=10)
+
+        # Totales por ventana
+        frame_totals = tk.Frame(self.frame_dashboard)
+        frame_totals.pack(fill=tk.X, padx=10)
+        self.dashboard_totals = {}
+        for column, window in enumerate(("hour", "day", "week")):
+            box = tk.LabelFrame(frame_totals, text=f"Last {window}")
+            box.grid(row=0, column=column, padx=5, sticky="nsew")
+            frame_totals.columnconfigure(column, weight=1)
+            label = tk.Label(box, text="-", justify=tk.LEFT, font=("Arial", 11))
+            label.pack(padx=10, pady=5, anchor=tk.W)
+            self.dashboard_totals[window] = label
+
+        # Detalle por módulo y tipo
+        columns = ("Módulo", "Tipo", "Hora", "Día", "Semana", "MTTA (día)", "MTTA (semana)")
+        self.tree_stats = ttk.Treeview(self.frame_dashboard, columns=columns, show="headings", height=12)
+        for col in columns:
+            self.tree_stats.heading(col, text=col)
+            self.tree_stats.column(col, width=140 if col in ("Módulo", "Tipo") else 80, anchor=tk.W)
+        self.tree_stats.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.dashboard_refresh_pending = False
+        self.refresh_dashboard(periodic=True)
+
+    @staticmethod
+    def format_duration(seconds):
+        """Duración legible para el MTTA"""
+        if seconds is None:
+            return "-"
+        if seconds < 60:
+            return f"{seconds:.0f} s"
+        if seconds < 3600:
+            return f"{seconds / 60:.1f} min"
+        return f"{seconds / 3600:.1f} h"
+
+    def schedule_dashboard_refresh(self):
+        """Agrupa los refrescos: con diario las alarmas llegan a la BD en lotes"""
+        if not self.dashboard_refresh_pending:
+            self.dashboard_refresh_pending = True
+            self.after(1000, self.refresh_dashboard)
+
+    def refresh_dashboard(self, periodic=False):
+        """Recarga los contadores (solo lee los buckets de cada ventana)"""
+        self.dashboard_refresh_pending = False
+        summary = self.nucleo_alarma.get_alarm_stats()
+        if summary is not None:
+            for window, label in self.dashboard_totals.items():
+                totals = summary[window]
+                label.config(text=f"Alarms: {totals['raised']}\n"
+                                  f"Acknowledged: {totals['acknowledged']}\n"
+                                  f"MTTA: {self.format_duration(totals['mtta'])}")
+
+            # Unir las tres ventanas por (módulo, tipo)
+            rows = {}
+            for window in ("hour", "day", "week"):
+                for row in summary[window]['rows']:
+                    rows.setdefault((row['module_id'], row['alarm_type']), {})[window] = row
+            modules = self.nucleo_alarma.get_all_modules()
+            self.tree_stats.delete(*self.tree_stats.get_children())
+            for (module_id, alarm_type), windows in sorted(rows.items(), key=lambda item: (item[0][0] or 0, item[0][1])):
+                module = modules.get(module_id)
+                counts = [windows[w]['raised'] if w in windows else 0 for w in ("hour", "day", "week")]
+                mtta = [self.format_duration(windows[w]['mtta']) if w in windows else "-" for w in ("day", "week")]
+                self.tree_stats.insert("", tk.END, values=(
+                    module.name if module else (module_id if module_id is not None else "-"),
+                    alarm_type, *counts, *mtta))
+        if periodic:
+            # Las ventanas se deslizan aunque no haya alarmas nuevas
+            self.after(60000, lambda: self.refresh_dashboard(periodic=True))
+
+    def process_changes(self):
+        """Aplica los cambios publicados por el núcleo (sin consultar la BD si no hay)"""
+        events = self.change_subscription.drain()
+        if events:
+            # Un desbordamiento también obliga a recargar: se perdieron eventos
+            self.refresh_registry()
+            self.schedule_dashboard_refresh()
+            created = [e for e in events if e.kind == ALARM_CREATED]
+            if created and not any(e.kind == OVERFLOW for e in events):
+                last = created[-1]
+                self.label_status.config(
+                    text=f"ALARM: {last.payload.get('alarm_type')} (module {last.module_id})", fg="red")
+        self.after(500, self.process_changes)
+
+    def set_registry_range(self, days=None):
+        """Filtra el registro: hoy (0), últimos N días o todo (None)"""
+        if days is None:
+            self.registry_since = None
+        else:
+            # Los timestamps de la BD están en UTC
+            start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+            self.registry_since = start.strftime("%Y-%m-%d %H:%M:%S")
+        self.refresh_registry()
+
+    def refresh_registry(self):
+        """Recarga las alarmas activas aplicando rango y búsqueda"""
         try:
-            real_alarm_data = self.nucleo_alarma.get_active_alarms()
-            
-            # Limpiar datos existentes en el Treeview
-            self.tree_events.delete(*self.tree_events.get_children())
-            
-            # Insertar datos reales formateados
-            if real_alarm_data:
-                for item in real_alarm_data:
-                    # Formatear los datos según la estructura de tu BD
-                    # item[0] = id, item[5] = timestamp, item[6] = module_name, etc.
-                    # Ajusta los índices según tu estructura real
-                    
-                    # Separar fecha y hora del timestamp
-                    timestamp_str = str(item[5]) if item[5] else ""
-                    fecha = timestamp_str.split()[0] if timestamp_str else ""
-                    hora = timestamp_str.split()[1] if len(timestamp_str.split()) > 1 else ""
-                    
-                    # Crear tupla con los datos para el Treeview
-                    tree_item = (
-                        item[0],        # ID
-                        fecha,          # Fecha
-                        hora,           # Hora
-                        item[6],        # module_name (índice 6 según tu consulta)
-                        item[2],        # description (ajusta según tu BD)
-                        item[3] if len(item) > 3 else ""  # priority o status
-                    )
-                    self.tree_events.insert("", tk.END, values=tree_item)
-                
-                # Mostrar mensaje informativo
-                messagebox.showinfo(
-                    "Registro de alarmas", 
-                    f"Se cargaron {len(real_alarm_data)} alarmas activas"
-                )
-            else:
-                messagebox.showinfo("Registro de alarmas", "No hay alarmas activas")
-                
+            real_alarm_data = self.nucleo_alarma.get_active_alarms(since=self.registry_since)
         except Exception as e:
             logging.error(f"Error al cargar alarmas: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar las alarmas: {e}")
+            return
+
+        search = self.registry_search.get().strip().lower()
+        self.tree_events.delete(*self.tree_events.get_children())
+        shown = 0
+        for alarm in real_alarm_data:
+            module_label = alarm.module_name or f"#{alarm.module_id}"
+            description = alarm.description or ""
+            if search and not any(search in v.lower() for v in (module_label, alarm.alarm_type, description)):
+                continue
+            # El timestamp ya viene como datetime
+            fecha = alarm.timestamp.strftime("%Y-%m-%d") if alarm.timestamp else ""
+            hora = alarm.timestamp.strftime("%H:%M:%S") if alarm.timestamp else ""
+            self.tree_events.insert("", tk.END, iid=str(alarm.id),
+                                    values=(alarm.id, fecha, hora, module_label, alarm.alarm_type, description))
+            shown += 1
+        self.label_registry_count.config(text=f"{shown} active alarm(s) shown")
+
+    def _acknowledge_ids(self, alarm_ids):
+        if not alarm_ids:
+            messagebox.showinfo("Acknowledge", "No alarms to acknowledge.")
+            return
+        if not messagebox.askyesno("Acknowledge", f"Acknowledge {len(alarm_ids)} alarm(s)?"):
+            return
+        count = self.nucleo_alarma.acknowledge_alarms(alarm_ids=alarm_ids, acknowledged_by=getpass.getuser())
+        logging.info(f"{count} alarm(s) acknowledged from the registry.")
+        self.refresh_registry()
+
+    def acknowledge_selected(self):
+        """Reconoce las alarmas seleccionadas (una sola transacción)"""
+        self._acknowledge_ids([int(iid) for iid in self.tree_events.selection()])
+
+    def acknowledge_filtered(self):
+        """Reconoce todas las alarmas visibles con el filtro actual"""
+        self._acknowledge_ids([int(iid) for iid in self.tree_events.get_children()])
+    
+    def export_registry(self):
+        """Exporta el registro de alarmas a un archivo (CSV, JSONL o columnar)"""
+        top_export = tk.Toplevel(self)
+        top_export.title("Export Alarms")
+        top_export.geometry("380x260")
+        top_export.resizable(False, False)
+        top_export.transient(self)
+        top_export.grab_set()
+
+        main_frame = tk.Frame(top_export, padx=20, pady=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        fields_frame = tk.Frame(main_frame)
+        fields_frame.pack(fill=tk.X)
+
+        # Rango de fechas
+        tk.Label(fields_frame, text="Range:", anchor="w").grid(row=0, column=0, sticky="w", pady=5)
+        range_var = tk.StringVar()
+        range_combo = ttk.Combobox(fields_frame, textvariable=range_var, width=20, state="readonly")
+        range_combo['values'] = ("Today", "Last 7 days", "Last 30 days", "All")
+        range_combo.current(1)
+        range_combo.grid(row=0, column=1, padx=10, pady=5)
+
+        # Formato
+        tk.Label(fields_frame, text="Format:", anchor="w").grid(row=1, column=0, sticky="w", pady=5)
+        format_var = tk.StringVar()
+        format_combo = ttk.Combobox(fields_frame, textvariable=format_var, width=20, state="readonly")
+        format_combo['values'] = ("csv", "jsonl", "columnar")
+        format_combo.current(0)
+        format_combo.grid(row=1, column=1, padx=10, pady=5)
+
+        # Progreso
+        progress_bar = ttk.Progressbar(main_frame, orient="horizontal", mode="determinate", length=320)
+        progress_bar.pack(pady=(15, 5))
+        progress_label = tk.Label(main_frame, text="", font=("Arial", 9))
+        progress_label.pack()
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=10)
+
+        cancel_event = threading.Event()
+        state = {"done": 0, "total": 0, "finished": False, "result": None, "error": None}
+
+        def poll_progress():
+            total = state["total"] or 1
+            progress_bar["value"] = 100.0 * state["done"] / total
+            progress_label.config(text=f"{state['done']} / {state['total']} alarms")
+            if not state["finished"]:
+                top_export.after(100, poll_progress)
+                return
+            if state["error"]:
+                messagebox.showerror("Export", state["error"], parent=top_export)
+            elif state["result"] is None:
+                messagebox.showerror("Export", "Export failed, see the log for details.", parent=top_export)
+            else:
+                messagebox.showinfo("Export", f"Exported {state['result']} alarms.", parent=top_export)
+            top_export.destroy()
+
+        def run_export(path, fmt, start):
+            def progress(done, total):
+                state["done"], state["total"] = done, total
+            try:
+                state["result"] = self.nucleo_alarma.export_alarms(
+                    path, fmt, start=start, progress=progress, cancel_event=cancel_event)
+            except ExportCancelled:
+                state["error"] = "Export cancelled."
+            except Exception as e:
+                logging.error(f"Error exporting alarms: {e}")
+                state["error"] = f"Failed to export alarms: {e}"
+            finally:
+                state["finished"] = True
+
+        def start_export():
+            fmt = format_var.get()
+            extension = {"csv": ".csv", "jsonl": ".jsonl", "columnar": ".almc"}[fmt]
+            path = filedialog.asksaveasfilename(parent=top_export, defaultextension=extension,
+                                                filetypes=[(fmt.upper(), "*" + extension)])
+            if not path:
+                return
+
+            # Los timestamps de la BD están en UTC (CURRENT_TIMESTAMP)
+            now = datetime.utcnow()
+            days = {"Today": 0, "Last 7 days": 7, "Last 30 days": 30}.get(range_var.get())
+            start = None
+            if days is not None:
+                start = (now - timedelta(days=days)).strftime("%Y-%m-%d" if days == 0 else "%Y-%m-%d %H:%M:%S")
+
+            btn_export.config(state=tk.DISABLED)
+            logging.info(f"Exporting alarms to {path} ({fmt}).")
+            threading.Thread(target=run_export, args=(path, fmt, start), daemon=True).start()
+            poll_progress()
+
+        btn_export = tk.Button(button_frame, text="Export", command=start_export,
+                               bg="#4CAF50", fg="white", width=12)
+        btn_export.pack(side=tk.RIGHT, padx=5)
+
+        def cancel():
+            if btn_export["state"] == tk.DISABLED:
+                cancel_event.set()
+            else:
+                top_export.destroy()
+
+        tk.Button(button_frame, text="Cancel", command=cancel,
+                  bg="#f44336", fg="white", width=12).pack(side=tk.RIGHT, padx=5)
+        top_export.protocol("WM_DELETE_WINDOW", cancel)
     
     def create_status_bar(self):
         """Crea la barra de estado en la parte inferior de la ventana"""
@@ -374,6 +624,10 @@ class AlarmSystemGUI(tk.Tk):
         # Fecha y hora
         self.datetime_label = tk.Label(self.status_bar, text="", anchor=tk.W)
         self.datetime_label.pack(side=tk.LEFT, padx=5)
+
+        # Último evento
+        self.last_event_label = tk.Label(self.status_bar, text="Last event: -", anchor=tk.W)
+        self.last_event_label.pack(side=tk.LEFT, padx=5)
         
         # Actualizar fecha y hora
         self.update_datetime()
@@ -389,6 +643,11 @@ class AlarmSystemGUI(tk.Tk):
         """Actualiza la fecha y hora en la barra de estado"""
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.datetime_label.config(text=f"Date: {now}")
+        event = self.nucleo_alarma.events.latest()
+        if event:
+            when = datetime.fromtimestamp(event.timestamp).strftime("%H:%M:%S")
+            module = f" #{event.module_id}" if event.module_id is not None else ""
+            self.last_event_label.config(text=f"Last event: {when} {event.kind}{module} {event.detail}")
         # Programar próxima actualización en 1 segundo
         self.after(1000, self.update_datetime)
     
@@ -409,8 +668,30 @@ class AlarmSystemGUI(tk.Tk):
         if response:
             logging.info("System shutdown requested.")
             messagebox.showinfo("Shutdown", "System shutting down...")
-            self.after(1000, self.quit)
+            self.after(1000, self.close_and_quit)
     
+    def show_database_status(self):
+        """Muestra el perfil de durabilidad y la ventana de pérdida de datos"""
+        status = self.nucleo_alarma.get_durability_status()
+        settings = status['settings']
+        lines = [
+            f"Profile: {status['profile'] or 'SQLite defaults'}",
+            f"Mode: {status['mode']} ({status['database_path']})",
+            f"journal_mode={settings['journal_mode']}, synchronous={settings['synchronous']}",
+            f"Cache: {settings['cache_size_kib']} KiB, mmap: {settings['mmap_size'] // 1024} KiB",
+        ]
+        if status['journal_backlog'] is not None:
+            lines.append(f"Event journal backlog: {status['journal_backlog']}")
+        checkpoint = status['checkpoint']
+        if checkpoint:
+            since = checkpoint['seconds_since_checkpoint']
+            lines.append(f"Pending changes: {checkpoint['pending_changes']} "
+                         f"(last checkpoint {since:.0f} s ago)" if since is not None else
+                         f"Pending changes: {checkpoint['pending_changes']}")
+            lines.append(f"Power-loss window: up to {checkpoint['max_loss_seconds']:g} s "
+                         f"or {checkpoint['max_loss_changes']} changes")
+        messagebox.showinfo("Database Status", "\n".join(lines))
+
     def show_about_info(self):
         """Muestra información acerca del sistema"""
         about_text = """Alarm System GUI v1.0.0
@@ -464,10 +745,42 @@ class AlarmSystemGUI(tk.Tk):
         logging.info("Temporal silence deactivated.")
     
     def show_last_events(self):
-        """Muestra los últimos eventos"""
+        """Muestra los últimos eventos (desde memoria, sin consultar la BD)"""
         logging.info("Showing last events.")
-        # Redirige a la pestaña de registro
-        self.notebook.select(self.frame_registry)
+        events = self.nucleo_alarma.events
+
+        top_events = tk.Toplevel(self)
+        top_events.title("Last Events")
+        top_events.geometry("620x400")
+
+        columns = ("Hora", "Tipo", "Módulo", "Detalle")
+        tree = ttk.Treeview(top_events, columns=columns, show="headings")
+        for col, width in zip(columns, (140, 110, 80, 260)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width)
+        scrollbar = ttk.Scrollbar(top_events, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0), pady=10)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 10), pady=10)
+
+        last_seq = [0]
+
+        def refresh():
+            if not top_events.winfo_exists():
+                return
+            # Solo los eventos nuevos desde la última lectura, los más recientes arriba
+            for event in events.snapshot(since=last_seq[0]):
+                when = datetime.fromtimestamp(event.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+                tree.insert("", 0, values=(when, event.kind, event.module_id if event.module_id is not None else "",
+                                           event.detail))
+                last_seq[0] = event.seq
+            # Mantener la vista acotada a la capacidad del búfer
+            children = tree.get_children()
+            if len(children) > events.capacity:
+                tree.delete(*children[events.capacity:])
+            top_events.after(1000, refresh)
+
+        refresh()
     
     def toggle_maintenance_mode(self):
         """Activa/desactiva el modo mantenimiento"""
@@ -478,21 +791,98 @@ class AlarmSystemGUI(tk.Tk):
     
     def test_sensor(self, sensor_id):
         """Prueba un sensor específico"""
-        sensor_name = self.sensor_states[sensor_id]["name"]
+        sensor_name = self.sensor_states[sensor_id].name
         logging.info(f"Testing sensor: {sensor_name}")
         messagebox.showinfo("Test Sensor", f"Testing {sensor_name}...")
     
     def configure_sensor(self, sensor_id):
         """Configura un sensor específico"""
-        sensor_name = self.sensor_states[sensor_id]["name"]
+        sensor_name = self.sensor_states[sensor_id].name
         logging.info(f"Configuring sensor: {sensor_name}")
         messagebox.showinfo("Configure Sensor", f"Configuration options for {sensor_name}")
     
     def show_sensor_history(self, sensor_id):
         """Muestra el historial de un sensor"""
-        sensor_name = self.sensor_states[sensor_id]["name"]
+        sensor_name = self.sensor_states[sensor_id].name
         logging.info(f"Showing history for sensor: {sensor_name}")
-        messagebox.showinfo("Sensor History", f"History for {sensor_name}")
+
+        top_history = tk.Toplevel(self)
+        top_history.title(f"History - {sensor_name}")
+        top_history.geometry("640x480")
+        top_history.transient(self)
+
+        main_frame = tk.Frame(top_history, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Selección del periodo: cada uno se lee de su tabla de agregados
+        controls = tk.Frame(main_frame)
+        controls.pack(fill=tk.X)
+        tk.Label(controls, text="Period:").pack(side=tk.LEFT)
+        periods = {
+            "Last hour": ("minute", timedelta(hours=1)),
+            "Last 24 hours": ("hour", timedelta(days=1)),
+            "Last 7 days": ("hour", timedelta(days=7)),
+            "Last 30 days": ("day", timedelta(days=30)),
+            "Last year": ("day", timedelta(days=365)),
+        }
+        period_var = tk.StringVar()
+        period_combo = ttk.Combobox(controls, textvariable=period_var, width=15, state="readonly")
+        period_combo['values'] = tuple(periods)
+        period_combo.current(3)
+        period_combo.pack(side=tk.LEFT, padx=5)
+
+        summary_label = tk.Label(main_frame, text="", font=("Arial", 10), anchor="w")
+        summary_label.pack(fill=tk.X, pady=5)
+
+        chart = tk.Canvas(main_frame, height=200, bg='white')
+        chart.pack(fill=tk.X)
+
+        # Últimas transiciones
+        tree = ttk.Treeview(main_frame, columns=("Fecha", "De", "A"), show="headings", height=8)
+        for col, width in (("Fecha", 180), ("De", 120), ("A", 120)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width)
+        tree.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        for timestamp, old_status, new_status in self.nucleo_alarma.get_module_transitions(sensor_id, 100):
+            tree.insert("", tk.END, values=(timestamp, old_status or "-", new_status))
+
+        def draw_history(event=None):
+            granularity, span = periods[period_var.get()]
+            end = datetime.utcnow().replace(microsecond=0)
+            rollups = self.nucleo_alarma.get_module_history(sensor_id, granularity, end - span, end)
+
+            total_alarms = sum(r["alarms"] for r in rollups)
+            total_seconds = sum(r["alarm_seconds"] for r in rollups)
+            summary_label.config(
+                text=f"Alarms: {total_alarms}   Transitions: {sum(r['transitions'] for r in rollups)}   "
+                     f"Time in alarm: {timedelta(seconds=int(total_seconds))}")
+
+            chart.delete("all")
+            chart.update_idletasks()
+            width = max(chart.winfo_width(), 600)
+            height = int(chart["height"])
+            if not rollups:
+                chart.create_text(width // 2, height // 2, text="No history for this period", fill="gray")
+                return
+
+            # Barras de alarmas por bucket; el tono indica el tiempo en alarma
+            max_alarms = max(r["alarms"] for r in rollups) or 1
+            bucket_seconds = {"minute": 60, "hour": 3600, "day": 86400}[granularity]
+            bar_width = max((width - 20) / len(rollups), 1)
+            for i, r in enumerate(rollups):
+                x0 = 10 + i * bar_width
+                bar_height = (height - 30) * r["alarms"] / max_alarms
+                ratio = min(r["alarm_seconds"] / bucket_seconds, 1.0)
+                color = "#%02x%02x40" % (int(120 + 135 * ratio), int(200 - 160 * ratio))
+                chart.create_rectangle(x0, height - 20 - bar_height, x0 + bar_width - 1, height - 20,
+                                       fill=color, outline="")
+            chart.create_text(10, height - 8, text=rollups[0]["bucket"], anchor="w", font=("Arial", 8))
+            chart.create_text(width - 10, height - 8, text=rollups[-1]["bucket"], anchor="e", font=("Arial", 8))
+            chart.create_text(10, 8, text=f"max {max_alarms} alarms/{granularity}", anchor="w", font=("Arial", 8))
+
+        period_combo.bind("<<ComboboxSelected>>", draw_history)
+        top_history.after(50, draw_history)
+        top_history.bind('<Escape>', lambda e: top_history.destroy())
     
     def add_new_sensor(self):
         top_sensor = tk.Toplevel(self)
@@ -620,9 +1010,7 @@ class AlarmSystemGUI(tk.Tk):
         
         # Obtener lista de sensores activos de la base de datos
         try:
-            cursor = self.nucleo_alarma.connection.cursor()
-            cursor.execute("SELECT id, name, status FROM modules WHERE status != 'deleted' ORDER BY name")
-            sensors = cursor.fetchall()
+            sensors = [m for m in self.nucleo_alarma.get_all_modules().values() if m.status != 'deleted']
             
             if not sensors:
                 tk.Label(selection_frame, text="No sensors available", fg="red").grid(row=1, column=0, columnspan=2, pady=10)
@@ -644,7 +1032,7 @@ class AlarmSystemGUI(tk.Tk):
             return
         
         # Diccionario para mapear IDs a nombres
-        sensor_dict = {f"{sensor[1]} (ID: {sensor[0]})": sensor[0] for sensor in sensors}
+        sensor_dict = {f"{sensor.name} (ID: {sensor.id})": sensor.id for sensor in sensors}
         
         # Variable para el sensor seleccionado
         selected_sensor = tk.StringVar()
@@ -672,16 +1060,14 @@ class AlarmSystemGUI(tk.Tk):
             if selected_text and selected_text in sensor_dict:
                 sensor_id = sensor_dict[selected_text]
                 try:
-                    cursor = self.nucleo_alarma.connection.cursor()
-                    cursor.execute("SELECT id, name, status FROM modules WHERE id = ?", (sensor_id,))
-                    sensor = cursor.fetchone()
+                    sensor = self.nucleo_alarma.get_module(sensor_id)
                     
                     if sensor:
-                        info_labels["ID:"].config(text=sensor[0])
-                        info_labels["Name:"].config(text=sensor[1])
+                        info_labels["ID:"].config(text=sensor.id)
+                        info_labels["Name:"].config(text=sensor.name)
                         
                         # Mostrar estado con color
-                        status = sensor[2]
+                        status = sensor.status
                         color = "green" if status == "active" else "orange" if status == "inactive" else "red"
                         info_labels["Status:"].config(text=status, fg=color)
                 except Exception as e:
@@ -725,13 +1111,11 @@ class AlarmSystemGUI(tk.Tk):
                     messagebox.showinfo("Success", f"Sensor '{selected_text}' has been removed successfully!")
                     
                     # Actualizar la lista de sensores
-                    cursor = self.nucleo_alarma.connection.cursor()
-                    cursor.execute("SELECT id, name, status FROM modules WHERE status != 'deleted' ORDER BY name")
-                    sensors = cursor.fetchall()
+                    sensors = [m for m in self.nucleo_alarma.get_all_modules().values() if m.status != 'deleted']
                     
                     if sensors:
                         sensor_dict.clear()
-                        sensor_dict.update({f"{sensor[1]} (ID: {sensor[0]})": sensor[0] for sensor in sensors})
+                        sensor_dict.update({f"{sensor.name} (ID: {sensor.id})": sensor.id for sensor in sensors})
                         sensor_combo['values'] = list(sensor_dict.keys())
                         sensor_combo.current(0)
                         update_sensor_info()
@@ -907,27 +1291,110 @@ class AlarmSystemGUI(tk.Tk):
         messagebox.showinfo("System Test", "System test will be performed.")
     
     def backup_config(self):
-        """Backup de configuración"""
-        messagebox.showinfo("Backup", "Configuration backup will be created.")
+        """Backup de configuración: crear copias y restaurar versiones anteriores"""
+        top_backup = tk.Toplevel(self)
+        top_backup.title("Configuration Backups")
+        top_backup.geometry("520x380")
+        top_backup.transient(self)
+        top_backup.grab_set()
+
+        main_frame = tk.Frame(top_backup, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("Version", "Date", "Label", "Hash")
+        tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=12, selectmode="browse")
+        for col, width in zip(columns, (70, 150, 170, 100)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            for entry in reversed(self.config_manager.store.versions()):
+                tree.insert("", tk.END, iid=str(entry["version"]), values=(
+                    entry["version"], entry["timestamp"], entry["label"] or "(auto)", entry["hash"][:10]))
+
+        def create_backup():
+            label = simpledialog.askstring("Backup", "Backup label:", initialvalue="backup", parent=top_backup)
+            if label is None:
+                return
+            try:
+                entry = self.config_manager.backup(label.strip() or "backup")
+                logging.info(f"Configuration backup created: v{entry['version']}")
+                refresh()
+            except OSError as e:
+                logging.error(f"Error creating config backup: {e}")
+                messagebox.showerror("Error", f"Failed to create backup: {e}", parent=top_backup)
+
+        def restore_selected():
+            selection = tree.selection()
+            if not selection:
+                messagebox.showwarning("Warning", "Please select a version to restore!", parent=top_backup)
+                return
+            version = int(selection[0])
+            if not messagebox.askyesno("Restore", f"Restore configuration version {version}?", parent=top_backup):
+                return
+            try:
+                self.system_config = self.config_manager.restore(version)
+                logging.info(f"Configuration restored to version {version}.")
+                refresh()
+                messagebox.showinfo("Restore", f"Configuration version {version} restored.", parent=top_backup)
+            except (OSError, KeyError, ValueError) as e:
+                logging.error(f"Error restoring config: {e}")
+                messagebox.showerror("Error", f"Failed to restore configuration: {e}", parent=top_backup)
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        tk.Button(button_frame, text="Close", command=top_backup.destroy, width=12).pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="Restore Selected", command=restore_selected, width=15).pack(side=tk.RIGHT, padx=5)
+        tk.Button(button_frame, text="Create Backup", command=create_backup,
+                  bg="#4CAF50", fg="white", width=15).pack(side=tk.RIGHT, padx=5)
+
+        refresh()
+        top_backup.bind('<Escape>', lambda e: top_backup.destroy())
     
     def restore_defaults(self):
         """Restaurar valores por defecto"""
         response = messagebox.askyesno("Restore Defaults", 
                                       "Are you sure you want to restore all settings to default values?")
         if response:
-            messagebox.showinfo("Defaults Restored", "All settings have been restored to defaults.")
+            try:
+                # La configuración anterior queda en el historial de versiones
+                self.system_config = self.config_manager.restore_defaults()
+                logging.info("Configuration restored to defaults.")
+                messagebox.showinfo("Defaults Restored", "All settings have been restored to defaults.\n"
+                                    "The previous configuration is kept in Backup Configuration.")
+            except (OSError, ConfigError) as e:
+                logging.error(f"Error restoring defaults: {e}")
+                messagebox.showerror("Error", f"Failed to restore defaults: {e}")
 
     def on_close(self):
         """Maneja el cierre de la aplicación"""
         response = messagebox.askyesno("Exit", "Are you sure you want to exit?")
         if response:
             logging.info("Application closing.")
-            self.quit()
+            self.close_and_quit()
+
+    def close_and_quit(self):
+        """Detiene los servicios y cierra el núcleo antes de salir"""
+        self.config_manager.stop_watching()
+        if self.api_server:
+            self.api_server.stop()
+        self.rule_engine.close()
+        self.change_subscription.close()
+        # Último checkpoint a disco y vaciado del diario (perfil sd-card-saver)
+        self.nucleo_alarma.close()
+        self.quit()
     
     def update_system_state(self):
         """Actualiza el estado del sistema en la interfaz"""
-        status_text = "ACTIVE" if self.active_alarm else "READY"
-        color = "red" if self.active_alarm else "green"
+        if self.active_alarm:
+            status_text = "ACTIVE"
+        elif self.rule_engine.armed:
+            status_text = f"ARMED ({self.rule_engine.mode.upper()})"
+        else:
+            status_text = "READY"
+        color = "red" if self.active_alarm else ("orange" if self.rule_engine.armed else "green")
         
         self.status_label.config(text=f"System: {status_text}")
         self.canvas_state.itemconfig(self.state_indicator, fill=color)
@@ -943,15 +1410,22 @@ class AlarmSystemGUI(tk.Tk):
     def activate_alarm(self):
         response = messagebox.askyesno("Activate Alarm", "Are you sure you want to activate the alarm?")
         if response:
-            self.active_alarm = True
-            logging.info("Alarm activated by user.")
+            # Modo 'night' si night_mode está activo en la configuración
+            self.rule_engine.arm()
+            logging.info(f"Alarm armed by user ({self.rule_engine.mode}).")
             self.update_system_state()
-            messagebox.showinfo("Alarm Activated", "The alarm system is now active.")
+            messagebox.showinfo("Alarm Activated", f"The alarm system is now armed ({self.rule_engine.mode}).")
+
+    def on_zone_triggered(self, module_id, zone_name):
+        """Una zona armada ha disparado sus acciones"""
+        self.active_alarm = True
+        self.update_system_state()
+        self.label_status.config(text=f"ALARM: zone {zone_name} (module {module_id})", fg="red")
     
     def deactivate_alarm(self):
-        # CORRECCIÓN: Usar system_config en lugar de config
         code = simpledialog.askstring("Deactivate Alarm", "Enter deactivation code:", show="*")
-        if code == self.system_config.get("deactivation_code", "1234"):  # Cambiado a system_config
+        if code == self.system_config.deactivation_code:
+            self.rule_engine.disarm()
             self.active_alarm = False
             logging.info("Alarm deactivated by user.")
             self.update_system_state()
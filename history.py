@@ -0,0 +1,251 @@
+"""
+history.py
+Historial de estados de los módulos: tabla de transiciones (solo inserción)
+y tablas de agregados por minuto/hora/día que se mantienen de forma
+incremental con cada transición, para que el historial de un sensor se
+pueda mostrar sin recorrer todas las transiciones.
+
+Cada granularidad solo se mantiene dentro de su horizonte (RETENTION): un
+estado que dura semanas reparte su tiempo en buckets por minuto solo para
+el último día, y el resto lo cubren las granularidades más gruesas. Así
+cerrar un intervalo largo cuesta un número acotado de filas. `prune` borra
+los agregados fuera de su horizonte y las transiciones antiguas; lo ejecuta
+el ciclo de RetentionManager, nunca una lectura.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("HISTORY")
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# granularidad -> (longitud del prefijo del timestamp, tamaño del bucket)
+GRANULARITIES = {
+    'minute': (16, timedelta(minutes=1)),
+    'hour': (13, timedelta(hours=1)),
+    'day': (10, timedelta(days=1)),
+}
+
+# granularidad -> antigüedad máxima de sus buckets
+RETENTION = {
+    'minute': timedelta(days=1),
+    'hour': timedelta(days=60),
+    'day': timedelta(days=730),
+}
+
+# Transiciones más antiguas se borran (salvo la última de cada módulo)
+TRANSITION_RETENTION = timedelta(days=365)
+
+ALARM_STATUS = 'alarm'
+
+
+def create_prune_indexes(cursor):
+    """Índices para que `prune` recorra solo lo que borra."""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rollups_bucket
+        ON module_rollups(granularity, bucket)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transitions_timestamp
+        ON module_transitions(timestamp)
+    ''')
+
+
+def create_tables(cursor):
+    """Crear las tablas de transiciones y agregados si no existen."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS module_transitions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module_id INTEGER NOT NULL,
+            old_status TEXT,
+            new_status TEXT NOT NULL,
+            timestamp TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transitions_module
+        ON module_transitions(module_id, id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS module_rollups (
+            module_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            transitions INTEGER NOT NULL DEFAULT 0,
+            alarms INTEGER NOT NULL DEFAULT 0,
+            alarm_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (module_id, granularity, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:19], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+def bucket_key(dt: datetime, granularity: str) -> str:
+    length, _ = GRANULARITIES[granularity]
+    return dt.strftime(TIMESTAMP_FORMAT)[:length]
+
+
+def bucket_floor(dt: datetime, granularity: str) -> datetime:
+    if granularity == 'minute':
+        return dt.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def split_interval(start: datetime, end: datetime, granularity: str) -> List[Tuple[str, float]]:
+    """Repartir el intervalo [start, end) entre los buckets de una granularidad."""
+    _, step = GRANULARITIES[granularity]
+    parts = []
+    current = start
+    while current < end:
+        boundary = bucket_floor(current, granularity) + step
+        part_end = min(boundary, end)
+        parts.append((bucket_key(current, granularity), (part_end - current).total_seconds()))
+        current = part_end
+    return parts
+
+
+def horizon(now: datetime, granularity: str) -> datetime:
+    """Inicio del primer bucket que aún se conserva en una granularidad."""
+    return bucket_floor(now - RETENTION[granularity], granularity)
+
+
+def split_recent(start: datetime, end: datetime, granularity: str) -> List[Tuple[str, float]]:
+    """`split_interval` limitado al horizonte de la granularidad (filas acotadas)."""
+    return split_interval(max(start, horizon(end, granularity)), end, granularity)
+
+
+def last_transition(cursor, module_id) -> Optional[Tuple[str, datetime]]:
+    """Último estado registrado de un módulo y desde cuándo está en él."""
+    cursor.execute('''
+        SELECT new_status, timestamp FROM module_transitions
+        WHERE module_id = ?
+        ORDER BY id DESC LIMIT 1
+    ''', (module_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row[0], parse_timestamp(row[1])
+
+
+def record_transition(cursor, module_id, old_status, new_status,
+                      since: Optional[datetime], now: Optional[datetime] = None):
+    """
+    Registrar una transición y actualizar los agregados (sin hacer commit).
+
+    Args:
+        cursor: Cursor dentro de la transacción del llamante
+        module_id: ID del módulo
+        old_status: Estado anterior (None si es el primero)
+        new_status: Estado nuevo
+        since: Momento en que empezó el estado anterior
+        now: Momento de la transición (UTC); por defecto, ahora
+    """
+    now = now or datetime.utcnow().replace(microsecond=0)
+    cursor.execute('''
+        INSERT INTO module_transitions (module_id, old_status, new_status, timestamp)
+        VALUES (?, ?, ?, ?)
+    ''', (module_id, old_status, new_status, now.strftime(TIMESTAMP_FORMAT)))
+
+    rows = []
+    entered_alarm = 1 if new_status == ALARM_STATUS and old_status != ALARM_STATUS else 0
+    for granularity in GRANULARITIES:
+        rows.append((module_id, granularity, bucket_key(now, granularity), 1, entered_alarm, 0.0))
+        # Tiempo en alarma del intervalo que se cierra
+        if old_status == ALARM_STATUS and since and since < now:
+            for key, seconds in split_recent(since, now, granularity):
+                rows.append((module_id, granularity, key, 0, 0, seconds))
+
+    cursor.executemany('''
+        INSERT INTO module_rollups (module_id, granularity, bucket, transitions, alarms, alarm_seconds)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(module_id, granularity, bucket) DO UPDATE SET
+            transitions = transitions + excluded.transitions,
+            alarms = alarms + excluded.alarms,
+            alarm_seconds = alarm_seconds + excluded.alarm_seconds
+    ''', rows)
+
+
+def get_rollups(connection, module_id, granularity: str = 'day',
+                start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+    """
+    Leer los agregados de un módulo, incluyendo el tiempo de una alarma en curso.
+
+    Returns:
+        Lista de diccionarios {bucket, transitions, alarms, alarm_seconds} ordenada
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    end = end or datetime.utcnow().replace(microsecond=0)
+    conditions = ["module_id = ?", "granularity = ?"]
+    params = [module_id, granularity]
+    if start:
+        conditions.append("bucket >= ?")
+        params.append(bucket_key(start, granularity))
+    conditions.append("bucket <= ?")
+    params.append(bucket_key(end, granularity))
+
+    cursor = connection.cursor()
+    cursor.execute(f'''
+        SELECT bucket, transitions, alarms, alarm_seconds
+        FROM module_rollups
+        WHERE {" AND ".join(conditions)}
+        ORDER BY bucket
+    ''', params)
+    buckets = {row[0]: {'bucket': row[0], 'transitions': row[1],
+                        'alarms': row[2], 'alarm_seconds': row[3]}
+               for row in cursor.fetchall()}
+
+    # La alarma en curso todavía no está en los agregados
+    current = last_transition(cursor, module_id)
+    if current and current[0] == ALARM_STATUS and current[1]:
+        open_start = max(current[1], start) if start else current[1]
+        for key, seconds in split_recent(open_start, end, granularity):
+            entry = buckets.setdefault(key, {'bucket': key, 'transitions': 0,
+                                             'alarms': 0, 'alarm_seconds': 0.0})
+            entry['alarm_seconds'] += seconds
+
+    return [buckets[key] for key in sorted(buckets)]
+
+
+def prune(cursor, now: Optional[datetime] = None) -> int:
+    """Borrar agregados fuera de su horizonte y transiciones antiguas (sin hacer commit)."""
+    now = now or datetime.utcnow().replace(microsecond=0)
+    deleted = 0
+    for granularity in GRANULARITIES:
+        cursor.execute("DELETE FROM module_rollups WHERE granularity = ? AND bucket < ?",
+                       (granularity, bucket_key(horizon(now, granularity), granularity)))
+        deleted += cursor.rowcount
+    # La última transición de cada módulo se conserva: marca desde cuándo está en su estado
+    cursor.execute('''
+        DELETE FROM module_transitions
+        WHERE timestamp < ?
+          AND id < (SELECT MAX(t.id) FROM module_transitions t
+                    WHERE t.module_id = module_transitions.module_id)
+    ''', ((now - TRANSITION_RETENTION).strftime(TIMESTAMP_FORMAT),))
+    return deleted + cursor.rowcount
+
+
+def get_transitions(connection, module_id, limit: int = 50) -> List[tuple]:
+    """Últimas transiciones de un módulo: (timestamp, old_status, new_status)."""
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT timestamp, old_status, new_status FROM module_transitions
+        WHERE module_id = ?
+        ORDER BY id DESC LIMIT ?
+    ''', (module_id, limit))
+    return cursor.fetchall()
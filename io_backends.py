@@ -0,0 +1,423 @@
+"""
+io_backends.py
+Backends de E/S intercambiables para IOManager.
+
+- RPiGPIOBackend: pines GPIO nativos con RPi.GPIO (detección de flancos).
+- MCP23017Backend / MCP23S17Backend: expansores de 16 bits por I2C / SPI.
+  Se lee el puerto completo (GPIOA+GPIOB) en una sola transacción.
+- FakeBackend: bus en memoria para simulación y pruebas sin hardware.
+- FakeMCP23017Bus: registros de un MCP23017 en memoria, para probar el
+  backend de expansor completo sin hardware.
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence
+
+try:
+    import smbus2
+    SMBUS_AVAILABLE = True
+except ImportError:
+    SMBUS_AVAILABLE = False
+
+try:
+    import spidev
+    SPIDEV_AVAILABLE = True
+except ImportError:
+    SPIDEV_AVAILABLE = False
+
+logger = logging.getLogger("IO_BACKENDS")
+
+LOW = 0
+HIGH = 1
+
+EdgeCallback = Callable[[int], None]
+
+
+class IOBackend:
+    """Interfaz común de los backends de E/S (pines numerados por el backend)."""
+
+    name = 'base'
+
+    def setup(self) -> bool:
+        """Inicializar el hardware. Devuelve False si no está disponible."""
+        return True
+
+    def setup_input(self, pin: int, pull_up: bool = True):
+        raise NotImplementedError
+
+    def setup_output(self, pin: int):
+        raise NotImplementedError
+
+    def read_pin(self, pin: int) -> int:
+        raise NotImplementedError
+
+    def read_pins(self, pins: Iterable[int]) -> Dict[int, int]:
+        """Leer varios pines. Los backends con puertos lo hacen por transacción."""
+        return {pin: self.read_pin(pin) for pin in pins}
+
+    def write_pin(self, pin: int, value: int):
+        raise NotImplementedError
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime: int) -> bool:
+        """
+        Registrar un callback de flanco.
+
+        Returns:
+            False si el backend no genera interrupciones (IOManager hará sondeo)
+        """
+        return False
+
+    def remove_edge_callback(self, pin: int):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+# ===== RPi.GPIO =====
+
+class RPiGPIOBackend(IOBackend):
+    """Pines GPIO nativos de la Raspberry Pi (numeración BCM)."""
+
+    name = 'rpi'
+
+    def __init__(self, gpio_module=None):
+        """
+        Args:
+            gpio_module: Módulo compatible con RPi.GPIO; por defecto se importa RPi.GPIO
+        """
+        self.GPIO = gpio_module
+
+    def setup(self) -> bool:
+        if self.GPIO is None:
+            try:
+                import RPi.GPIO as GPIO
+            except ImportError:
+                return False
+            self.GPIO = GPIO
+        self.GPIO.setmode(self.GPIO.BCM)
+        self.GPIO.setwarnings(False)
+        return True
+
+    def setup_input(self, pin: int, pull_up: bool = True):
+        pull = self.GPIO.PUD_UP if pull_up else self.GPIO.PUD_DOWN
+        self.GPIO.setup(pin, self.GPIO.IN, pull_up_down=pull)
+
+    def setup_output(self, pin: int):
+        self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def read_pin(self, pin: int) -> int:
+        return HIGH if self.GPIO.input(pin) == self.GPIO.HIGH else LOW
+
+    def write_pin(self, pin: int, value: int):
+        self.GPIO.output(pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime: int) -> bool:
+        self.GPIO.add_event_detect(pin, self.GPIO.BOTH, callback=callback, bouncetime=bouncetime)
+        return True
+
+    def remove_edge_callback(self, pin: int):
+        self.GPIO.remove_event_detect(pin)
+
+    def cleanup(self):
+        if self.GPIO is not None:
+            self.GPIO.cleanup()
+
+
+# ===== EXPANSORES MCP23x17 =====
+
+class _MCP23x17Backend(IOBackend):
+    """
+    Lógica común de los expansores MCP23017 (I2C) y MCP23S17 (SPI).
+
+    Con varios chips, el pin virtual es `índice_chip * 16 + bit`
+    (bits 0-7 = puerto A, 8-15 = puerto B). Registros en modo IOCON.BANK=0.
+    """
+
+    IODIR = 0x00   # 1 = entrada
+    GPPU = 0x0C    # pull-ups internos
+    GPIO = 0x12    # lectura del puerto
+    OLAT = 0x14    # latch de salida
+
+    def __init__(self, addresses: Sequence[int] = (0x20,)):
+        self.addresses = list(addresses)
+        self._lock = threading.Lock()
+        # Copias locales de los registros de configuración (16 bits por chip)
+        self._iodir = [0xFFFF] * len(self.addresses)
+        self._gppu = [0x0000] * len(self.addresses)
+        self._olat = [0x0000] * len(self.addresses)
+        self.transactions = 0
+
+    # Transporte (I2C o SPI)
+    def _read16(self, chip: int, register: int) -> int:
+        raise NotImplementedError
+
+    def _write16(self, chip: int, register: int, value: int):
+        raise NotImplementedError
+
+    def _locate(self, pin: int):
+        chip, bit = divmod(pin, 16)
+        if chip >= len(self.addresses):
+            raise ValueError(f"Pin {pin} out of range for {len(self.addresses)} expander(s)")
+        return chip, bit
+
+    def setup(self) -> bool:
+        for chip in range(len(self.addresses)):
+            self._write16(chip, self.IODIR, self._iodir[chip])
+            self._write16(chip, self.GPPU, self._gppu[chip])
+            self._write16(chip, self.OLAT, self._olat[chip])
+        return True
+
+    def setup_input(self, pin: int, pull_up: bool = True):
+        # El MCP23x17 solo tiene pull-ups; "DOWN" requiere resistencia externa
+        chip, bit = self._locate(pin)
+        with self._lock:
+            self._iodir[chip] |= 1 << bit
+            if pull_up:
+                self._gppu[chip] |= 1 << bit
+            else:
+                self._gppu[chip] &= ~(1 << bit)
+            self._write16(chip, self.IODIR, self._iodir[chip])
+            self._write16(chip, self.GPPU, self._gppu[chip])
+
+    def setup_output(self, pin: int):
+        chip, bit = self._locate(pin)
+        with self._lock:
+            self._iodir[chip] &= ~(1 << bit)
+            self._write16(chip, self.IODIR, self._iodir[chip])
+
+    def read_pin(self, pin: int) -> int:
+        chip, bit = self._locate(pin)
+        with self._lock:
+            return (self._read16(chip, self.GPIO) >> bit) & 1
+
+    def read_pins(self, pins: Iterable[int]) -> Dict[int, int]:
+        """Una transacción de 16 bits por chip, sin importar cuántos pines se lean."""
+        by_chip: Dict[int, List[int]] = {}
+        for pin in pins:
+            chip, _ = self._locate(pin)
+            by_chip.setdefault(chip, []).append(pin)
+        result = {}
+        with self._lock:
+            for chip, chip_pins in by_chip.items():
+                port = self._read16(chip, self.GPIO)
+                for pin in chip_pins:
+                    result[pin] = (port >> (pin % 16)) & 1
+        return result
+
+    def write_pin(self, pin: int, value: int):
+        chip, bit = self._locate(pin)
+        with self._lock:
+            if value:
+                self._olat[chip] |= 1 << bit
+            else:
+                self._olat[chip] &= ~(1 << bit)
+            self._write16(chip, self.OLAT, self._olat[chip])
+
+
+class MCP23017Backend(_MCP23x17Backend):
+    """Expansor MCP23017 por I2C (smbus2)."""
+
+    name = 'mcp23017'
+
+    def __init__(self, addresses: Sequence[int] = (0x20,), bus: int = 1, smbus=None):
+        """
+        Args:
+            addresses: Direcciones I2C de los chips (0x20-0x27)
+            bus: Número de bus I2C (/dev/i2c-N)
+            smbus: Objeto con read_i2c_block_data/write_i2c_block_data (inyectable)
+        """
+        super().__init__(addresses)
+        self.bus_number = bus
+        self.bus = smbus
+
+    def setup(self) -> bool:
+        if self.bus is None:
+            if not SMBUS_AVAILABLE:
+                logger.error("smbus2 not available; cannot use MCP23017 backend")
+                return False
+            self.bus = smbus2.SMBus(self.bus_number)
+        return super().setup()
+
+    def _read16(self, chip: int, register: int) -> int:
+        self.transactions += 1
+        low, high = self.bus.read_i2c_block_data(self.addresses[chip], register, 2)
+        return low | (high << 8)
+
+    def _write16(self, chip: int, register: int, value: int):
+        self.transactions += 1
+        self.bus.write_i2c_block_data(self.addresses[chip], register, [value & 0xFF, (value >> 8) & 0xFF])
+
+    def cleanup(self):
+        if self.bus is not None and hasattr(self.bus, 'close'):
+            self.bus.close()
+
+
+class MCP23S17Backend(_MCP23x17Backend):
+    """Expansor MCP23S17 por SPI (spidev); los chips comparten CS y se distinguen por dirección hardware."""
+
+    name = 'mcp23s17'
+
+    def __init__(self, addresses: Sequence[int] = (0,), bus: int = 0, device: int = 0,
+                 speed_hz: int = 1000000, spi=None):
+        super().__init__(addresses)
+        self.bus_number = bus
+        self.device = device
+        self.speed_hz = speed_hz
+        self.spi = spi
+
+    def setup(self) -> bool:
+        if self.spi is None:
+            if not SPIDEV_AVAILABLE:
+                logger.error("spidev not available; cannot use MCP23S17 backend")
+                return False
+            self.spi = spidev.SpiDev()
+            self.spi.open(self.bus_number, self.device)
+            self.spi.max_speed_hz = self.speed_hz
+        # IOCON.HAEN para habilitar las direcciones hardware
+        for chip in range(len(self.addresses)):
+            self.spi.xfer2([0x40 | (self.addresses[chip] << 1), 0x0A, 0x08])
+        return super().setup()
+
+    def _read16(self, chip: int, register: int) -> int:
+        self.transactions += 1
+        opcode = 0x41 | (self.addresses[chip] << 1)
+        _, _, low, high = self.spi.xfer2([opcode, register, 0, 0])
+        return low | (high << 8)
+
+    def _write16(self, chip: int, register: int, value: int):
+        self.transactions += 1
+        opcode = 0x40 | (self.addresses[chip] << 1)
+        self.spi.xfer2([opcode, register, value & 0xFF, (value >> 8) & 0xFF])
+
+    def cleanup(self):
+        if self.spi is not None and hasattr(self.spi, 'close'):
+            self.spi.close()
+
+
+# ===== BACKENDS EN MEMORIA =====
+
+class FakeBackend(IOBackend):
+    """Bus en memoria: los niveles se fijan con set_level y disparan los callbacks de flanco."""
+
+    name = 'fake'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.levels: Dict[int, int] = {}
+        self.outputs: Dict[int, int] = {}
+        self._callbacks: Dict[int, EdgeCallback] = {}
+
+    def setup_input(self, pin: int, pull_up: bool = True):
+        with self._lock:
+            self.levels.setdefault(pin, HIGH if pull_up else LOW)
+
+    def setup_output(self, pin: int):
+        with self._lock:
+            self.outputs.setdefault(pin, LOW)
+
+    def read_pin(self, pin: int) -> int:
+        return self.levels.get(pin, LOW)
+
+    def read_pins(self, pins: Iterable[int]) -> Dict[int, int]:
+        levels = self.levels
+        return {pin: levels.get(pin, LOW) for pin in pins}
+
+    def write_pin(self, pin: int, value: int):
+        with self._lock:
+            self.outputs[pin] = HIGH if value else LOW
+        logger.info(f"[SIM] Output pin {pin} -> {'HIGH' if value else 'LOW'}")
+
+    def set_level(self, pin: int, value: int):
+        """Cambiar el nivel de una entrada (como haría el hardware)."""
+        value = HIGH if value else LOW
+        with self._lock:
+            changed = self.levels.get(pin) != value
+            self.levels[pin] = value
+            callback = self._callbacks.get(pin)
+        if changed and callback:
+            callback(pin)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback, bouncetime: int) -> bool:
+        with self._lock:
+            self._callbacks[pin] = callback
+        return True
+
+    def remove_edge_callback(self, pin: int):
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self):
+        with self._lock:
+            self._callbacks.clear()
+
+
+class FakeMCP23017Bus:
+    """Simulación de los registros de uno o varios MCP23017 con interfaz smbus."""
+
+    def __init__(self):
+        self.registers: Dict[int, Dict[int, int]] = {}
+        self.inputs: Dict[int, int] = {}   # dirección -> niveles externos (16 bits)
+        self.transactions = 0
+
+    def _chip(self, address: int) -> Dict[int, int]:
+        return self.registers.setdefault(address, {0x00: 0xFF, 0x01: 0xFF})
+
+    def set_input(self, address: int, bit: int, value: int):
+        port = self.inputs.get(address, 0xFFFF)
+        self.inputs[address] = port | (1 << bit) if value else port & ~(1 << bit)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int) -> List[int]:
+        self.transactions += 1
+        chip = self._chip(address)
+        data = []
+        for offset in range(length):
+            reg = register + offset
+            if reg in (0x12, 0x13):
+                # Entradas: nivel externo (alto por defecto, contacto abierto con pull-up);
+                # salidas: valor del latch
+                port = reg - 0x12
+                iodir = chip.get(0x00 + port, 0xFF)
+                external = (self.inputs.get(address, 0xFFFF) >> (8 * port)) & 0xFF
+                olat = chip.get(0x14 + port, 0x00)
+                data.append((external & iodir) | (olat & ~iodir & 0xFF))
+            else:
+                data.append(chip.get(reg, 0x00))
+        return data
+
+    def write_i2c_block_data(self, address: int, register: int, values: List[int]):
+        self.transactions += 1
+        chip = self._chip(address)
+        for offset, value in enumerate(values):
+            chip[register + offset] = value & 0xFF
+
+    def close(self):
+        pass
+
+
+def create_backend(settings=None) -> IOBackend:
+    """
+    Crear el backend indicado en la sección 'io' de la configuración.
+
+    'auto' usa RPi.GPIO si está disponible y, si no, el backend en memoria.
+    """
+    kind = getattr(settings, 'backend', 'auto') if settings is not None else 'auto'
+
+    if kind == 'mcp23017':
+        return MCP23017Backend(tuple(getattr(settings, 'expander_addresses', (0x20,))),
+                               getattr(settings, 'expander_bus', 1))
+    if kind == 'mcp23s17':
+        return MCP23S17Backend(tuple(getattr(settings, 'spi_addresses', (0,))),
+                               getattr(settings, 'spi_bus', 0), getattr(settings, 'spi_device', 0))
+    if kind == 'fake':
+        return FakeBackend()
+    if kind in ('auto', 'rpi'):
+        try:
+            import RPi.GPIO  # noqa: F401
+            return RPiGPIOBackend()
+        except ImportError:
+            if kind == 'rpi':
+                logger.error("RPi.GPIO not available; falling back to the in-memory backend")
+            return FakeBackend()
+    raise ValueError(f"Unknown I/O backend: {kind}")
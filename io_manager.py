@@ -1,6 +1,9 @@
 """
 io_manager.py
 Maneja toda la interacción con hardware GPIO y periféricos.
+
+El acceso al hardware pasa por un backend (ver io_backends.py): GPIO nativo,
+expansores de puertos I2C/SPI o un bus en memoria para simulación.
 """
 
 import logging
@@ -8,17 +11,37 @@ import threading
 import time
 from typing import Dict, Optional, Callable
 try:
-    import RPi.GPIO as GPIO
+    # Solo se comprueba si existe; el acceso al hardware va por io_backends
+    import RPi.GPIO  # noqa: F401
     GPIO_AVAILABLE = True
 except ImportError:
-    GPIO_AVAILABLE = False
-    logging.warning("RPi.GPIO not available. Running in simulation mode.")
+    GPIO_AVAILABLE = False  # El modo simulación se registra al crear el IOManager
+
+from config import AlarmConfig, ConfigManager, IOSettings, DEFAULT_OUTPUT_PINS
+from io_backends import IOBackend, FakeBackend, create_backend, HIGH, LOW
+from event_buffer import RecentEvents, SENSOR
+from sensor_snapshots import SensorSnapshots, SensorSnapshot
+from anomaly import AnomalyDetector
+
+logger = logging.getLogger("IO_MANAGER")
 
 class IOManager:
     """Gestiona todas las operaciones de entrada/salida del sistema."""
     
-    def __init__(self, config: dict = None):
-        self.config = config or {}
+    def __init__(self, config=None, backend: Optional[IOBackend] = None,
+                 events: Optional[RecentEvents] = None, anomalies: Optional[AnomalyDetector] = None):
+        """
+        Args:
+            config: ConfigManager compartido (recarga en caliente), una
+                    instantánea AlarmConfig o dict con una sección 'io'
+            backend: Backend de E/S; por defecto se crea según 'io.backend'
+            events: Últimos eventos (p. ej. `core.events`) donde anotar los cambios de sensores
+            anomalies: Detector de flapping/atasco/sabotaje, evaluado en cada ciclo de monitoreo
+        """
+        self.events = events
+        self.anomalies = anomalies
+        self.config_manager = config if isinstance(config, ConfigManager) else None
+        self.config = self.config_manager.snapshot if self.config_manager else (config or {})
         self.gpio_initialized = False
         self.monitoring_active = False
         self.monitoring_thread = None
@@ -27,88 +50,128 @@ class IOManager:
         self.gpio_to_module: Dict[int, dict] = {}  # {gpio_pin: module_info}
         self.module_to_gpio: Dict[int, int] = {}   # {module_id: gpio_pin}
         
+        # Estados versionados para sondeadores (ver changes_since)
+        self.snapshots = SensorSnapshots()
+
         # Callbacks
         self.on_sensor_trigger: Optional[Callable] = None
         self.on_alarm_reset: Optional[Callable] = None
+
+        io_settings = None
+        if isinstance(self.config, AlarmConfig):
+            io_settings = self.config.io
+        elif 'io' in self.config:
+            io_settings = IOSettings.from_dict(self.config['io'])
+
+        self.backend = backend or create_backend(io_settings)
         
         # Configuración por defecto
         self.defaults = {
             'check_interval': 0.1,  # segundos
             'bounce_time': 300,     # milisegundos
-            'simulation_mode': not GPIO_AVAILABLE
+            'output_pins': dict(DEFAULT_OUTPUT_PINS),
+            'simulation_mode': isinstance(self.backend, FakeBackend)
         }
         
         self._setup_gpio()
+        
+        # Aplicar configuración de E/S y seguir sus cambios sin reiniciar
+        self._unsubscribe_config = None
+        if io_settings is not None:
+            self._apply_io_settings(io_settings)
+        if self.config_manager:
+            self._unsubscribe_config = self.config_manager.subscribe(self._on_config_change)
+    
+    def _on_config_change(self, old_config, new_config):
+        """Callback del ConfigManager: aplicar la nueva sección 'io'."""
+        self.config = new_config
+        if old_config.io != new_config.io:
+            self._apply_io_settings(new_config.io)
+    
+    def _apply_io_settings(self, io: IOSettings):
+        """Aplicar intervalos, tiempo de rebote y pines de salida."""
+        old_bounce = self.defaults['bounce_time']
+        self.defaults['check_interval'] = io.check_interval
+        self.defaults['bounce_time'] = io.bounce_time
+        self.defaults['output_pins'] = dict(io.output_pins)
+        
+        # El rebote se fija al registrar la detección de flancos: rehacerla
+        if self.gpio_initialized and io.bounce_time != old_bounce:
+            for gpio_pin, module_info in list(self.gpio_to_module.items()):
+                if not module_info.get('edge_detect'):
+                    continue
+                try:
+                    self.backend.remove_edge_callback(gpio_pin)
+                    self.backend.add_edge_callback(gpio_pin, self._gpio_event_callback, io.bounce_time)
+                except Exception as e:
+                    logger.error(f"Failed to update bounce time on GPIO {gpio_pin}: {e}")
+        logger.info(f"I/O settings applied: interval={io.check_interval}s, bounce={io.bounce_time}ms")
     
     def _setup_gpio(self):
-        """Configurar GPIO si está disponible."""
-        if not GPIO_AVAILABLE or self.defaults['simulation_mode']:
-            logging.info("Running in GPIO simulation mode")
-            return
+        """Inicializar el backend de E/S."""
+        if self.defaults['simulation_mode']:
+            logger.warning("I/O backend not available or not configured: running in simulation mode")
         
         try:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setwarnings(False)
-            self.gpio_initialized = True
-            logging.info("GPIO initialized successfully")
+            self.gpio_initialized = self.backend.setup()
+            if self.gpio_initialized:
+                logger.info(f"I/O backend '{self.backend.name}' initialized successfully")
+            else:
+                logger.error(f"I/O backend '{self.backend.name}' not available")
         except Exception as e:
-            logging.error(f"Failed to initialize GPIO: {e}")
+            logger.error(f"Failed to initialize I/O backend '{self.backend.name}': {e}")
             self.gpio_initialized = False
     
     def register_sensor(self, module_id: int, gpio_pin: int, 
                        sensor_type: str = 'NO', pull_config: str = 'UP') -> bool:
         """
-        Registrar un sensor en un pin GPIO específico.
+        Registrar un sensor en un pin específico.
         
         Args:
             module_id: ID único del módulo/sensor
-            gpio_pin: Número de pin GPIO (BCM)
+            gpio_pin: Número de pin (BCM en GPIO nativo, pin virtual en expansores)
             sensor_type: 'NO' (Normalmente Abierto) o 'NC' (Normalmente Cerrado)
             pull_config: 'UP' o 'DOWN'
         
         Returns:
             True si se registró exitosamente
         """
-        if not self.gpio_initialized and not self.defaults['simulation_mode']:
-            logging.error("GPIO not initialized")
+        if not self.gpio_initialized:
+            logger.error("GPIO not initialized")
             return False
         
         # Validar parámetros
         if sensor_type not in ['NO', 'NC']:
-            logging.error(f"Invalid sensor type: {sensor_type}")
+            logger.error(f"Invalid sensor type: {sensor_type}")
             return False
         
         if pull_config not in ['UP', 'DOWN']:
-            logging.error(f"Invalid pull config: {pull_config}")
+            logger.error(f"Invalid pull config: {pull_config}")
             return False
         
-        # Configurar el pin si estamos en modo real
-        if self.gpio_initialized:
-            try:
-                pull = GPIO.PUD_UP if pull_config == 'UP' else GPIO.PUD_DOWN
-                GPIO.setup(gpio_pin, GPIO.IN, pull_up_down=pull)
-                
-                # Configurar debounce
-                GPIO.add_event_detect(
-                    gpio_pin, 
-                    GPIO.BOTH,
-                    callback=self._gpio_event_callback,
-                    bouncetime=self.defaults['bounce_time']
-                )
-            except Exception as e:
-                logging.error(f"Failed to setup GPIO pin {gpio_pin}: {e}")
-                return False
+        # Configurar el pin y la detección de flancos (con debounce)
+        try:
+            self.backend.setup_input(gpio_pin, pull_up=(pull_config == 'UP'))
+            # En simulación el sensor arranca en reposo
+            if self.defaults['simulation_mode']:
+                self.backend.set_level(gpio_pin, LOW if sensor_type == 'NO' else HIGH)
+            edge_detect = self.backend.add_edge_callback(
+                gpio_pin, self._gpio_event_callback, self.defaults['bounce_time'])
+        except Exception as e:
+            logger.error(f"Failed to setup GPIO pin {gpio_pin}: {e}")
+            return False
         
         # Guardar mapeo
         self.gpio_to_module[gpio_pin] = {
             'module_id': module_id,
             'sensor_type': sensor_type,
             'pull_config': pull_config,
-            'simulated_state': 'normal'  # Para modo simulación
+            'edge_detect': edge_detect  # False: el monitoreo lo sondea
         }
         self.module_to_gpio[module_id] = gpio_pin
+        self.snapshots.update(module_id, self.read_sensor_state(module_id), gpio_pin, sensor_type)
         
-        logging.info(f"Sensor registered: Module {module_id} -> GPIO {gpio_pin} ({sensor_type}, {pull_config})")
+        logger.info(f"Sensor registered: Module {module_id} -> GPIO {gpio_pin} ({sensor_type}, {pull_config})")
         return True
     
     def _gpio_event_callback(self, channel):
@@ -119,12 +182,30 @@ class IOManager:
         module_info = self.gpio_to_module[channel]
         module_id = module_info['module_id']
         current_state = self.read_sensor_state(module_id)
+        self._note_state(module_info, current_state)
         
-        logging.debug(f"GPIO event on channel {channel}. Module {module_id} state: {current_state}")
+        logger.debug(f"GPIO event on channel {channel}. Module {module_id} state: {current_state}")
         
         # Notificar al callback si está configurado
         if self.on_sensor_trigger:
             self.on_sensor_trigger(module_id, current_state)
+
+    def _note_state(self, module_info: dict, state: str):
+        """Guardar el último estado visto y anotarlo en los eventos recientes si cambió."""
+        previous = module_info.get('last_state')
+        module_info['last_state'] = state
+        self.snapshots.update(module_info['module_id'], state)
+        if self.anomalies is not None:
+            self.anomalies.record(module_info['module_id'], state)
+        if self.events is not None and previous != state:
+            self.events.append(SENSOR, module_info['module_id'], state, previous=previous)
+
+    @staticmethod
+    def _level_to_state(level: int, sensor_type: str) -> str:
+        if sensor_type == 'NO':  # Normalmente Abierto
+            return 'alarm' if level == HIGH else 'normal'
+        else:  # Normalmente Cerrado
+            return 'alarm' if level == LOW else 'normal'
     
     def read_sensor_state(self, module_id: int) -> str:
         """
@@ -139,23 +220,37 @@ class IOManager:
         gpio_pin = self.module_to_gpio[module_id]
         module_info = self.gpio_to_module[gpio_pin]
         
-        # Modo simulación
-        if not self.gpio_initialized or self.defaults['simulation_mode']:
-            return module_info.get('simulated_state', 'normal')
-        
-        # Modo real - leer GPIO
         try:
-            current_state = GPIO.input(gpio_pin)
-            sensor_type = module_info['sensor_type']
-            
-            if sensor_type == 'NO':  # Normalmente Abierto
-                return 'alarm' if current_state == GPIO.HIGH else 'normal'
-            else:  # Normalmente Cerrado
-                return 'alarm' if current_state == GPIO.LOW else 'normal'
-                
+            return self._level_to_state(self.backend.read_pin(gpio_pin), module_info['sensor_type'])
         except Exception as e:
-            logging.error(f"Error reading GPIO pin {gpio_pin}: {e}")
+            logger.error(f"Error reading GPIO pin {gpio_pin}: {e}")
             return 'unknown'
+
+    def read_all_sensor_states(self) -> Dict[int, str]:
+        """
+        Leer todos los sensores de una vez.
+
+        En expansores de puertos es una transacción por chip en lugar de una por pin.
+
+        Returns:
+            {module_id: 'normal' | 'alarm' | 'unknown'}
+        """
+        pins = list(self.gpio_to_module)
+        try:
+            levels = self.backend.read_pins(pins)
+        except Exception as e:
+            logger.error(f"Error reading inputs: {e}")
+            return {info['module_id']: 'unknown' for info in self.gpio_to_module.values()}
+
+        states = {}
+        for gpio_pin in pins:
+            module_info = self.gpio_to_module.get(gpio_pin)
+            if module_info is None:
+                continue
+            level = levels.get(gpio_pin)
+            states[module_info['module_id']] = (
+                'unknown' if level is None else self._level_to_state(level, module_info['sensor_type']))
+        return states
     
     def set_sensor_state(self, module_id: int, state: str) -> bool:
         """
@@ -168,13 +263,17 @@ class IOManager:
         Returns:
             True si se estableció exitosamente
         """
-        if module_id not in self.module_to_gpio:
+        if module_id not in self.module_to_gpio or not hasattr(self.backend, 'set_level'):
             return False
         
         gpio_pin = self.module_to_gpio[module_id]
         if gpio_pin in self.gpio_to_module:
-            self.gpio_to_module[gpio_pin]['simulated_state'] = state
-            logging.info(f"Simulated sensor {module_id} set to {state}")
+            sensor_type = self.gpio_to_module[gpio_pin]['sensor_type']
+            # Nivel eléctrico que corresponde al estado pedido
+            alarm_level = HIGH if sensor_type == 'NO' else LOW
+            normal_level = LOW if sensor_type == 'NO' else HIGH
+            self.backend.set_level(gpio_pin, alarm_level if state == 'alarm' else normal_level)
+            logger.info(f"Simulated sensor {module_id} set to {state}")
             return True
         
         return False
@@ -190,43 +289,38 @@ class IOManager:
         Returns:
             True si se activó exitosamente
         """
-        # Mapeo de tipos de salida a pines GPIO (configurable)
-        output_pins = {
-            'siren': 17,   # Pin para sirena
-            'status_led': 27,  # LED de estado
-            'relay_1': 22,     # Relé 1
-            'relay_2': 23,     # Relé 2
-        }
+        # Mapeo de tipos de salida a pines GPIO (sección 'io.output_pins' de la configuración)
+        output_pins = self.defaults['output_pins']
         
         if output_type not in output_pins:
-            logging.error(f"Unknown output type: {output_type}")
+            logger.error(f"Unknown output type: {output_type}")
             return False
         
         pin = output_pins[output_type]
         
-        if not self.gpio_initialized or self.defaults['simulation_mode']:
-            logging.info(f"[SIM] Output {output_type} activated on pin {pin}")
-            return True
+        if not self.gpio_initialized:
+            logger.error("GPIO not initialized")
+            return False
         
         try:
-            GPIO.setup(pin, GPIO.OUT)
-            GPIO.output(pin, GPIO.HIGH)
+            self.backend.setup_output(pin)
+            self.backend.write_pin(pin, HIGH)
             
             # Si hay duración, programar apagado
             if duration:
                 threading.Timer(duration, self._deactivate_output, args=[pin]).start()
             
-            logging.info(f"Output {output_type} activated on pin {pin}")
+            logger.info(f"Output {output_type} activated on pin {pin}")
             return True
         except Exception as e:
-            logging.error(f"Failed to activate output {output_type}: {e}")
+            logger.error(f"Failed to activate output {output_type}: {e}")
             return False
     
     def _deactivate_output(self, pin: int):
-        """Desactivar una salida GPIO."""
+        """Desactivar una salida."""
         try:
-            GPIO.output(pin, GPIO.LOW)
-        except:
+            self.backend.write_pin(pin, LOW)
+        except Exception:
             pass
     
     def start_monitoring(self):
@@ -240,43 +334,63 @@ class IOManager:
             daemon=True
         )
         self.monitoring_thread.start()
-        logging.info("I/O monitoring started")
+        logger.info("I/O monitoring started")
     
     def stop_monitoring(self):
         """Detener monitoreo."""
         self.monitoring_active = False
         if self.monitoring_thread:
             self.monitoring_thread.join(timeout=2)
-        logging.info("I/O monitoring stopped")
+        logger.info("I/O monitoring stopped")
     
     def _monitoring_loop(self):
         """Loop principal de monitoreo."""
         while self.monitoring_active:
             try:
-                # Chequear estado de todos los sensores registrados
-                for gpio_pin, module_info in self.gpio_to_module.items():
+                # Una lectura en bloque de todos los sensores registrados
+                states = self.read_all_sensor_states()
+
+                for gpio_pin, module_info in list(self.gpio_to_module.items()):
                     module_id = module_info['module_id']
-                    state = self.read_sensor_state(module_id)
+                    state = states.get(module_id, 'unknown')
                     
                     # Loggear cambios de estado
                     current_state = module_info.get('last_state')
                     if current_state != state:
-                        module_info['last_state'] = state
-                        logging.debug(f"Module {module_id} state changed: {current_state} -> {state}")
+                        self._note_state(module_info, state)
+                        logger.debug(f"Module {module_id} state changed: {current_state} -> {state}")
+
+                        # Sin interrupciones (p. ej. expansores) el sondeo genera el evento
+                        if (not module_info.get('edge_detect') and current_state is not None
+                                and self.on_sensor_trigger):
+                            self.on_sensor_trigger(module_id, state)
+
+                # Una pasada del detector de anomalías por todos los sensores
+                if self.anomalies is not None:
+                    self.anomalies.evaluate()
                 
                 time.sleep(self.defaults['check_interval'])
                 
             except Exception as e:
-                logging.error(f"Error in monitoring loop: {e}")
+                logger.error(f"Error in monitoring loop: {e}")
                 time.sleep(1)
     
+    def sensor_snapshot(self) -> SensorSnapshot:
+        """Instantánea inmutable de los estados conocidos (sin leer el hardware)."""
+        return self.snapshots.current()
+
+    def changes_since(self, version: int):
+        """Sensores que cambiaron tras `version`: (versión actual, estados, completo)."""
+        return self.snapshots.changes_since(version)
+
     def get_all_sensor_states(self) -> Dict[int, dict]:
         """Obtener estado de todos los sensores registrados."""
+        current = self.read_all_sensor_states()
         states = {}
         for module_id, gpio_pin in self.module_to_gpio.items():
             states[module_id] = {
                 'gpio_pin': gpio_pin,
-                'state': self.read_sensor_state(module_id),
+                'state': current.get(module_id, 'unknown'),
                 **self.gpio_to_module[gpio_pin]
             }
         return states
@@ -285,13 +399,17 @@ class IOManager:
         """Limpiar recursos GPIO."""
         self.stop_monitoring()
         
+        if self._unsubscribe_config:
+            self._unsubscribe_config()
+            self._unsubscribe_config = None
+        
         if self.gpio_initialized:
             try:
-                GPIO.cleanup()
+                self.backend.cleanup()
                 self.gpio_initialized = False
-                logging.info("GPIO cleanup completed")
+                logger.info("GPIO cleanup completed")
             except Exception as e:
-                logging.error(f"Error during GPIO cleanup: {e}")
+                logger.error(f"Error during GPIO cleanup: {e}")
     
     def get_gpio_info(self) -> dict:
         """Obtener información sobre la configuración GPIO."""
@@ -299,5 +417,6 @@ class IOManager:
             'initialized': self.gpio_initialized,
             'simulation_mode': self.defaults['simulation_mode'],
             'sensors_registered': len(self.gpio_to_module),
-            'gpio_available': GPIO_AVAILABLE
-        }
\ No newline at end of file
+            'gpio_available': GPIO_AVAILABLE,
+            'backend': self.backend.name
+        }
@@ -0,0 +1,300 @@
+"""
+journal.py
+Diario de eventos (write-ahead) delante de SQLite.
+
+Los eventos de alarma se escriben primero en un archivo circular
+preasignado y mapeado en memoria, con registros de tamaño fijo protegidos
+por CRC32: añadir un evento es copiar unos bytes, sin esperar a SQLite
+(aunque esté bloqueada por un VACUUM o una tarjeta SD lenta). Un hilo los
+vuelca a la BD por lotes. Al arrancar, los registros válidos que no
+llegaron a volcarse se reproducen; el volcado es idempotente porque cada
+registro lleva su ID de alarma definitivo (INSERT OR IGNORE por clave primaria).
+
+Formato: cabecera de 64 bytes (magic ``ALMJ``, versión, tamaño de registro,
+capacidad, último ID volcado) seguida de `capacity` registros. El registro
+con ID n ocupa la posición n % capacity. Los textos nunca se truncan: un
+evento que no cabe en un registro se rechaza con RecordTooLarge.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger("JOURNAL")
+
+MAGIC = b'ALMJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIQ')     # magic, versión, reservado, tam. registro, capacidad, volcado
+HEADER_SIZE = 64
+DRAINED_OFFSET = 16
+RECORD = struct.Struct('<IQqdHH')      # crc, id, módulo, instante (epoch), len(tipo), len(descr.)
+DEFAULT_RECORD_SIZE = 256
+DEFAULT_CAPACITY = 4096
+NO_MODULE = -1                         # module_id None (el campo es un entero)
+
+
+class JournalError(Exception):
+    """El diario no se puede usar (formato incorrecto o lleno)."""
+
+
+class RecordTooLarge(JournalError):
+    """El evento no cabe en un registro; hay que escribirlo por otra vía."""
+
+
+class JournalRecord(NamedTuple):
+    alarm_id: int
+    module_id: Optional[int]
+    created: float  # epoch (UTC)
+    alarm_type: str
+    description: str
+
+
+Sink = Callable[[List[JournalRecord]], None]
+
+
+class EventJournal:
+    """
+    Diario circular de eventos de alarma.
+
+    `sink(records)` recibe lotes en orden de ID y debe persistirlos de forma
+    idempotente; si lanza una excepción el lote se reintenta más tarde.
+    """
+
+    def __init__(self, path: str = 'alarm_events.journal', capacity: int = DEFAULT_CAPACITY,
+                 record_size: int = DEFAULT_RECORD_SIZE, sync_writes: bool = False,
+                 batch_size: int = 256, full_timeout: float = 5.0):
+        """
+        Args:
+            path: Archivo del diario (se crea preasignado si no existe)
+            capacity: Número de registros del anillo
+            record_size: Bytes por registro; los eventos más largos se rechazan
+            sync_writes: msync de cada registro (sobrevive a cortes de luz, más lento)
+            full_timeout: Segundos que `append` espera si el anillo está lleno
+        """
+        if record_size < RECORD.size + 16:
+            raise ValueError("record_size too small")
+        self.path = path
+        self.sync_writes = sync_writes
+        self.batch_size = batch_size
+        self.full_timeout = full_timeout
+        self.sink: Optional[Sink] = None
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._drain_lock = threading.Lock()  # Un único volcado a la vez (hilo propio o flush)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._open(capacity, record_size)
+
+    # ========== Archivo ==========
+
+    def _open(self, capacity: int, record_size: int):
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER_SIZE
+        if not exists:
+            size = HEADER_SIZE + capacity * record_size
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, 0, record_size, capacity, 0).ljust(HEADER_SIZE, b'\0'))
+                # Preasignar: el anillo nunca crece ni fragmenta
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(f.fileno(), 0, size)
+                else:
+                    f.write(b'\0' * (size - HEADER_SIZE))
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._file = open(self.path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, version, _, record_size, capacity, drained = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise JournalError(f"{self.path} is not an event journal")
+        if len(self._mm) < HEADER_SIZE + capacity * record_size:
+            self.close()
+            raise JournalError(f"{self.path} is truncated")
+        self.record_size = record_size
+        self.capacity = capacity
+        self._drained = drained
+
+        # Registros válidos aún no volcados y siguiente ID
+        pending = [r for r in self._scan() if r.alarm_id > drained]
+        self._written = max([drained] + [r.alarm_id for r in pending])
+        self._next_id = self._written + 1
+        self._replay = sorted(pending, key=lambda r: r.alarm_id)
+
+    def _scan(self):
+        for slot in range(self.capacity):
+            record = self._read_slot(slot)
+            if record is not None:
+                yield record
+
+    def _offset(self, alarm_id: int) -> int:
+        return HEADER_SIZE + (alarm_id % self.capacity) * self.record_size
+
+    def _read_slot(self, slot: int) -> Optional[JournalRecord]:
+        offset = HEADER_SIZE + slot * self.record_size
+        data = self._mm[offset:offset + self.record_size]
+        crc, alarm_id, module_id, created, type_len, desc_len = RECORD.unpack_from(data, 0)
+        if alarm_id == 0 or RECORD.size + type_len + desc_len > self.record_size:
+            return None
+        if zlib.crc32(data[4:RECORD.size + type_len + desc_len]) != crc:
+            return None  # Registro a medio escribir o dañado
+        text = data[RECORD.size:RECORD.size + type_len + desc_len]
+        return JournalRecord(alarm_id, None if module_id == NO_MODULE else module_id, created,
+                             text[:type_len].decode('utf-8', 'replace'),
+                             text[type_len:].decode('utf-8', 'replace'))
+
+    def _texts(self, alarm_type: str, description: str):
+        alarm_type, description = alarm_type.encode('utf-8'), description.encode('utf-8')
+        if RECORD.size + len(alarm_type) + len(description) > self.record_size:
+            raise RecordTooLarge(f"event of {len(alarm_type) + len(description)} bytes does not fit "
+                                 f"a {self.record_size}-byte journal record")
+        return alarm_type, description
+
+    def _encode(self, record: JournalRecord) -> bytes:
+        alarm_type, description = self._texts(record.alarm_type, record.description)
+        module_id = NO_MODULE if record.module_id is None else record.module_id
+        body = RECORD.pack(0, record.alarm_id, module_id, record.created,
+                           len(alarm_type), len(description))[4:] + alarm_type + description
+        return struct.pack('<I', zlib.crc32(body)) + body
+
+    # ========== Escritura ==========
+
+    def reserve_ids(self, last_id: int):
+        """Garantizar que los IDs nuevos sean mayores que `last_id` (p. ej. el máximo de la BD)."""
+        with self._lock:
+            if last_id >= self._next_id:
+                self._next_id = last_id + 1
+                if self._drained < last_id and self._written <= last_id:
+                    self._written = last_id
+                    self._set_drained(last_id)
+
+    def append(self, module_id: Optional[int], alarm_type: str, description: str = "",
+               created: float = None) -> int:
+        """
+        Añadir un evento y devolver su ID de alarma definitivo.
+
+        Raises:
+            RecordTooLarge: Los textos no caben en un registro (no se consume ID)
+            JournalError: El anillo sigue lleno tras `full_timeout` segundos
+        """
+        self._texts(alarm_type, description or "")
+        with self._cond:
+            deadline = time.monotonic() + self.full_timeout
+            while self._next_id - self._drained > self.capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise JournalError("event journal is full")
+                self._cond.wait(remaining)
+
+            alarm_id = self._next_id
+            record = JournalRecord(alarm_id, module_id, time.time() if created is None else created,
+                                   alarm_type, description or "")
+            offset = self._offset(alarm_id)
+            data = self._encode(record)
+            self._mm[offset:offset + len(data)] = data
+            if self.sync_writes:
+                page = offset - offset % mmap.ALLOCATIONGRANULARITY
+                self._mm.flush(page, offset + self.record_size - page)
+            self._next_id += 1
+            self._written = alarm_id
+            self._cond.notify_all()
+        return alarm_id
+
+    # ========== Volcado ==========
+
+    def _set_drained(self, alarm_id: int):
+        self._drained = alarm_id
+        struct.pack_into('<Q', self._mm, DRAINED_OFFSET, alarm_id)
+
+    def backlog(self) -> int:
+        """Eventos escritos y aún no volcados a la BD."""
+        with self._lock:
+            return self._written - self._drained
+
+    def drain(self) -> int:
+        """Volcar al `sink` todo lo pendiente (incluida la reproducción inicial)."""
+        if self.sink is None:
+            return 0
+        with self._drain_lock:
+            return self._drain()
+
+    def _drain(self) -> int:
+        total = 0
+        if self._replay:
+            replay, self._replay = self._replay, []
+            logger.warning(f"Replaying {len(replay)} undrained journal event(s)")
+            for i in range(0, len(replay), self.batch_size):
+                batch = replay[i:i + self.batch_size]
+                self.sink(batch)
+                total += len(batch)
+            with self._lock:
+                self._set_drained(max(self._drained, replay[-1].alarm_id))
+                self._cond.notify_all()
+
+        while True:
+            with self._lock:
+                first, last = self._drained + 1, min(self._written, self._drained + self.batch_size)
+            if first > last:
+                break
+            batch = [r for r in (self._read_slot(i % self.capacity) for i in range(first, last + 1))
+                     if r is not None and first <= r.alarm_id <= last]
+            self.sink(batch)
+            with self._lock:
+                self._set_drained(last)
+                self._cond.notify_all()
+            total += len(batch)
+        if total:
+            self._mm.flush(0, mmap.PAGESIZE)
+        return total
+
+    def start(self, interval: float = 0.5):
+        """Volcar en segundo plano; `append` despierta al hilo al instante."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,),
+                                        name="journal-drain", daemon=True)
+        self._thread.start()
+
+    def _loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                # La BD puede estar bloqueada: los eventos siguen a salvo en el diario
+                logger.error(f"Journal drain failed, will retry: {e}")
+                self._stop.wait(interval)
+                continue
+            with self._cond:
+                if self._written == self._drained and not self._stop.is_set():
+                    self._cond.wait(interval)
+
+    def stop(self, drain: bool = True):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if drain:
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Final journal drain failed: {e}")
+
+    def close(self):
+        if self._thread:
+            self.stop()
+        mm, self._mm = getattr(self, '_mm', None), None
+        if mm is not None:
+            mm.flush()
+            mm.close()
+        if getattr(self, '_file', None):
+            self._file.close()
+            self._file = None
@@ -0,0 +1,321 @@
+"""
+profiler.py
+Hooks de perfilado opcionales para AlarmCore: tiempos por método público,
+registro de las sentencias SQL más lentas (con forma de parámetros y
+EXPLAIN QUERY PLAN) y muestreo opcional de pilas de llamada.
+
+Uso desde la línea de comandos para inspeccionar un volcado:
+    python profiler.py alarm_profile.json [--top 20]
+"""
+
+import functools
+import heapq
+import itertools
+import json
+import logging
+import random
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("PROFILER")
+
+
+def _param_shape(params) -> str:
+    """Describir la forma de los parámetros sin exponer sus valores."""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    try:
+        return "(" + ", ".join(type(p).__name__ for p in params) + ")"
+    except TypeError:
+        return type(params).__name__
+
+
+class _Stat:
+    """Estadísticas acumuladas de una sentencia o método."""
+
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class QueryProfiler:
+    """Acumula tiempos de métodos y sentencias SQL de un AlarmCore."""
+
+    def __init__(self, slow_top_n: int = 20, slow_threshold_ms: float = 0.0,
+                 stack_sample_rate: float = 0.0, explain: bool = True):
+        """
+        Args:
+            slow_top_n: Número de sentencias lentas que se conservan
+            slow_threshold_ms: Solo se consideran lentas las que superan este umbral
+            stack_sample_rate: Fracción (0-1) de llamadas SQL de las que se guarda la pila
+            explain: Ejecutar EXPLAIN QUERY PLAN sobre las sentencias lentas
+        """
+        self.slow_top_n = slow_top_n
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self.stack_sample_rate = stack_sample_rate
+        self.explain = explain
+        self.enabled = True
+
+        self._lock = threading.Lock()
+        self._methods: Dict[str, _Stat] = {}
+        self._statements: Dict[str, _Stat] = {}
+        self._slow: List[tuple] = []  # min-heap: (elapsed, counter, entry)
+        self._counter = 0
+        self._stacks: Dict[str, int] = {}
+
+    # ===== REGISTRO =====
+
+    def record_method(self, name: str, elapsed: float):
+        with self._lock:
+            stat = self._methods.get(name)
+            if stat is None:
+                stat = self._methods[name] = _Stat()
+            stat.add(elapsed)
+
+    def record_statement(self, connection, sql: str, params, elapsed: float):
+        sql_key = " ".join(sql.split())
+        with self._lock:
+            stat = self._statements.get(sql_key)
+            if stat is None:
+                stat = self._statements[sql_key] = _Stat()
+            stat.add(elapsed)
+
+            if self.stack_sample_rate and random.random() < self.stack_sample_rate:
+                # Omitir los marcos del propio perfilador
+                frames = traceback.extract_stack()[:-3]
+                key = " <- ".join(f"{f.name}:{f.lineno}" for f in reversed(frames[-6:]))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+
+            if elapsed < self.slow_threshold:
+                return
+            if len(self._slow) >= self.slow_top_n and elapsed <= self._slow[0][0]:
+                return
+
+        # EXPLAIN fuera del lock: solo para sentencias que entran en el top N
+        plan = self._explain(connection, sql, params) if self.explain else None
+        entry = {
+            'sql': sql_key,
+            'params_shape': _param_shape(params),
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'plan': plan,
+        }
+        with self._lock:
+            self._counter += 1
+            item = (elapsed, self._counter, entry)
+            if len(self._slow) < self.slow_top_n:
+                heapq.heappush(self._slow, item)
+            elif elapsed > self._slow[0][0]:
+                heapq.heapreplace(self._slow, item)
+
+    @staticmethod
+    def _explain(connection, sql: str, params) -> Optional[List[str]]:
+        head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if head not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE'):
+            return None
+        try:
+            # Cursor "crudo" para no volver a entrar en el perfilador
+            cursor = sqlite3.Cursor(connection)
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params if params is not None else ())
+            return [row[-1] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f"<explain failed: {e}>"]
+
+    # ===== INSTRUMENTACIÓN =====
+
+    def instrument(self, obj, exclude=('close',)):
+        """Envolver todos los métodos públicos de `obj` para medir su duración."""
+        cls_name = type(obj).__name__
+        for name in dir(type(obj)):
+            if name.startswith('_') or name in exclude:
+                continue
+            attr = getattr(obj, name, None)
+            if not callable(attr):
+                continue
+            setattr(obj, name, self._wrap(f"{cls_name}.{name}", attr))
+
+    def _wrap(self, qualname: str, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record_method(qualname, time.perf_counter() - start)
+        return wrapper
+
+    def connection_factory(self):
+        """Devolver una clase sqlite3.Connection cuyos cursores miden cada sentencia."""
+        profiler = self
+
+        class ProfilingCursor(sqlite3.Cursor):
+            def execute(self, sql, parameters=()):
+                if not profiler.enabled:
+                    return super().execute(sql, parameters)
+                start = time.perf_counter()
+                try:
+                    return super().execute(sql, parameters)
+                finally:
+                    profiler.record_statement(self.connection, sql, parameters,
+                                              time.perf_counter() - start)
+
+            def executemany(self, sql, seq_of_parameters):
+                if not profiler.enabled:
+                    return super().executemany(sql, seq_of_parameters)
+                # La primera fila de parámetros sirve para el EXPLAIN
+                rows = iter(seq_of_parameters)
+                first = next(rows, None)
+                if first is not None:
+                    rows = itertools.chain((first,), rows)
+                start = time.perf_counter()
+                try:
+                    return super().executemany(sql, rows)
+                finally:
+                    profiler.record_statement(self.connection, sql, first,
+                                              time.perf_counter() - start)
+
+        class ProfilingConnection(sqlite3.Connection):
+            def cursor(self, factory=ProfilingCursor):
+                return super().cursor(factory)
+
+            def execute(self, sql, parameters=()):
+                return self.cursor().execute(sql, parameters)
+
+            def commit(self):
+                # En tarjetas SD el fsync del commit suele ser lo más caro
+                if not profiler.enabled:
+                    return super().commit()
+                start = time.perf_counter()
+                try:
+                    return super().commit()
+                finally:
+                    profiler.record_statement(self, "COMMIT", None,
+                                              time.perf_counter() - start)
+
+        return ProfilingConnection
+
+    # ===== RESULTADOS =====
+
+    def report(self) -> dict:
+        """Obtener una instantánea del perfil como diccionario serializable."""
+        with self._lock:
+            methods = {k: v.to_dict() for k, v in self._methods.items()}
+            statements = {k: v.to_dict() for k, v in self._statements.items()}
+            slow = [entry for _, _, entry in sorted(self._slow, reverse=True)]
+            stacks = sorted(self._stacks.items(), key=lambda kv: kv[1], reverse=True)
+        return {
+            'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'methods': methods,
+            'statements': statements,
+            'slow_queries': slow,
+            'stack_samples': [{'stack': k, 'count': v} for k, v in stacks],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._statements.clear()
+            self._slow.clear()
+            self._stacks.clear()
+
+    def dump(self, path: str) -> str:
+        """Guardar el informe en formato JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info(f"Profile dumped to {path}")
+        return path
+
+    def install_dump_signal(self, path: str) -> bool:
+        """
+        Volcar el perfil a `path` al recibir SIGUSR1 (kill -USR1 <pid>).
+
+        Solo funciona desde el hilo principal y en sistemas con SIGUSR1.
+        """
+        import signal
+        if not hasattr(signal, 'SIGUSR1'):
+            return False
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump(path))
+            return True
+        except ValueError as e:  # no estamos en el hilo principal
+            logger.warning(f"Cannot install profile dump signal: {e}")
+            return False
+
+
+def format_report(report: dict, top: int = 20) -> str:
+    """Formatear un informe de perfil como texto legible."""
+    lines = [f"Profile generated at {report.get('generated_at', '?')}", ""]
+
+    lines.append("== Methods (by total time) ==")
+    methods = sorted(report.get('methods', {}).items(),
+                     key=lambda kv: kv[1]['total_ms'], reverse=True)
+    for name, s in methods[:top]:
+        lines.append(f"{s['total_ms']:>10.2f} ms  {s['calls']:>7} calls  "
+                     f"mean {s['mean_ms']:>8.3f}  max {s['max_ms']:>8.3f}  {name}")
+
+    lines.append("")
+    lines.append("== Statements (by total time) ==")
+    statements = sorted(report.get('statements', {}).items(),
+                        key=lambda kv: kv[1]['total_ms'], reverse=True)
+    for sql, s in statements[:top]:
+        lines.append(f"{s['total_ms']:>10.2f} ms  {s['calls']:>7} calls  "
+                     f"max {s['max_ms']:>8.3f}  {sql[:100]}")
+
+    lines.append("")
+    lines.append("== Slowest statements ==")
+    for entry in report.get('slow_queries', [])[:top]:
+        lines.append(f"{entry['elapsed_ms']:>10.2f} ms  {entry['params_shape']}  {entry['sql'][:100]}")
+        for step in entry.get('plan') or []:
+            lines.append(f"{'':>14}plan: {step}")
+
+    samples = report.get('stack_samples', [])
+    if samples:
+        lines.append("")
+        lines.append("== Sampled call stacks ==")
+        for sample in samples[:top]:
+            lines.append(f"{sample['count']:>7}  {sample['stack']}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show an AlarmCore profile dump")
+    parser.add_argument("dump", help="JSON file written by AlarmCore.dump_profile()")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        with open(args.dump) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read profile dump: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(format_report(data, args.top))
@@ -0,0 +1,150 @@
+"""
+records.py
+Registros tipados y compactos (``__slots__``) para filas de la BD.
+
+Las consultas del núcleo devuelven `Alarm`, `Module` y `User` en lugar de
+tuplas leídas por posición. `row_factory` construye los registros por
+nombre de columna (la correspondencia se calcula una vez por consulta) y
+convierte los timestamps en `datetime` una sola vez, al leer la fila.
+`check_layout` comprueba al arrancar que los campos siguen existiendo en
+las tablas (ver schema.py).
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from history import parse_timestamp
+
+
+class Record:
+    """Base: campos en `__slots__`, igualdad por valor y conversión a dict."""
+
+    __slots__ = ()
+    table: str = ''
+    timestamp_fields: tuple = ()
+    derived_fields: tuple = ()  # Campos de JOIN o calculados, no columnas de `table`
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            value = values.get(name)
+            if name in self.timestamp_fields:
+                value = parse_timestamp(value)
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def columns(cls) -> tuple:
+        """Columnas de `table` que respaldan este registro."""
+        return tuple(name for name in cls.__slots__ if name not in cls.derived_fields)
+
+
+class Alarm(Record):
+    __slots__ = ('id', 'module_id', 'alarm_type', 'description', 'timestamp',
+                 'acknowledged', 'acknowledged_by', 'acknowledged_at', 'module_name')
+    table = 'alarms'
+    timestamp_fields = ('timestamp', 'acknowledged_at')
+    derived_fields = ('module_name',)
+
+    id: int
+    module_id: Optional[int]
+    alarm_type: str
+    description: Optional[str]
+    timestamp: Optional[datetime]
+    acknowledged: Optional[int]
+    acknowledged_by: Optional[str]
+    acknowledged_at: Optional[datetime]
+    module_name: Optional[str]
+
+
+class Module(Record):
+    __slots__ = ('id', 'name', 'status', 'last_updated')
+    table = 'modules'
+    timestamp_fields = ('last_updated',)
+
+    id: int
+    name: str
+    status: str
+    last_updated: Optional[datetime]
+
+
+class User(Record):
+    """Usuario sin el hash de la contraseña."""
+
+    __slots__ = ('id', 'username', 'role', 'created_at')
+    table = 'users'
+    timestamp_fields = ('created_at',)
+
+    id: int
+    username: str
+    role: str
+    created_at: Optional[datetime]
+
+
+RECORD_TYPES = (Alarm, Module, User)
+
+
+def row_factory(record_type):
+    """
+    Row factory de sqlite3 que construye `record_type` por nombre de columna.
+
+    Uso: ``cursor.row_factory = row_factory(Alarm)``. Las columnas de la
+    consulta que no son campos del registro se ignoran; los campos que
+    faltan quedan a None.
+    """
+    slots = record_type.__slots__
+    timestamp_fields = record_type.timestamp_fields
+    cache = {'description': None, 'plan': ()}
+    setter = object.__setattr__
+
+    def factory(cursor, row):
+        # cursor.description es el mismo objeto para todas las filas de una consulta
+        description = cursor.description
+        if description is not cache['description']:
+            names = [column[0] for column in description]
+            cache['plan'] = tuple((names.index(name), name, name in timestamp_fields)
+                                  for name in slots if name in names)
+            cache['missing'] = tuple(name for name in slots if name not in names)
+            cache['description'] = description
+        record = record_type.__new__(record_type)
+        for index, name, is_timestamp in cache['plan']:
+            value = row[index]
+            setter(record, name, parse_timestamp(value) if is_timestamp else value)
+        for name in cache['missing']:
+            setter(record, name, None)
+        return record
+
+    return factory
+
+
+def check_layout(cursor):
+    """
+    Verificar que cada columna de cada registro existe en su tabla.
+
+    Raises:
+        RuntimeError: La BD no tiene la estructura que esperan los registros
+    """
+    for record_type in RECORD_TYPES:
+        cursor.execute(f"PRAGMA table_info({record_type.table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        missing = [name for name in record_type.columns() if name not in existing]
+        if missing:
+            raise RuntimeError(f"table '{record_type.table}' lacks columns {missing} "
+                               f"required by {record_type.__name__}")
@@ -0,0 +1,388 @@
+"""
+replication.py
+Replicación de varios paneles hacia un colector central.
+
+Cada panel ejecuta un `ReplicationAgent` que envía las alarmas nuevas y las
+transiciones de estado de los módulos por TCP, en lotes comprimidos. El
+colector (`ReplicationCollector`) guarda, por sitio y por flujo, la marca de
+agua más alta recibida; al reconectar, el agente continúa desde ahí.
+
+Protocolo (todas las tramas):
+    cabecera: b'AR' | u8 versión | u8 tipo | u32 longitud   (red, big-endian)
+    cuerpo:   JSON compacto comprimido con zlib
+
+    HELLO  agente -> colector   {"site": id}
+    STATE  colector -> agente   {"hwm": {flujo: último_id}}
+    BATCH  agente -> colector   {"seq": n, "stream": flujo, "columns": [...], "rows": [[...], ...]}
+    ACK    colector -> agente   {"seq": n, "stream": flujo, "hwm": último_id}
+
+El agente mantiene como máximo `window` lotes sin confirmar; si el colector
+va lento, el agente deja de leer de la base de datos (contrapresión).
+
+Uso en una sola máquina:
+    python replication.py collector --db central.db --port 7410
+    python replication.py agent --db alarm_core.db --site panel-1 --port 7410
+"""
+
+import json
+import logging
+import socket
+import socketserver
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Dict
+
+logger = logging.getLogger("REPLICATION")
+
+MAGIC = b'AR'
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('!2sBBI')
+MAX_FRAME = 16 * 1024 * 1024
+
+MSG_HELLO = 1
+MSG_STATE = 2
+MSG_BATCH = 3
+MSG_ACK = 4
+
+# flujo -> (tabla local, tabla en el colector, columnas replicadas)
+STREAMS = {
+    'alarms': ('alarms', 'remote_alarms',
+               ('id', 'module_id', 'alarm_type', 'description', 'timestamp', 'acknowledged')),
+    'transitions': ('module_transitions', 'remote_transitions',
+                    ('id', 'module_id', 'old_status', 'new_status', 'timestamp')),
+}
+
+
+class ProtocolError(Exception):
+    """Trama inválida o inesperada."""
+
+
+# ===== TRAMAS =====
+
+def encode_frame(msg_type: int, body: dict) -> bytes:
+    payload = zlib.compress(json.dumps(body, separators=(',', ':'), default=str).encode('utf-8'))
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, len(payload)) + payload
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """Leer una trama completa. Devuelve (tipo, cuerpo)."""
+    magic, version, msg_type, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if magic != MAGIC or version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Bad frame header {magic!r} v{version}")
+    if length > MAX_FRAME:
+        raise ProtocolError(f"Frame too large ({length} bytes)")
+    # Descompresión acotada: una trama pequeña no puede expandirse sin límite
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(_recv_exact(sock, length), MAX_FRAME)
+    if decompressor.unconsumed_tail:
+        raise ProtocolError(f"Frame expands beyond {MAX_FRAME} bytes")
+    body = json.loads(data)
+    return msg_type, body
+
+
+# ===== AGENTE (PANEL) =====
+
+class ReplicationAgent:
+    """Envía alarmas y transiciones de un AlarmCore a un colector central."""
+
+    def __init__(self, core, site_id: str, host: str = '127.0.0.1', port: int = 7410,
+                 batch_size: int = 500, window: int = 4, poll_interval: float = 1.0,
+                 max_backoff: float = 60.0):
+        """
+        Args:
+            core: AlarmCore local (se usa una conexión propia)
+            site_id: Identificador único del panel
+            batch_size: Filas por lote
+            window: Lotes enviados sin confirmar como máximo
+            poll_interval: Espera (s) cuando no hay datos nuevos
+            max_backoff: Espera máxima (s) entre reintentos de conexión
+        """
+        self.core = core
+        self.site_id = site_id
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.window = window
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self.connected = False
+        self.acked_hwm: Dict[str, int] = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"Replication agent '{self.site_id}' started -> {self.host}:{self.port}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info(f"Replication agent '{self.site_id}' stopped")
+
+    def _run(self):
+        backoff = 1.0
+        connection = self.core.open_connection()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                        self.connected = True
+                        backoff = 1.0
+                        self._session(sock, connection)
+                except (OSError, ProtocolError, ValueError) as e:
+                    if not self._stop_event.is_set():
+                        logger.warning(f"Replication link down ({e}); retrying in {backoff:.0f}s")
+                finally:
+                    self.connected = False
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            connection.close()
+
+    def _session(self, sock, connection):
+        sock.sendall(encode_frame(MSG_HELLO, {'site': self.site_id}))
+        msg_type, body = read_frame(sock)
+        if msg_type != MSG_STATE:
+            raise ProtocolError(f"Expected STATE, got {msg_type}")
+
+        # Reanudar desde lo que el colector ya tiene
+        self.acked_hwm = {stream: int(body.get('hwm', {}).get(stream, 0)) for stream in STREAMS}
+        sent_hwm = dict(self.acked_hwm)
+        outstanding = 0
+        seq = 0
+
+        while not self._stop_event.is_set():
+            sent_any = False
+            for stream in STREAMS:
+                # Contrapresión: no leer más filas con la ventana llena
+                while outstanding >= self.window:
+                    outstanding -= self._read_ack(sock)
+                columns, rows = self._fetch(connection, stream, sent_hwm[stream])
+                if not rows:
+                    continue
+                seq += 1
+                sock.sendall(encode_frame(MSG_BATCH, {
+                    'seq': seq, 'stream': stream, 'columns': columns, 'rows': rows}))
+                sent_hwm[stream] = rows[-1][0]
+                outstanding += 1
+                sent_any = True
+
+            if not sent_any:
+                # Al día: vaciar confirmaciones pendientes y esperar datos nuevos
+                while outstanding:
+                    outstanding -= self._read_ack(sock)
+                self._stop_event.wait(self.poll_interval)
+
+    def _read_ack(self, sock) -> int:
+        msg_type, body = read_frame(sock)
+        if msg_type != MSG_ACK:
+            raise ProtocolError(f"Expected ACK, got {msg_type}")
+        self.acked_hwm[body['stream']] = int(body['hwm'])
+        return 1
+
+    def _fetch(self, connection, stream: str, after_id: int):
+        table, _, columns = STREAMS[stream]
+        try:
+            cursor = connection.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, self.batch_size))
+            return list(columns), [list(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read {stream} for replication: {e}")
+            return list(columns), []
+
+
+# ===== COLECTOR (CENTRAL) =====
+
+class ReplicationCollector:
+    """Recibe lotes de varios paneles y los guarda en una base de datos central."""
+
+    def __init__(self, db_name: str = 'central.db', host: str = '0.0.0.0', port: int = 7410):
+        self.db_name = db_name
+        self.host = host
+        self.port = port
+        self._write_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._initialize_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_name, timeout=30)
+
+    def _initialize_db(self):
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS sites (
+                    site_id TEXT NOT NULL,
+                    stream TEXT NOT NULL,
+                    hwm INTEGER NOT NULL DEFAULT 0,
+                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (site_id, stream)
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS remote_alarms (
+                    site_id TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    module_id INTEGER,
+                    alarm_type TEXT,
+                    description TEXT,
+                    timestamp TIMESTAMP,
+                    acknowledged BOOLEAN,
+                    PRIMARY KEY (site_id, id)
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS remote_transitions (
+                    site_id TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    module_id INTEGER,
+                    old_status TEXT,
+                    new_status TEXT,
+                    timestamp TIMESTAMP,
+                    PRIMARY KEY (site_id, id)
+                )
+            ''')
+            connection.commit()
+        finally:
+            connection.close()
+
+    def high_water_marks(self, connection, site_id: str) -> Dict[str, int]:
+        rows = connection.execute("SELECT stream, hwm FROM sites WHERE site_id = ?", (site_id,))
+        return {stream: hwm for stream, hwm in rows.fetchall()}
+
+    def apply_batch(self, connection, site_id: str, body: dict) -> int:
+        """Guardar un lote de forma idempotente y avanzar la marca de agua."""
+        stream = body['stream']
+        if stream not in STREAMS:
+            raise ProtocolError(f"Unknown stream {stream!r}")
+        _, remote_table, known_columns = STREAMS[stream]
+        columns = [c for c in body['columns'] if c in known_columns]
+        indexes = [body['columns'].index(c) for c in columns]
+        rows = [[site_id] + [row[i] for i in indexes] for row in body['rows']]
+        if not rows:
+            return self.high_water_marks(connection, site_id).get(stream, 0)
+
+        hwm = max(row[body['columns'].index('id')] for row in body['rows'])
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        with self._write_lock:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {remote_table} (site_id, {', '.join(columns)}) "
+                f"VALUES ({placeholders})", rows)
+            connection.execute('''
+                INSERT INTO sites (site_id, stream, hwm, last_seen)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(site_id, stream) DO UPDATE SET
+                    hwm = MAX(hwm, excluded.hwm),
+                    last_seen = CURRENT_TIMESTAMP
+            ''', (site_id, stream, hwm))
+            connection.commit()
+        return hwm
+
+    def _make_handler(self):
+        collector = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock = self.request
+                connection = collector._connect()
+                site_id = None
+                try:
+                    msg_type, body = read_frame(sock)
+                    if msg_type != MSG_HELLO or not body.get('site'):
+                        raise ProtocolError("Expected HELLO")
+                    site_id = str(body['site'])
+                    sock.sendall(encode_frame(MSG_STATE, {
+                        'hwm': collector.high_water_marks(connection, site_id)}))
+                    logger.info(f"Site '{site_id}' connected from {self.client_address[0]}")
+
+                    while True:
+                        msg_type, body = read_frame(sock)
+                        if msg_type != MSG_BATCH:
+                            raise ProtocolError(f"Expected BATCH, got {msg_type}")
+                        hwm = collector.apply_batch(connection, site_id, body)
+                        sock.sendall(encode_frame(MSG_ACK, {
+                            'seq': body['seq'], 'stream': body['stream'], 'hwm': hwm}))
+                except ConnectionError:
+                    pass
+                except (ProtocolError, ValueError, KeyError, sqlite3.Error) as e:
+                    logger.error(f"Replication session error (site {site_id}): {e}")
+                finally:
+                    connection.close()
+                    if site_id:
+                        logger.info(f"Site '{site_id}' disconnected")
+
+        return Handler
+
+    def start(self):
+        """Escuchar en un hilo en segundo plano."""
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Replication collector listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        logger.info("Replication collector stopped")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Alarm replication agent / collector")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    collector_parser = subparsers.add_parser("collector", help="Run the central collector")
+    collector_parser.add_argument("--db", default="central.db")
+    collector_parser.add_argument("--host", default="0.0.0.0")
+    collector_parser.add_argument("--port", type=int, default=7410)
+
+    agent_parser = subparsers.add_parser("agent", help="Replicate a local panel")
+    agent_parser.add_argument("--db", default="alarm_core.db")
+    agent_parser.add_argument("--site", required=True)
+    agent_parser.add_argument("--host", default="127.0.0.1")
+    agent_parser.add_argument("--port", type=int, default=7410)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.mode == "collector":
+        service = ReplicationCollector(args.db, args.host, args.port)
+    else:
+        from core import AlarmCore
+        service = ReplicationAgent(AlarmCore(args.db), args.site, args.host, args.port)
+
+    service.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        service.stop()
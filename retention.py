@@ -0,0 +1,266 @@
+"""
+retention.py
+Retención del historial de alarmas: mueve las alarmas antiguas a archivos
+mensuales comprimidos (JSONL con gzip), las borra de la tabla `alarms` en
+transacciones cortas y recupera espacio con `PRAGMA incremental_vacuum`.
+
+Los archivos siguen siendo consultables con `RetentionManager.query_archive`.
+
+Cada ciclo poda también el historial de módulos (history.prune): las
+transiciones y agregados no se archivan, tienen su propio horizonte por
+granularidad (history.RETENTION) independiente de `max_age_days`.
+
+AlarmCore lo ejecuta periódicamente con ``retention=`` (sección
+`retention` de la configuración).
+
+Uso desde la línea de comandos:
+    python retention.py --db alarm_core.db --days 365
+    python retention.py --query 2025-01-01 2025-02-01
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+import history
+
+logger = logging.getLogger("RETENTION")
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class RetentionManager:
+    """Archiva y purga alarmas antiguas de la base de datos de AlarmCore."""
+
+    def __init__(self, core, archive_dir: str = 'archive', max_age_days: int = 365,
+                 chunk_size: int = 500, vacuum_pages: int = 256, pause: float = 0.05,
+                 interval: float = 3600):
+        """
+        Args:
+            core: Instancia de AlarmCore (se usa para abrir conexiones propias);
+                  None si se pasa como ``AlarmCore(retention=...)``, que la completa
+            archive_dir: Directorio de los archivos mensuales
+            max_age_days: Antigüedad a partir de la cual se archiva una alarma
+            chunk_size: Alarmas movidas por transacción
+            vacuum_pages: Páginas liberadas por cada `incremental_vacuum`
+            pause: Pausa (s) entre bloques para no bloquear a los escritores
+            interval: Segundos entre ciclos al ejecutarse en segundo plano
+        """
+        self.core = core
+        self.archive_dir = archive_dir
+        self.max_age_days = max_age_days
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self.interval = interval
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ===== ARCHIVADO =====
+
+    def archive_path(self, month: str) -> str:
+        """Ruta del archivo para un mes 'YYYY-MM'."""
+        return os.path.join(self.archive_dir, f"alarms-{month}.jsonl.gz")
+
+    def run_once(self, now: Optional[datetime] = None) -> dict:
+        """
+        Ejecutar un ciclo completo de archivado y vacuum incremental.
+
+        Returns:
+            Diccionario con alarmas archivadas, bloques procesados, filas de
+            historial podadas y páginas libres restantes
+        """
+        now = now or datetime.utcnow()
+        cutoff = (now - timedelta(days=self.max_age_days)).strftime(TIMESTAMP_FORMAT)
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        archived = 0
+        chunks = 0
+        connection = self.core.open_connection()
+        try:
+            while not self._stop_event.is_set():
+                moved = self._archive_chunk(connection, cutoff)
+                if moved == 0:
+                    break
+                archived += moved
+                chunks += 1
+                self.incremental_vacuum(connection)
+                # Ceder la base de datos a los escritores entre bloques
+                time.sleep(self.pause)
+
+            pruned = history.prune(connection.cursor(), now)
+            connection.commit()
+            free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        finally:
+            connection.close()
+
+        if archived:
+            logger.info(f"Archived {archived} alarms older than {cutoff} in {chunks} chunks.")
+        return {'archived': archived, 'chunks': chunks, 'history_pruned': pruned,
+                'free_pages': free_pages}
+
+    def _archive_chunk(self, connection, cutoff: str) -> int:
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT * FROM alarms
+            WHERE timestamp < ?
+            ORDER BY timestamp
+            LIMIT ?
+        ''', (cutoff, self.chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        columns = [d[0] for d in cursor.description]
+        by_month = {}
+        for row in rows:
+            record = dict(zip(columns, row))
+            month = str(record.get('timestamp') or '')[:7] or 'unknown'
+            by_month.setdefault(month, []).append(record)
+
+        # Primero escribir y sincronizar el archivo; después borrar.
+        # Si se interrumpe entre ambos pasos, la alarma queda duplicada
+        # (nunca perdida) y query_archive descarta el duplicado.
+        for month, records in by_month.items():
+            with open(self.archive_path(month), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                    for record in records:
+                        gz.write((json.dumps(record, default=str) + "\n").encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+        ids = [(record['id'],) for records in by_month.values() for record in records]
+        try:
+            cursor.executemany("DELETE FROM alarms WHERE id = ?", ids)
+            connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to delete archived alarms: {e}")
+            connection.rollback()
+            raise
+        return len(ids)
+
+    def incremental_vacuum(self, connection=None, pages: Optional[int] = None) -> int:
+        """Liberar hasta `pages` páginas libres al sistema de archivos."""
+        pages = pages or self.vacuum_pages
+        own = connection is None
+        connection = connection or self.core.open_connection()
+        try:
+            before = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            # incremental_vacuum devuelve una fila por página; hay que consumirlas
+            connection.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            after = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            return before - after
+        finally:
+            if own:
+                connection.close()
+
+    # ===== CONSULTA DE ARCHIVOS =====
+
+    def list_archives(self) -> List[str]:
+        """Meses archivados disponibles ('YYYY-MM'), en orden."""
+        pattern = os.path.join(self.archive_dir, "alarms-*.jsonl.gz")
+        names = (os.path.basename(p) for p in glob.glob(pattern))
+        return sorted(n[len("alarms-"):-len(".jsonl.gz")] for n in names)
+
+    def query_archive(self, start: Optional[str] = None, end: Optional[str] = None,
+                      module_id: Optional[int] = None,
+                      alarm_type: Optional[str] = None) -> Iterator[dict]:
+        """
+        Recorrer las alarmas archivadas en el rango [start, end).
+
+        Args:
+            start: Timestamp o fecha inicial ('YYYY-MM-DD[ HH:MM:SS]')
+            end: Timestamp o fecha final (exclusivo)
+            module_id: Filtrar por módulo
+            alarm_type: Filtrar por tipo de alarma
+
+        Yields:
+            Un diccionario por alarma, con las columnas de la tabla `alarms`
+        """
+        for month in self.list_archives():
+            # Saltar meses completos fuera del rango sin abrir el archivo
+            if start and month < start[:7]:
+                continue
+            if end and month > end[:7]:
+                continue
+
+            seen = set()
+            with gzip.open(self.archive_path(month), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record['id'] in seen:
+                        continue
+                    seen.add(record['id'])
+
+                    ts = str(record.get('timestamp') or '')
+                    if start and ts < start:
+                        continue
+                    if end and ts >= end:
+                        continue
+                    if module_id is not None and record.get('module_id') != module_id:
+                        continue
+                    if alarm_type is not None and record.get('alarm_type') != alarm_type:
+                        continue
+                    yield record
+
+    # ===== EJECUCIÓN PERIÓDICA =====
+
+    def start(self, interval: Optional[float] = None):
+        """Ejecutar `run_once` periódicamente en un hilo en segundo plano."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval or self.interval,),
+                                        name="retention", daemon=True)
+        self._thread.start()
+        logger.info("Retention scheduler started")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info("Retention scheduler stopped")
+
+    def _loop(self, interval: float):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            self._stop_event.wait(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+    from core import AlarmCore
+
+    parser = argparse.ArgumentParser(description="Archive old alarms or query the archive")
+    parser.add_argument("--db", default="alarm_core.db")
+    parser.add_argument("--archive-dir", default="archive")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--query", nargs=2, metavar=("START", "END"),
+                        help="Print archived alarms in [START, END) instead of archiving")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    core = AlarmCore(args.db)
+    manager = RetentionManager(core, args.archive_dir, args.days)
+    try:
+        if args.query:
+            for alarm in manager.query_archive(*args.query):
+                print(json.dumps(alarm))
+        else:
+            print(manager.run_once())
+    finally:
+        core.close()
@@ -0,0 +1,272 @@
+"""
+rules.py
+Motor de reglas: zonas, modos de armado (away/night/disarmed), retardos
+de entrada/salida y acciones por zona.
+
+Las zonas de la configuración se compilan en una tabla de despacho por
+modo de armado e ID de módulo, de modo que evaluar un evento de sensor es
+una búsqueda en un diccionario sin importar cuántas zonas haya. Recompilar
+construye una tabla nueva y la publica con una sola asignación: los eventos
+en curso siguen usando la tabla anterior y nunca se detiene el procesamiento.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from config import ARM_MODES, ConfigManager, ZoneSettings
+
+logger = logging.getLogger("RULES")
+
+DEFAULT_ZONE = ZoneSettings(name='default')
+
+Action = Callable[[int, ZoneSettings], None]
+
+
+class RuleError(ValueError):
+    """Las reglas no se pueden compilar."""
+
+
+class CompiledRule(NamedTuple):
+    zone: ZoneSettings
+    actions: Tuple[Action, ...]
+
+
+class RuleEngine:
+    """
+    Evalúa eventos de sensores según las zonas y el modo de armado actual.
+
+    Uso típico: ``io_manager.on_sensor_trigger = engine.handle_event``.
+    """
+
+    def __init__(self, core=None, io_manager=None, config=None,
+                 scheduler: Optional[Callable[[Callable[[], None]], None]] = None):
+        """
+        Args:
+            core: AlarmCore donde se registran las alarmas
+            io_manager: IOManager para activar salidas (sirena, relés)
+            config: ConfigManager (recompila al cambiar) o AlarmConfig
+            scheduler: Ejecuta las acciones en otro hilo, p. ej.
+                       ``lambda fn: tk.after(0, fn)``; por defecto en línea.
+                       Necesario si `core` solo admite su propio hilo, ya que
+                       los retardos de entrada vencen en un hilo Timer
+        """
+        self.core = core
+        self.io_manager = io_manager
+        self.scheduler = scheduler
+        self.config_manager = config if isinstance(config, ConfigManager) else None
+        self.config = self.config_manager.snapshot if self.config_manager else config
+
+        self.mode = 'disarmed'
+        self._armed_at = 0.0
+        self._generation = 0  # Cambia al armar/desarmar: invalida retardos pendientes
+        self._lock = threading.Lock()
+        self._pending: Dict[str, threading.Timer] = {}  # zona -> retardo de entrada
+
+        # Acciones adicionales registradas por nombre
+        self.custom_actions: Dict[str, Action] = {}
+
+        # Callbacks
+        self.on_mode_change: Optional[Callable[[str], None]] = None
+        self.on_trigger: Optional[Callable[[int, str], None]] = None
+
+        # {modo: ({module_id: CompiledRule}, regla por defecto o None)}
+        self._dispatch = {}
+        self.compile()
+
+        self._unsubscribe_config = None
+        if self.config_manager:
+            self._unsubscribe_config = self.config_manager.subscribe(self._on_config_change)
+
+    # ========== Compilación ==========
+
+    def _on_config_change(self, old_config, new_config):
+        self.config = new_config
+        if (old_config.zones, old_config.alarm_duration) != (new_config.zones, new_config.alarm_duration):
+            try:
+                self.compile()
+            except RuleError as e:
+                logger.error(f"Rule change rejected, keeping previous rules: {e}")
+
+    def _zones(self):
+        zones = getattr(self.config, 'zones', ()) if self.config is not None else ()
+        return zones or (DEFAULT_ZONE,)
+
+    def _compile_action(self, name: str) -> Action:
+        if name in self.custom_actions:
+            return self.custom_actions[name]
+
+        if name == 'alarm':
+            def action(module_id, zone):
+                if self.core:
+                    self.core.trigger_alarm(module_id, zone.alarm_type, f"Zone '{zone.name}' ({self.mode})")
+            return action
+
+        if self.io_manager:
+            output_pins = self.io_manager.defaults['output_pins']
+        else:
+            # Sin IOManager los nombres válidos salen de la configuración
+            io = getattr(self.config, 'io', None) if self.config is not None else None
+            output_pins = io.output_pins if io is not None else {}
+        if name in output_pins or name == 'siren':
+            duration = getattr(self.config, 'alarm_duration', 60) if self.config is not None else 60
+
+            def action(module_id, zone):
+                if self.io_manager:
+                    self.io_manager.activate_output(name, duration or None)
+                else:
+                    logger.warning(f"Output '{name}' requested by zone '{zone.name}' but no I/O manager")
+            return action
+
+        raise RuleError(f"unknown action '{name}'")
+
+    def compile(self):
+        """Compilar las zonas en tablas de despacho y publicarlas atómicamente."""
+        compiled = []
+        for zone in self._zones():
+            try:
+                rule = CompiledRule(zone, tuple(self._compile_action(a) for a in zone.actions))
+            except RuleError as e:
+                # Una zona mal configurada no debe impedir arrancar ni dejar sin reglas al resto
+                logger.error(f"Zone '{zone.name}' skipped: {e}")
+                continue
+            compiled.append(rule)
+
+        dispatch = {}
+        for mode in ARM_MODES:
+            table, fallback = {}, None
+            for rule in compiled:
+                active = rule if mode in rule.zone.modes else None
+                if rule.zone.modules:
+                    # Módulos de zonas desarmadas quedan en None: no caen en la zona por defecto
+                    for module_id in rule.zone.modules:
+                        table[module_id] = active
+                elif fallback is None and active:
+                    fallback = active
+            dispatch[mode] = (table, fallback)
+
+        # Publicación atómica: una sola asignación de referencia
+        self._dispatch = dispatch
+        logger.info(f"Rules compiled: {len(compiled)} zone(s)")
+
+    def add_action(self, name: str, action: Action):
+        """
+        Registrar o sustituir una acción por nombre. La configuración solo
+        admite 'alarm' y nombres de `io.output_pins`, así que sirve para
+        redefinir lo que hace una de esas acciones.
+        """
+        self.custom_actions[name] = action
+        self.compile()
+
+    # ========== Armado ==========
+
+    def arm(self, mode: str = None):
+        """
+        Armar el sistema. Sin modo explícito se usa 'night' si `night_mode`
+        está activo en la configuración y 'away' en caso contrario.
+        """
+        if mode is None:
+            mode = 'night' if getattr(self.config, 'night_mode', False) else 'away'
+        if mode not in ARM_MODES:
+            raise RuleError(f"unknown arm mode '{mode}'")
+        self._set_mode(mode)
+
+    def disarm(self):
+        self._set_mode('disarmed')
+
+    def _set_mode(self, mode: str):
+        with self._lock:
+            self.mode = mode
+            self._armed_at = time.monotonic()
+            self._generation += 1
+            pending, self._pending = self._pending, {}
+        for timer in pending.values():
+            timer.cancel()
+        logger.info(f"System mode: {mode}")
+        if self.on_mode_change:
+            self.on_mode_change(mode)
+
+    @property
+    def armed(self) -> bool:
+        return self.mode != 'disarmed'
+
+    def pending_zones(self):
+        """Zonas con un retardo de entrada en curso."""
+        with self._lock:
+            return list(self._pending)
+
+    # ========== Eventos ==========
+
+    def rule_for(self, module_id: int, mode: str = None) -> Optional[CompiledRule]:
+        table, fallback = self._dispatch[mode or self.mode]
+        return table.get(module_id, fallback)
+
+    def handle_event(self, module_id: int, state: str) -> str:
+        """
+        Evaluar un evento de sensor.
+
+        Returns:
+            'ignored', 'exit_delay', 'entry_delay', 'pending' o 'triggered'
+        """
+        if state != 'alarm':
+            return 'ignored'
+
+        # Una sola lectura de la tabla: una recompilación concurrente no afecta a este evento
+        mode = self.mode
+        table, fallback = self._dispatch[mode]
+        rule = table.get(module_id, fallback)
+        if rule is None:
+            return 'ignored'
+
+        zone = rule.zone
+        with self._lock:
+            generation = self._generation
+            if zone.exit_delay and time.monotonic() - self._armed_at < zone.exit_delay:
+                return 'exit_delay'
+            if zone.entry_delay:
+                if zone.name in self._pending:
+                    return 'pending'
+                timer = threading.Timer(zone.entry_delay, self._entry_expired,
+                                        args=(rule, module_id, generation))
+                timer.daemon = True
+                self._pending[zone.name] = timer
+                timer.start()
+                logger.info(f"Entry delay started for zone '{zone.name}' ({zone.entry_delay}s)")
+                return 'entry_delay'
+
+        self._fire(rule, module_id)
+        return 'triggered'
+
+    def _entry_expired(self, rule: CompiledRule, module_id: int, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return  # Se desarmó durante el retardo
+            self._pending.pop(rule.zone.name, None)
+        self._fire(rule, module_id)
+
+    def _fire(self, rule: CompiledRule, module_id: int):
+        def run():
+            logger.warning(f"Zone '{rule.zone.name}' triggered by module {module_id} in {self.mode} mode")
+            for action in rule.actions:
+                try:
+                    action(module_id, rule.zone)
+                except Exception as e:
+                    logger.error(f"Action failed in zone '{rule.zone.name}': {e}")
+            if self.on_trigger:
+                self.on_trigger(module_id, rule.zone.name)
+
+        if self.scheduler:
+            self.scheduler(run)
+        else:
+            run()
+
+    def close(self):
+        """Cancelar retardos pendientes y dejar de seguir la configuración."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for timer in pending.values():
+            timer.cancel()
+        if self._unsubscribe_config:
+            self._unsubscribe_config()
+            self._unsubscribe_config = None
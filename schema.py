@@ -0,0 +1,136 @@
+"""
+schema.py
+Versión del esquema de la BD y migraciones.
+
+La versión se guarda en ``PRAGMA user_version``. Cada migración lleva la
+BD de la versión N-1 a la N dentro de una transacción; `migrate` aplica
+solo las que faltan. Las BDs anteriores a este módulo tienen versión 0 y
+las primeras migraciones son idempotentes, así que también se actualizan.
+"""
+
+import logging
+
+import history
+import records
+import stats
+
+logger = logging.getLogger("SCHEMA")
+
+
+def _v1_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS modules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alarms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module_id INTEGER,
+            alarm_type TEXT NOT NULL,
+            description TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            acknowledged BOOLEAN DEFAULT 0,
+            FOREIGN KEY(module_id) REFERENCES modules(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Índice por fecha para retención y consultas por rango
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alarms_timestamp ON alarms(timestamp)')
+
+
+def _v2_history(cursor):
+    # Historial de estados de módulos y agregados
+    history.create_tables(cursor)
+
+
+def _v3_acknowledgement(cursor):
+    # Quién reconoció cada alarma y cuándo
+    cursor.execute("PRAGMA table_info(alarms)")
+    columns = {row[1] for row in cursor.fetchall()}
+    for column in ('acknowledged_by TEXT', 'acknowledged_at TIMESTAMP'):
+        if column.split()[0] not in columns:
+            cursor.execute(f"ALTER TABLE alarms ADD COLUMN {column}")
+    # Índice parcial: las alarmas abiertas son pocas y se consultan a menudo
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alarms_open ON alarms(module_id, alarm_type)
+        WHERE acknowledged = 0
+    ''')
+
+
+def _v4_alarm_stats(cursor):
+    # Contadores por ventana deslizante (stats.py), con la última semana cargada
+    stats.create_tables(cursor)
+    stats.backfill(cursor)
+
+
+def _v5_escalation_step(cursor):
+    # Pasos de escalado ya ejecutados: al reiniciar no se repiten
+    cursor.execute("PRAGMA table_info(alarms)")
+    if 'escalation_step' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE alarms ADD COLUMN escalation_step INTEGER NOT NULL DEFAULT 0")
+
+
+def _v6_history_prune_indexes(cursor):
+    # Borrado por horizonte (history.prune) sin recorrer las tablas enteras
+    history.create_prune_indexes(cursor)
+
+
+# (versión, descripción, función); añadir siempre al final
+MIGRATIONS = (
+    (1, "base tables", _v1_base_tables),
+    (2, "module history", _v2_history),
+    (3, "acknowledged_by/acknowledged_at", _v3_acknowledgement),
+    (4, "alarm statistics", _v4_alarm_stats),
+    (5, "escalation step", _v5_escalation_step),
+    (6, "history prune indexes", _v6_history_prune_indexes),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection) -> int:
+    """
+    Aplicar las migraciones pendientes y comprobar que los registros
+    coinciden con las tablas.
+
+    Returns:
+        Versión final del esquema
+    """
+    version = get_version(connection)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"database schema v{version} is newer than this software (v{SCHEMA_VERSION})")
+
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        cursor = connection.cursor()
+        try:
+            # BEGIN explícito: sqlite3 no abre transacción para DDL
+            cursor.execute("BEGIN")
+            apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(target)}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        logger.info(f"Database schema migrated to v{target} ({description})")
+        version = target
+
+    records.check_layout(connection.cursor())
+    return version
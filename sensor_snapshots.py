@@ -0,0 +1,138 @@
+"""
+sensor_snapshots.py
+Instantáneas versionadas e inmutables del estado de los sensores.
+
+Cada cambio incrementa una versión global y produce una instantánea nueva
+que comparte con la anterior todo lo que no cambió: los sensores se
+agrupan en bloques de `CHUNK_SIZE` IDs y un cambio solo copia su bloque y
+el índice de bloques. Un registro acotado de cambios permite a los
+sondeadores (GUI, clientes remotos) sincronizarse con `changes_since` en
+O(cambios) en lugar de releer todos los sensores.
+"""
+
+import threading
+import time
+from collections import deque
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+CHUNK_SIZE = 32
+
+
+class SensorState(NamedTuple):
+    module_id: int
+    state: str            # 'normal', 'alarm' o 'unknown'
+    gpio_pin: Optional[int]
+    sensor_type: Optional[str]
+    changed: float        # epoch del último cambio
+    version: int          # versión global en que cambió
+
+
+class SensorSnapshot:
+    """Vista inmutable de todos los sensores en una versión."""
+
+    __slots__ = ('version', '_chunks', '_count')
+
+    def __init__(self, version: int, chunks: Mapping[int, Mapping[int, SensorState]], count: int):
+        self.version = version
+        self._chunks = chunks
+        self._count = count
+
+    def get(self, module_id: int) -> Optional[SensorState]:
+        chunk = self._chunks.get(module_id // CHUNK_SIZE)
+        return chunk.get(module_id) if chunk else None
+
+    def __getitem__(self, module_id: int) -> SensorState:
+        state = self.get(module_id)
+        if state is None:
+            raise KeyError(module_id)
+        return state
+
+    def __contains__(self, module_id) -> bool:
+        return self.get(module_id) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[SensorState]:
+        for key in sorted(self._chunks):
+            chunk = self._chunks[key]
+            for module_id in sorted(chunk):
+                yield chunk[module_id]
+
+    def states(self) -> Dict[int, str]:
+        return {s.module_id: s.state for s in self}
+
+
+class SensorSnapshots:
+    """
+    Historial de instantáneas: un escritor (IOManager), muchos lectores.
+
+    Leer la instantánea actual es leer una referencia; no hace falta lock.
+    """
+
+    def __init__(self, max_log: int = 4096):
+        self._lock = threading.Lock()
+        self._current = SensorSnapshot(0, MappingProxyType({}), 0)
+        # (versión, module_id) de los últimos cambios, en orden de versión
+        self._log: deque = deque(maxlen=max_log)
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    def current(self) -> SensorSnapshot:
+        return self._current
+
+    def update(self, module_id: int, state: str, gpio_pin: int = None,
+               sensor_type: str = None, changed: float = None) -> SensorSnapshot:
+        """Publicar el nuevo estado de un sensor (sin cambio real, no crea versión)."""
+        with self._lock:
+            current = self._current
+            previous = current.get(module_id)
+            if gpio_pin is None and previous:
+                gpio_pin = previous.gpio_pin
+            if sensor_type is None and previous:
+                sensor_type = previous.sensor_type
+            if previous and (previous.state, previous.gpio_pin, previous.sensor_type) == (state, gpio_pin, sensor_type):
+                return current
+
+            version = current.version + 1
+            entry = SensorState(module_id, state, gpio_pin, sensor_type,
+                                time.time() if changed is None else changed, version)
+
+            # Copiar solo el bloque afectado y el índice; el resto se comparte
+            key = module_id // CHUNK_SIZE
+            chunk = dict(current._chunks.get(key, {}))
+            chunk[module_id] = entry
+            chunks = dict(current._chunks)
+            chunks[key] = MappingProxyType(chunk)
+
+            snapshot = SensorSnapshot(version, MappingProxyType(chunks),
+                                      current._count + (previous is None))
+            self._log.append((version, module_id))
+            self._current = snapshot
+            return snapshot
+
+    def changes_since(self, version: int) -> Tuple[int, List[SensorState], bool]:
+        """
+        Cambios posteriores a `version`.
+
+        Returns:
+            (versión actual, estados cambiados, completo). Si `version` es más
+            antigua que el registro de cambios, `completo` es True y la lista
+            contiene todos los sensores (resincronización).
+        """
+        with self._lock:
+            snapshot = self._current
+            if version >= snapshot.version:
+                return snapshot.version, [], False
+            if not self._log or self._log[0][0] > version + 1:
+                return snapshot.version, list(snapshot), True
+            # Recorrer el registro desde el final: O(cambios)
+            module_ids = []
+            for logged_version, module_id in reversed(self._log):
+                if logged_version <= version:
+                    break
+                module_ids.append(module_id)
+        return snapshot.version, [snapshot[m] for m in dict.fromkeys(reversed(module_ids))], False
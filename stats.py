@@ -0,0 +1,160 @@
+"""
+stats.py
+Estadísticas de alarmas por módulo y tipo en ventanas deslizantes.
+
+Los contadores se mantienen de forma incremental en `alarm_stats` dentro
+de la misma transacción que crea o reconoce la alarma: buckets por minuto
+para la ventana de una hora y por hora para las de un día y una semana.
+Leer una ventana suma solo sus buckets (rango sobre la clave primaria),
+sin recorrer `alarms`. El tiempo medio de reconocimiento (MTTA) se calcula
+con las alarmas reconocidas dentro de la ventana.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from history import GRANULARITIES, bucket_key
+
+# ventana -> (granularidad de sus buckets, duración)
+WINDOWS = {
+    'hour': ('minute', timedelta(hours=1)),
+    'day': ('hour', timedelta(days=1)),
+    'week': ('hour', timedelta(days=7)),
+}
+
+# Cuánto se conserva cada granularidad (la ventana más larga que la usa)
+RETENTION = {'minute': timedelta(hours=1), 'hour': timedelta(days=7)}
+
+NO_MODULE = 0  # module_id de alarmas sin módulo (la clave primaria no admite NULL)
+
+_UPSERT = '''
+    ON CONFLICT(granularity, bucket, module_id, alarm_type) DO UPDATE SET
+        raised = raised + excluded.raised,
+        acknowledged = acknowledged + excluded.acknowledged,
+        ack_seconds = ack_seconds + excluded.ack_seconds
+'''
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alarm_stats (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            module_id INTEGER NOT NULL,
+            alarm_type TEXT NOT NULL,
+            raised INTEGER NOT NULL DEFAULT 0,
+            acknowledged INTEGER NOT NULL DEFAULT 0,
+            ack_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket, module_id, alarm_type)
+        ) WITHOUT ROWID
+    ''')
+
+
+def backfill(cursor, now: Optional[datetime] = None):
+    """Cargar los contadores de la última semana desde `alarms` (solo al crear la tabla)."""
+    now = now or datetime.utcnow().replace(microsecond=0)
+    for granularity in RETENTION:
+        length = GRANULARITIES[granularity][0]
+        start = (now - RETENTION[granularity]).strftime('%Y-%m-%d %H:%M:%S')
+        # El rango por timestamp usa idx_alarms_timestamp
+        cursor.execute(f'''
+            INSERT INTO alarm_stats (granularity, bucket, module_id, alarm_type, raised, acknowledged, ack_seconds)
+            SELECT ?, substr(timestamp, 1, {length}), IFNULL(module_id, {NO_MODULE}), alarm_type, COUNT(*), 0, 0
+            FROM alarms WHERE timestamp >= ?
+            GROUP BY 2, 3, 4
+            {_UPSERT}
+        ''', (granularity, start))
+        cursor.execute(f'''
+            INSERT INTO alarm_stats (granularity, bucket, module_id, alarm_type, raised, acknowledged, ack_seconds)
+            SELECT ?, substr(acknowledged_at, 1, {length}), IFNULL(module_id, {NO_MODULE}), alarm_type, 0,
+                   COUNT(*), SUM((julianday(acknowledged_at) - julianday(timestamp)) * 86400)
+            FROM alarms WHERE timestamp >= ? AND acknowledged_at >= ?
+            GROUP BY 2, 3, 4
+            {_UPSERT}
+        ''', (granularity, start, start))
+
+
+def record_raised(cursor, module_id, alarm_type, when: Optional[datetime] = None):
+    """Contar una alarma nueva (sin hacer commit)."""
+    when = when or datetime.utcnow().replace(microsecond=0)
+    module_id = NO_MODULE if module_id is None else module_id
+    cursor.executemany(f'''
+        INSERT INTO alarm_stats (granularity, bucket, module_id, alarm_type, raised, acknowledged, ack_seconds)
+        VALUES (?, ?, ?, ?, 1, 0, 0)
+        {_UPSERT}
+    ''', [(granularity, bucket_key(when, granularity), module_id, alarm_type) for granularity in RETENTION])
+
+
+def record_acknowledged(cursor, ids_json: str):
+    """
+    Contar un lote de alarmas recién reconocidas (sin hacer commit).
+
+    Args:
+        ids_json: Lista JSON de IDs; las alarmas deben tener ya `acknowledged_at`
+    """
+    for granularity in RETENTION:
+        length = GRANULARITIES[granularity][0]
+        cursor.execute(f'''
+            INSERT INTO alarm_stats (granularity, bucket, module_id, alarm_type, raised, acknowledged, ack_seconds)
+            SELECT ?, substr(acknowledged_at, 1, {length}), IFNULL(module_id, {NO_MODULE}), alarm_type, 0,
+                   COUNT(*), SUM(MAX(0, (julianday(acknowledged_at) - julianday(timestamp)) * 86400))
+            FROM alarms WHERE id IN (SELECT value FROM json_each(?))
+            GROUP BY 2, 3, 4
+            {_UPSERT}
+        ''', (granularity, ids_json))
+
+
+def prune(cursor, now: Optional[datetime] = None) -> int:
+    """Borrar los buckets que ya no entran en ninguna ventana."""
+    now = now or datetime.utcnow().replace(microsecond=0)
+    deleted = 0
+    for granularity, keep in RETENTION.items():
+        cursor.execute("DELETE FROM alarm_stats WHERE granularity = ? AND bucket < ?",
+                       (granularity, bucket_key(now - keep, granularity)))
+        deleted += cursor.rowcount
+    return deleted
+
+
+def _mtta(acknowledged: int, ack_seconds: float) -> Optional[float]:
+    return ack_seconds / acknowledged if acknowledged else None
+
+
+def get_window(connection, window: str, now: Optional[datetime] = None) -> List[dict]:
+    """
+    Contadores de una ventana por módulo y tipo.
+
+    Returns:
+        Lista de {module_id, alarm_type, raised, acknowledged, mtta}; `mtta`
+        en segundos o None si no hubo reconocimientos
+    """
+    if window not in WINDOWS:
+        raise ValueError(f"Unknown window: {window}")
+    granularity, length = WINDOWS[window]
+    now = now or datetime.utcnow().replace(microsecond=0)
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT module_id, alarm_type, SUM(raised), SUM(acknowledged), SUM(ack_seconds)
+        FROM alarm_stats
+        WHERE granularity = ? AND bucket > ? AND bucket <= ?
+        GROUP BY module_id, alarm_type
+        ORDER BY module_id, alarm_type
+    ''', (granularity, bucket_key(now - length, granularity), bucket_key(now, granularity)))
+    return [{'module_id': None if module_id == NO_MODULE else module_id, 'alarm_type': alarm_type,
+             'raised': raised, 'acknowledged': acknowledged, 'mtta': _mtta(acknowledged, ack_seconds)}
+            for module_id, alarm_type, raised, acknowledged, ack_seconds in cursor.fetchall()]
+
+
+def summary(connection, now: Optional[datetime] = None) -> Dict[str, dict]:
+    """
+    Todas las ventanas: {ventana: {'rows': [...], 'raised', 'acknowledged', 'mtta'}}.
+    """
+    now = now or datetime.utcnow().replace(microsecond=0)
+    result = {}
+    for window in WINDOWS:
+        rows = get_window(connection, window, now)
+        raised = sum(row['raised'] for row in rows)
+        acknowledged = sum(row['acknowledged'] for row in rows)
+        ack_seconds = sum(row['mtta'] * row['acknowledged'] for row in rows if row['mtta'] is not None)
+        result[window] = {'rows': rows, 'raised': raised, 'acknowledged': acknowledged,
+                          'mtta': _mtta(acknowledged, ack_seconds)}
+    return result
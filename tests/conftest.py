@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Directorio temporal como directorio de trabajo (BD, diario, historial)."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def core(workdir):
+    from core import AlarmCore
+    alarm_core = AlarmCore(str(workdir / 'alarm_core.db'))
+    yield alarm_core
+    alarm_core.close()
@@ -0,0 +1,31 @@
+from changefeed import ALARM_ACKNOWLEDGED
+
+
+def test_bulk_acknowledge_by_filter(core):
+    door = core.register_module('door', 'normal')
+    window = core.register_module('window', 'normal')
+    door_alarms = [core.trigger_alarm(door, 'intrusion') for _ in range(3)]
+    tamper = core.trigger_alarm(door, 'tamper')
+    other = core.trigger_alarm(window, 'intrusion')
+    subscription = core.changes.subscribe(kinds=(ALARM_ACKNOWLEDGED,))
+
+    assert core.acknowledge_alarms() == 0  # Sin predicado no se reconoce nada
+    assert core.acknowledge_alarms(module_id=door, alarm_type='intrusion', acknowledged_by='operator') == 3
+    assert sorted(a.id for a in core.get_active_alarms()) == [tamper, other]
+    assert sorted(event.payload['alarm_id'] for event in subscription.drain()) == door_alarms
+    rows = core.connection.execute(
+        "SELECT acknowledged_by, acknowledged_at IS NOT NULL FROM alarms WHERE id IN (?, ?, ?)",
+        door_alarms).fetchall()
+    assert rows == [('operator', 1)] * 3
+
+
+def test_bulk_acknowledge_by_ids_and_session(core):
+    ids = [core.trigger_alarm(None, 'intrusion') for _ in range(3)]
+    assert core.acknowledge_alarms(alarm_ids=ids[:2], session_token='bogus') == 0
+    core.insert_user('operator', 'secret')
+    token = core.authenticate_user('operator', 'secret')['token']
+    assert core.acknowledge_alarms(alarm_ids=ids[:2], session_token=token) == 2
+    assert core.acknowledge_alarms(alarm_ids=ids[:2], session_token=token) == 0  # Ya reconocidas
+    assert [a.id for a in core.get_active_alarms()] == [ids[2]]
+    assert core.connection.execute("SELECT acknowledged_by FROM alarms WHERE id = ?",
+                                   (ids[0],)).fetchone() == ('operator',)
@@ -0,0 +1,46 @@
+import queue
+import threading
+
+import pytest
+
+from anomaly import STUCK, AnomalyDetector
+
+
+def _stuck_detector(core, scheduler):
+    detector = AnomalyDetector(core, stuck_after=10, scheduler=scheduler)
+    detector.record(1, 'normal', when=0.0)
+    detector.record(1, 'alarm', when=1.0)
+    return detector
+
+
+def _in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_core_requires_scheduler(core):
+    with pytest.raises(ValueError):
+        AnomalyDetector(core)
+
+
+def test_alarm_raised_on_core_thread(core):
+    """Regresión: trigger_alarm se llamaba desde el hilo de evaluación."""
+    tasks = queue.Queue()
+    detector = _stuck_detector(core, tasks.put)
+    raised = _in_thread(lambda: detector.evaluate(now=20.0))
+    assert [(m, kind) for m, kind, _ in raised] == [(1, STUCK)]
+    tasks.get_nowait()()  # Hilo del núcleo
+    assert [a.alarm_type for a in core.get_active_alarms()] == [STUCK]
+
+
+def test_failed_raise_is_retried(core):
+    # Un scheduler que ejecuta en el hilo equivocado: SQLite rechaza la inserción
+    detector = _stuck_detector(core, lambda fn: fn())
+    assert _in_thread(lambda: detector.evaluate(now=20.0))
+    assert STUCK not in detector.sensor_stats(1, now=20.0)['anomalies']
+    # Ya en el hilo correcto, el siguiente tick la vuelve a generar
+    assert detector.evaluate(now=21.0)
+    assert [a.alarm_type for a in core.get_active_alarms()] == [STUCK]
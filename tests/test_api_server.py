@@ -0,0 +1,230 @@
+import base64
+import http.client
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from api_server import OP_CLOSE, OP_TEXT, ApiServer, ws_accept_key
+from changefeed import OVERFLOW, ChangeEvent, ChangeFeed
+from core import AlarmCore
+from rules import RuleEngine
+
+
+class CoreThread:
+    """Hilo dueño del núcleo (la conexión SQLite es de un solo hilo), como el bucle de Tk."""
+
+    def __init__(self, path):
+        self.tasks = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.core = self.call(lambda: AlarmCore(path))
+
+    def _run(self):
+        while True:
+            fn = self.tasks.get()
+            if fn is None:
+                return
+            fn()
+
+    def schedule(self, fn):
+        self.tasks.put(fn)
+
+    def call(self, fn):
+        result = queue.Queue()
+
+        def run():
+            try:
+                result.put((fn(), None))
+            except Exception as e:
+                result.put((None, e))
+
+        self.schedule(run)
+        value, error = result.get(timeout=10)
+        if error is not None:
+            raise error
+        return value
+
+    def close(self):
+        self.call(self.core.close)
+        self.tasks.put(None)
+        self.thread.join(5)
+
+
+@pytest.fixture
+def core_thread(workdir):
+    owner = CoreThread(str(workdir / 'alarm_core.db'))
+    owner.call(lambda: owner.core.insert_user('operator', 'secret', 'admin'))
+    owner.call(lambda: owner.core.insert_user('guest', 'secret', 'viewer'))
+    yield owner
+    owner.close()
+
+
+@pytest.fixture
+def make_server(core_thread):
+    servers = []
+
+    def make(**kwargs):
+        rules = core_thread.call(lambda: RuleEngine(core_thread.core))
+        server = ApiServer(core_thread.core, rule_engine=rules, port=0,
+                           scheduler=core_thread.schedule, **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def request(server, method, path, body=None, token=None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+    finally:
+        connection.close()
+
+
+def login(server, username):
+    status, data = request(server, 'POST', '/api/login', {'username': username, 'password': 'secret'})
+    assert status == 200
+    return data['token']
+
+
+class WebSocket:
+    def __init__(self, server, query):
+        self.sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        self.sock.sendall((f"GET /ws?{query} HTTP/1.1\r\nHost: localhost\r\n"
+                           "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        head = b''
+        while b'\r\n\r\n' not in head:
+            head += self.sock.recv(1)
+        self.status_line, *headers = head.decode('latin-1').split('\r\n')
+        self.headers = {h.split(':', 1)[0].lower(): h.split(':', 1)[1].strip() for h in headers if ':' in h}
+        self.key = key
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("closed")
+            data += chunk
+        return data
+
+    def receive(self):
+        """Siguiente mensaje de texto (se saltan los pings)."""
+        while True:
+            first, second = self._recv_exact(2)
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self._recv_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._recv_exact(8))[0]
+            payload = self._recv_exact(length)
+            if first & 0x0F == OP_TEXT:
+                return json.loads(payload)
+            if first & 0x0F == OP_CLOSE:
+                return None
+
+    def close(self):
+        mask = os.urandom(4)
+        payload = struct.pack('!H', 1000)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(struct.pack('!BB', 0x80 | OP_CLOSE, 0x80 | len(payload)) + mask + masked)
+        assert self.receive() is None
+        self.sock.close()
+
+
+def test_routes_and_authentication(make_server, core_thread):
+    server = make_server()
+    assert request(server, 'GET', '/api/status')[0] == 401
+    assert request(server, 'GET', '/api/nope')[0] == 404
+    assert request(server, 'GET', '/api/login')[0] == 405
+    assert request(server, 'POST', '/api/login', {'username': 'operator', 'password': 'bad'})[0] == 401
+
+    token = login(server, 'operator')
+    module_id = core_thread.call(lambda: core_thread.core.register_module('door', 'normal'))
+    alarm_id = core_thread.call(lambda: core_thread.core.trigger_alarm(module_id, 'intrusion'))
+    status, data = request(server, 'GET', '/api/modules', token=token)
+    assert status == 200 and [m['name'] for m in data['modules']] == ['door']
+    status, data = request(server, 'GET', '/api/alarms/active', token=token)
+    assert [a['id'] for a in data['alarms']] == [alarm_id]
+
+    status, data = request(server, 'POST', '/api/alarms/ack', {'alarm_ids': [alarm_id]}, token=token)
+    assert (status, data) == (200, {'acknowledged': 1})
+    assert request(server, 'GET', '/api/alarms/active', token=token)[1] == {'alarms': []}
+    history = request(server, 'GET', '/api/alarms/history', token=token)[1]
+    assert history['alarms'][0]['acknowledged_by'] == 'operator'
+
+
+def test_viewer_cannot_change_the_system(make_server, core_thread):
+    server = make_server()
+    token = login(server, 'guest')
+    assert request(server, 'GET', '/api/status', token=token)[0] == 200
+    for path, body in (('/api/arm', {'mode': 'away'}), ('/api/disarm', {}),
+                       ('/api/alarms/ack', {'alarm_ids': [1]})):
+        status, data = request(server, 'POST', path, body, token=token)
+        assert status == 403, path
+    assert request(server, 'GET', '/api/status', token=token)[1]['armed'] is False
+
+
+def test_websocket_pushes_changes(make_server, core_thread):
+    server = make_server()
+    token = login(server, 'operator')
+    assert WebSocket(server, 'token=bad').status_line.split()[1] == '401'
+
+    ws = WebSocket(server, f'token={token}')
+    assert ws.status_line.split()[1] == '101'
+    assert ws.headers['sec-websocket-accept'] == ws_accept_key(ws.key)
+    hello = ws.receive()
+    assert hello['type'] == 'hello'
+
+    module_id = core_thread.call(lambda: core_thread.core.register_module('door', 'normal'))
+    change = ws.receive()
+    assert (change['type'], change['kind'], change['module_id']) == ('change', 'module_registered', module_id)
+    assert change['seq'] == hello['seq'] + 1
+    ws.close()
+
+
+def test_websocket_resumes_from_since(make_server, core_thread):
+    feed = core_thread.core.changes
+    for i in range(3):
+        feed.publish('test', i)
+    server = make_server()
+    token = login(server, 'operator')
+    ws = WebSocket(server, f'token={token}&since=1')
+    assert ws.receive()['type'] == 'hello'
+    assert [ws.receive()['seq'] for _ in range(2)] == [2, 3]
+    ws.close()
+
+
+def test_websocket_resync(make_server, core_thread):
+    core_thread.core.changes = ChangeFeed(history_size=2)
+    for i in range(4):
+        core_thread.core.changes.publish('test', i)
+    server = make_server()
+    token = login(server, 'operator')
+
+    # El historial ya no cubre la secuencia pedida
+    ws = WebSocket(server, f'token={token}&since=0')
+    assert ws.receive()['type'] == 'hello'
+    assert ws.receive() == {'type': 'resync'}
+    assert [ws.receive()['seq'] for _ in range(2)] == [3, 4]
+
+    # Eventos perdidos en la suscripción del servidor: todos los clientes resincronizan
+    gap = ChangeEvent(9, OVERFLOW, time.time(), None, {'from_seq': 5, 'to_seq': 9})
+    server._loop.call_soon_threadsafe(server._broadcast_changes, [gap])
+    assert ws.receive() == {'type': 'resync'}
+    ws.close()
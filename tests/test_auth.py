@@ -0,0 +1,33 @@
+from auth import LoginThrottle
+
+
+def test_junk_usernames_do_not_evict_a_lockout():
+    throttle = LoginThrottle(max_failures=3, max_tracked=8)
+    for _ in range(3):
+        throttle.record_failure('admin')
+    assert throttle.retry_after('admin') > 0
+    for i in range(100):
+        throttle.record_failure(f'junk-{i}')
+    assert throttle.retry_after('admin') > 0
+
+
+def test_unknown_users_are_not_tracked(core):
+    for _ in range(10):
+        assert core.authenticate_user('nobody', 'guess') is None
+    assert core.login_throttle.retry_after('nobody') == 0
+    assert 'nobody' not in core.login_throttle._counters
+
+
+def test_lockout_costs_a_verification(core, monkeypatch):
+    core.insert_user('operator', 'secret')
+    for _ in range(core.login_throttle.max_failures):
+        core.authenticate_user('operator', 'guess')
+    assert core.login_throttle.retry_after('operator') > 0
+
+    verified = []
+    original = core.password_hasher.verify
+    monkeypatch.setattr(core.password_hasher, 'verify',
+                        lambda password, stored: verified.append(stored) or original(password, stored))
+    assert core.authenticate_user('operator', 'guess') is None
+    assert core.authenticate_user('nobody', 'guess') is None
+    assert len(verified) == 2
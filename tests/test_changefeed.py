@@ -0,0 +1,45 @@
+from changefeed import ALARM_CREATED, MODULE_UPDATED, OVERFLOW, ChangeFeed
+
+
+def test_filters_and_overflow():
+    feed = ChangeFeed()
+    subscription = feed.subscribe(kinds=(ALARM_CREATED,), module_ids=(1,), max_pending=2)
+    feed.publish(MODULE_UPDATED, 1, status='alarm')
+    feed.publish(ALARM_CREATED, 2, alarm_id=1)
+    for alarm_id in range(2, 7):
+        feed.publish(ALARM_CREATED, 1, alarm_id=alarm_id)
+    assert subscription.overflowed
+
+    events = subscription.drain()
+    assert [e.payload.get('alarm_id') for e in events[:2]] == [2, 3]
+    assert events[2].kind == OVERFLOW
+    assert (events[2].payload['from_seq'], events[2].payload['to_seq']) == (5, 7)
+    assert subscription.last_seq == 7 and not subscription.overflowed
+
+    # Tras el aviso de desbordamiento la entrega sigue con normalidad
+    feed.publish(ALARM_CREATED, 1, alarm_id=7)
+    assert subscription.get(timeout=1).seq == 8
+
+
+def test_resume_from_history():
+    feed = ChangeFeed(history_size=3)
+    for i in range(5):
+        feed.publish(ALARM_CREATED, 1, alarm_id=i)
+
+    resumed = feed.subscribe(resume_from=3)
+    assert [e.seq for e in resumed.drain()] == [4, 5]
+
+    # Lo pedido ya no está en el historial: primero se señala el hueco
+    late = feed.subscribe(resume_from=0)
+    events = late.drain()
+    assert events[0].kind == OVERFLOW and events[0].payload == {'from_seq': 1, 'to_seq': 2}
+    assert [e.seq for e in events[1:]] == [3, 4, 5]
+
+
+def test_closed_subscription_stops_receiving(core):
+    subscription = core.changes.subscribe()
+    module_id = core.register_module('door', 'normal')
+    assert subscription.get(timeout=1).module_id == module_id
+    subscription.close()
+    core.trigger_alarm(module_id, 'intrusion')
+    assert subscription.get(timeout=0.1) is None
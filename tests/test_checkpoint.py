@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+from checkpoint import CheckpointManager
+from core import AlarmCore
+from durability import get_profile
+
+
+def _core(path, work_dir):
+    profile = get_profile('sd-card-saver')
+    checkpoint = CheckpointManager(path, work_dir=str(work_dir), interval=profile.checkpoint_interval,
+                                   max_changes=profile.checkpoint_changes)
+    return AlarmCore(path, durability=profile, journal=True, checkpoint=checkpoint), checkpoint
+
+
+def test_close_checkpoints_to_disk_before_reboot(workdir):
+    path = str(workdir / 'alarm_core.db')
+    work_dir = workdir / 'shm'
+    work_dir.mkdir()
+    alarm_core, checkpoint = _core(path, work_dir)
+    module_id = alarm_core.register_module('door', 'normal')
+    alarm_id = alarm_core.trigger_alarm(module_id, 'intrusion')
+    alarm_core.acknowledge_alarm(alarm_id)
+    assert checkpoint.checkpoints == 0  # Sin cierre ordenado el disco no tendría nada
+    alarm_core.close()
+
+    # Un reinicio vacía el tmpfs: solo queda lo que llegó al disco
+    for leftover in work_dir.iterdir():
+        leftover.unlink()
+    alarm_core, _ = _core(path, work_dir)
+    try:
+        assert [m.name for m in alarm_core.get_all_modules().values()] == ['door']
+        assert alarm_core.get_active_alarms() == []
+        assert alarm_core.connection.execute("SELECT id, acknowledged FROM alarms").fetchall() == [(alarm_id, 1)]
+    finally:
+        alarm_core.close()
+
+
+def test_process_restart_reuses_the_working_copy(workdir):
+    path = str(workdir / 'alarm_core.db')
+    work_dir = workdir / 'shm'
+    work_dir.mkdir()
+    alarm_core, checkpoint = _core(path, work_dir)
+    alarm_core.register_module('door', 'normal')
+    # Caída del proceso (sin close): el tmpfs conserva la copia de trabajo
+    alarm_core.journal.close()
+    alarm_core.connection.close()
+
+    alarm_core, _ = _core(path, work_dir)
+    try:
+        assert [m.name for m in alarm_core.get_all_modules().values()] == ['door']
+    finally:
+        alarm_core.close()
+
+
+def test_checkpoint_after_max_changes(workdir):
+    path = str(workdir / 'alarm_core.db')
+    checkpoint = CheckpointManager(path, work_dir=str(workdir), interval=300, max_changes=3)
+
+    def modules_on_disk():
+        disk = sqlite3.connect(path)
+        try:
+            return disk.execute("SELECT COUNT(*) FROM modules").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0  # Aún sin ningún checkpoint
+        finally:
+            disk.close()
+
+    with AlarmCore(path, checkpoint=checkpoint) as alarm_core:
+        for i in range(3):
+            alarm_core.register_module(f'door-{i}', 'normal')
+        # Sin esperar al intervalo de 300 s
+        deadline = time.monotonic() + 5
+        while modules_on_disk() < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert modules_on_disk() == 3
@@ -0,0 +1,41 @@
+import pytest
+
+import durability
+from checkpoint import CheckpointManager
+from config import AlarmConfig, ConfigError
+from core import AlarmCore
+
+
+@pytest.mark.parametrize('name', ['paranoid', 'balanced'])
+def test_profile_pragmas_apply_to_every_connection(workdir, name):
+    profile = durability.get_profile(name)
+    with AlarmCore(str(workdir / 'alarm_core.db'), durability=name) as core:
+        status = core.get_durability_status()
+        assert (status['profile'], status['mode']) == (name, 'disk')
+        settings = status['settings']
+        assert (settings['journal_mode'], settings['synchronous']) == ('WAL', profile.synchronous)
+        assert settings['cache_size_kib'] == profile.cache_size_kib
+        # Las conexiones de los hilos de fondo usan el mismo perfil
+        worker = core.open_connection()
+        try:
+            assert durability.effective_settings(worker)['synchronous'] == profile.synchronous
+        finally:
+            worker.close()
+
+
+def test_in_memory_profile_reports_its_loss_window(workdir):
+    path = str(workdir / 'alarm_core.db')
+    checkpoint = CheckpointManager(path, work_dir=str(workdir), interval=300, max_changes=1000)
+    with AlarmCore(path, durability='sd-card-saver', checkpoint=checkpoint) as core:
+        status = core.get_durability_status()
+        assert status['mode'] == 'memory' and status['database_path'] == checkpoint.work_path
+        assert status['settings']['synchronous'] == 'OFF'
+        assert (status['checkpoint']['max_loss_seconds'], status['checkpoint']['max_loss_changes']) == (300, 1000)
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        durability.get_profile('reckless')
+    with pytest.raises(ConfigError):
+        AlarmConfig.from_dict({'durability': 'reckless'})
+    assert AlarmConfig.from_dict({'durability': 'paranoid'}).durability == 'paranoid'
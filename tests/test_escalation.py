@@ -0,0 +1,37 @@
+from anomaly import FLAPPING
+from core import AlarmCore
+from escalation import DEFAULT_POLICY, EscalationScheduler
+
+
+def _restart(path, ran):
+    scheduler = EscalationScheduler(actions={step.action: lambda alarm, step: ran.append((alarm['id'], step.action))
+                                             for step in DEFAULT_POLICY})
+    alarm_core = AlarmCore(path, escalation=scheduler)
+    alarm_core.close()
+    return scheduler
+
+
+def test_restart_does_not_repeat_executed_steps(workdir):
+    """Regresión: cada reinicio volvía a ejecutar el último paso vencido."""
+    path = str(workdir / 'alarm_core.db')
+    with AlarmCore(path) as alarm_core:
+        alarm_id = alarm_core.trigger_alarm(None, 'intrusion')
+        alarm_core.connection.execute(
+            "UPDATE alarms SET timestamp = datetime('now', '-400 seconds') WHERE id = ?", (alarm_id,))
+        alarm_core.connection.commit()
+
+    ran = []
+    _restart(path, ran)
+    assert ran == [(alarm_id, 'siren')]  # Solo el último paso vencido
+    _restart(path, ran)
+    assert ran == [(alarm_id, 'siren')]
+
+
+def test_maintenance_alarms_do_not_use_default_policy():
+    scheduler = EscalationScheduler()
+    scheduler.schedule_alarm(1, alarm_type=FLAPPING)
+    scheduler.schedule_alarm(2, alarm_type='intrusion')
+    assert scheduler.pending() == 1
+    scheduler = EscalationScheduler(policies={FLAPPING: DEFAULT_POLICY[:1]})
+    scheduler.schedule_alarm(1, alarm_type=FLAPPING)
+    assert scheduler.pending() == 1
@@ -0,0 +1,34 @@
+import os
+import time
+
+import pytest
+
+from evidence import EvidenceStore, EvidenceTooLarge
+
+
+def test_oversize_object_is_rejected(tmp_path):
+    store = EvidenceStore(str(tmp_path), max_bytes=10)
+    try:
+        kept = store.put(b'small', alarm_id=1)
+        with pytest.raises(EvidenceTooLarge):
+            store.put([b'123456', b'789012'], alarm_id=2)
+        assert store.contains(kept)
+        assert store.usage()['blobs'] == 1
+        assert os.listdir(store.tmp_dir) == []
+    finally:
+        store.close()
+
+
+def test_only_stale_temporaries_are_removed(tmp_path):
+    tmp_dir = tmp_path / 'tmp'
+    tmp_dir.mkdir()
+    stale, fresh = tmp_dir / 'upload-old', tmp_dir / 'upload-new'
+    stale.write_bytes(b'x')
+    fresh.write_bytes(b'y')
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    store = EvidenceStore(str(tmp_path))
+    try:
+        assert sorted(os.listdir(tmp_dir)) == ['upload-new']
+    finally:
+        store.close()
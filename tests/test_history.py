@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import history
+
+
+def test_long_interval_writes_bounded_rows(core):
+    module_id = core.register_module('door', 'normal')
+    start = datetime(2025, 1, 1)
+    cursor = core.connection.cursor()
+    core._apply_module_status(cursor, module_id, 'alarm', start)
+    core._apply_module_status(cursor, module_id, 'normal', start + timedelta(days=30))
+    core.connection.commit()
+
+    counts = dict(core.connection.execute(
+        "SELECT granularity, COUNT(*) FROM module_rollups GROUP BY granularity").fetchall())
+    assert counts['minute'] <= 24 * 60 + 5  # Último día, no 30 días de minutos
+    # Los días siguen sumando todo el tiempo en alarma
+    days = history.get_rollups(core.connection, module_id, 'day', start, start + timedelta(days=31))
+    assert sum(d['alarm_seconds'] for d in days) == 30 * 86400
+
+
+def test_prune_keeps_last_transition(core):
+    module_id = core.register_module('door', 'normal')
+    old = datetime(2020, 1, 1)
+    cursor = core.connection.cursor()
+    core._apply_module_status(cursor, module_id, 'alarm', old)
+    core._apply_module_status(cursor, module_id, 'normal', old + timedelta(minutes=5))
+    core.connection.commit()
+    assert history.prune(cursor, now=datetime(2025, 1, 1))
+    # Queda la transición de alta (reciente) y la última de 2020; la de entrada en alarma se borra
+    transitions = history.get_transitions(core.connection, module_id)
+    assert [t[1:] for t in transitions] == [('alarm', 'normal'), (None, 'normal')]
+    assert cursor.execute("SELECT COUNT(*) FROM module_rollups WHERE bucket < '2021'").fetchone()[0] == 0
+
+
+def test_prune_uses_indexes(core):
+    plans = []
+    for sql in ("DELETE FROM module_rollups WHERE granularity = 'day' AND bucket < '2020'",
+                "DELETE FROM module_transitions WHERE timestamp < '2020' AND id < "
+                "(SELECT MAX(t.id) FROM module_transitions t WHERE t.module_id = module_transitions.module_id)"):
+        plans += [row[-1] for row in core.connection.execute("EXPLAIN QUERY PLAN " + sql)]
+    assert not [step for step in plans if step.startswith('SCAN')], plans
+
+
+def test_reading_history_does_not_write(core):
+    module_id = core.register_module('door', 'normal')
+    changes = core.connection.total_changes
+    core.get_module_history(module_id, 'minute')
+    assert core.connection.total_changes == changes
@@ -0,0 +1,24 @@
+from config import AlarmConfig
+from io_backends import create_backend
+from io_manager import IOManager
+
+
+def test_accepts_config_snapshot():
+    config = AlarmConfig.from_dict({'io': {'backend': 'fake', 'bounce_time': 50,
+                                           'output_pins': {'siren': 5}}})
+    io = IOManager(config=config)
+    try:
+        assert io.defaults['bounce_time'] == 50
+        assert io.defaults['output_pins'] == {'siren': 5}
+    finally:
+        io.cleanup()
+
+
+def test_mcp23s17_uses_spi_settings():
+    settings = AlarmConfig.from_dict({'io': {'backend': 'mcp23s17', 'spi_bus': 1, 'spi_device': 2,
+                                             'spi_addresses': [0, 3]}}).io
+    backend = create_backend(settings)
+    assert (backend.bus_number, backend.device, tuple(backend.addresses)) == (1, 2, (0, 3))
+    default = AlarmConfig.from_dict({'io': {'backend': 'mcp23s17'}}).io
+    backend = create_backend(default)
+    assert (backend.bus_number, backend.device, tuple(backend.addresses)) == (0, 0, (0,))
@@ -0,0 +1,55 @@
+import pytest
+
+from changefeed import ALARM_CREATED
+from core import AlarmCore
+from journal import EventJournal, RecordTooLarge
+
+
+@pytest.fixture
+def journaled(workdir):
+    alarm_core = AlarmCore(str(workdir / 'alarm_core.db'),
+                           journal=EventJournal(str(workdir / 'events.journal'), capacity=64))
+    yield alarm_core
+    alarm_core.close()
+
+
+def test_alarm_created_is_published_after_commit(journaled):
+    """Regresión: ALARM_CREATED llegaba antes de que la fila existiera."""
+    subscription = journaled.changes.subscribe(kinds=(ALARM_CREATED,))
+    module_id = journaled.register_module('door', 'normal')
+    alarm_id = journaled.trigger_alarm(module_id, 'intrusion', 'front door')
+    event = subscription.get(timeout=5)
+    assert event is not None and event.payload['alarm_id'] == alarm_id
+    assert [a.id for a in journaled.get_active_alarms()] == [alarm_id]
+
+
+def test_acknowledge_sees_undrained_alarm(journaled):
+    journaled.journal.stop(drain=False)  # Dejar la alarma solo en el diario
+    subscription = journaled.changes.subscribe(kinds=(ALARM_CREATED,))
+    alarm_id = journaled.trigger_alarm(None, 'intrusion')
+    assert subscription.drain() == []
+    assert journaled.acknowledge_alarm(alarm_id, acknowledged_by='op')
+    assert journaled.get_active_alarms() == []
+    assert [e.payload['alarm_id'] for e in subscription.drain()] == [alarm_id]
+
+
+def test_texts_roundtrip_without_truncation(workdir):
+    journal = EventJournal(str(workdir / 'events.journal'), capacity=8)
+    description = 'ñ' * 100  # 200 bytes: cabe entero
+    alarm_id = journal.append(None, 'intrusión', description)
+    record = journal._read_slot(alarm_id % journal.capacity)
+    assert (record.module_id, record.alarm_type, record.description) == (None, 'intrusión', description)
+    with pytest.raises(RecordTooLarge):
+        journal.append(1, 'intrusion', 'x' * 1000)
+    assert journal.append(1, 'intrusion') == alarm_id + 1  # El rechazo no consume ID
+    journal.close()
+
+
+def test_oversize_alarm_falls_back_to_direct_insert(journaled):
+    first = journaled.trigger_alarm(None, 'intrusion', 'short')
+    long_id = journaled.trigger_alarm(None, 'intrusion', 'é' * 500)
+    after = journaled.trigger_alarm(None, 'intrusion', 'short')
+    assert first < long_id < after
+    journaled.journal.drain()
+    alarms = {a.id: a.description for a in journaled.get_active_alarms()}
+    assert alarms[long_id] == 'é' * 500 and len(alarms) == 3
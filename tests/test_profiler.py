@@ -0,0 +1,37 @@
+import json
+import sqlite3
+
+from core import AlarmCore
+from profiler import QueryProfiler
+
+
+def test_executemany_explains_with_first_row(tmp_path):
+    profiler = QueryProfiler()
+    db = sqlite3.connect(str(tmp_path / 'p.db'), factory=profiler.connection_factory())
+    db.execute("CREATE TABLE t (a INTEGER PRIMARY KEY, b TEXT)")
+    db.cursor().executemany("INSERT INTO t (a, b) VALUES (?, ?)", ((i, 'x') for i in range(3)))
+    assert db.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 3
+    entry = next(e for e in profiler.report()['slow_queries'] if e['sql'].startswith('INSERT'))
+    assert entry['params_shape'] == '(int, str)'
+    assert not any('explain failed' in line for line in entry['plan'] or [])
+    db.close()
+
+
+def test_background_connections_are_profiled(workdir):
+    with AlarmCore(str(workdir / 'alarm_core.db'), profiler=True) as core:
+        connection = core.open_connection()
+        connection.execute("SELECT COUNT(*) FROM alarms").fetchone()
+        connection.close()
+        assert 'SELECT COUNT(*) FROM alarms' in core.profiler.report()['statements']
+
+
+def test_core_methods_and_statements_are_profiled(workdir):
+    with AlarmCore(str(workdir / 'alarm_core.db'), profiler=True) as core:
+        module_id = core.register_module('door', 'normal')
+        core.trigger_alarm(module_id, 'intrusion')
+        report = core.get_profile_report()
+        assert report['methods']['AlarmCore.trigger_alarm']['calls'] == 1
+        assert any(sql.startswith('INSERT INTO alarms') for sql in report['statements'])
+        path = core.dump_profile(str(workdir / 'profile.json'))
+    with open(path) as f:
+        assert json.load(f)['methods']['AlarmCore.register_module']['calls'] == 1
@@ -0,0 +1,24 @@
+import socket
+import zlib
+
+import pytest
+
+import replication
+from replication import HEADER, MAGIC, MSG_BATCH, PROTOCOL_VERSION, ProtocolError, encode_frame, read_frame
+
+
+def test_frame_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(encode_frame(MSG_BATCH, {'rows': [1, 2]}))
+        assert read_frame(b) == (MSG_BATCH, {'rows': [1, 2]})
+
+
+def test_decompression_is_bounded(monkeypatch):
+    monkeypatch.setattr(replication, 'MAX_FRAME', 64 * 1024)
+    payload = zlib.compress(b'[' + b'0,' * 100000 + b'0]')
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(HEADER.pack(MAGIC, PROTOCOL_VERSION, MSG_BATCH, len(payload)) + payload)
+        with pytest.raises(ProtocolError):
+            read_frame(b)
@@ -0,0 +1,40 @@
+import time
+from datetime import datetime
+
+from config import AlarmConfig
+from core import AlarmCore
+from retention import RetentionManager
+
+
+def test_retention_section_round_trips():
+    config = AlarmConfig.from_dict({'retention': {'max_age_days': 30, 'interval_hours': 6}})
+    assert config.retention.max_age_days == 30
+    assert AlarmConfig.from_dict(config.to_dict()) == config
+
+
+def test_core_runs_retention_and_prunes_history(workdir):
+    manager = RetentionManager(None, str(workdir / 'archive'), max_age_days=30, pause=0)
+    path = str(workdir / 'alarm_core.db')
+    with AlarmCore(path) as alarm_core:
+        old_id = alarm_core.trigger_alarm(None, 'intrusion')
+        alarm_core.connection.execute("UPDATE alarms SET timestamp = '2020-01-01 00:00:00' WHERE id = ?",
+                                      (old_id,))
+        module_id = alarm_core.register_module('door', 'normal')
+        cursor = alarm_core.connection.cursor()
+        alarm_core._apply_module_status(cursor, module_id, 'alarm', datetime(2020, 1, 1))
+        alarm_core._apply_module_status(cursor, module_id, 'normal', datetime(2020, 1, 1, 0, 5))
+        alarm_core.connection.commit()
+
+    with AlarmCore(path, retention=manager) as alarm_core:
+        assert manager.core is alarm_core
+        # El primer ciclo corre en segundo plano al arrancar
+        def old_rollups():
+            return alarm_core.connection.execute(
+                "SELECT COUNT(*) FROM module_rollups WHERE bucket < '2021'").fetchone()[0]
+
+        deadline = time.monotonic() + 5
+        while (alarm_core.get_active_alarms() or old_rollups()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert alarm_core.get_active_alarms() == []
+        assert [a['id'] for a in manager.query_archive()] == [old_id]
+        assert old_rollups() == 0
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from config import AlarmConfig, ConfigError, ConfigManager, ZoneSettings
+from rules import RuleEngine
+
+
+def test_relay_actions_compile_without_io_manager(workdir, core):
+    """Regresión: una acción de relé válida tumbaba el arranque de la GUI."""
+    path = workdir / 'alarm_config.json'
+    path.write_text(json.dumps({
+        'io': {'output_pins': {'siren': 17, 'relay_1': 22}},
+        'zones': [{'name': 'door', 'modules': [1], 'actions': ['alarm', 'relay_1']}],
+    }))
+    engine = RuleEngine(core, config=ConfigManager(str(path)))
+    try:
+        assert engine.rule_for(1, 'away').zone.name == 'door'
+        engine.arm('away')
+        engine._armed_at -= 60  # Fuera del retardo de salida
+        module_id = core.register_module('door', 'normal')
+        engine.handle_event(module_id, 'alarm')
+        assert len(core.get_active_alarms()) == 1
+    finally:
+        engine.close()
+
+
+def test_unknown_action_is_rejected_by_config():
+    with pytest.raises(ConfigError):
+        AlarmConfig.from_dict({'zones': [{'name': 'door', 'actions': ['alarm', 'relay_9']}]})
+
+
+def test_bad_zone_is_skipped_not_raised():
+    config = AlarmConfig(zones=(ZoneSettings(name='bad', modules=(1,), actions=('nope',)),
+                                ZoneSettings(name='good', modules=(2,))))
+    engine = RuleEngine(config=config)
+    assert engine.rule_for(1, 'away') is None
+    assert engine.rule_for(2, 'away').zone.name == 'good'
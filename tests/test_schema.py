@@ -0,0 +1,67 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import schema
+from core import AlarmCore
+from records import Alarm
+
+# Esquema de las BDs anteriores a schema.py (user_version 0), con contraseñas en claro
+V0_TABLES = (
+    '''CREATE TABLE modules (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+       status TEXT NOT NULL, last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE alarms (id INTEGER PRIMARY KEY AUTOINCREMENT, module_id INTEGER,
+       alarm_type TEXT NOT NULL, description TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+       acknowledged BOOLEAN DEFAULT 0, FOREIGN KEY(module_id) REFERENCES modules(id))''',
+    '''CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL UNIQUE,
+       password TEXT NOT NULL, role TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+)
+
+
+def test_migrates_a_v0_database(workdir):
+    path = str(workdir / 'alarm_core.db')
+    connection = sqlite3.connect(path)
+    for statement in V0_TABLES:
+        connection.execute(statement)
+    connection.execute("INSERT INTO modules (name, status) VALUES ('door', 'normal')")
+    connection.execute("INSERT INTO alarms (module_id, alarm_type, timestamp) "
+                       "VALUES (1, 'intrusion', '2024-03-01 10:00:00')")
+    connection.execute("INSERT INTO users (username, password, role) VALUES ('admin', 'admin123', 'administrator')")
+    connection.commit()
+    connection.close()
+
+    with AlarmCore(path) as core:
+        assert schema.get_version(core.connection) == schema.SCHEMA_VERSION
+        alarm, = core.get_active_alarms()
+        assert isinstance(alarm, Alarm)
+        assert (alarm.id, alarm.module_id, alarm.alarm_type) == (1, 1, 'intrusion')
+        assert alarm.timestamp == datetime(2024, 3, 1, 10, 0, 0)
+        assert alarm.acknowledged_by is None
+        # La contraseña en claro se convierte en hash y sigue sirviendo
+        assert core.authenticate_user('admin', 'admin123')['role'] == 'administrator'
+        assert core.connection.execute("SELECT password FROM users").fetchone()[0] != 'admin123'
+        assert core.acknowledge_alarm(alarm.id, acknowledged_by='operator')
+
+    # Reabrir no vuelve a migrar nada
+    with AlarmCore(path) as core:
+        assert schema.migrate(core.connection) == schema.SCHEMA_VERSION
+
+
+def test_records_are_read_only(core):
+    alarm_id = core.trigger_alarm(None, 'intrusion')
+    alarm, = core.get_active_alarms()
+    assert alarm.id == alarm_id and alarm.as_dict()['alarm_type'] == 'intrusion'
+    with pytest.raises(AttributeError):
+        alarm.alarm_type = 'tamper'
+
+
+def test_rejects_newer_schema(workdir):
+    path = str(workdir / 'alarm_core.db')
+    connection = sqlite3.connect(path)
+    connection.execute(f"PRAGMA user_version = {schema.SCHEMA_VERSION + 1}")
+    try:
+        with pytest.raises(RuntimeError):
+            schema.migrate(connection)
+    finally:
+        connection.close()
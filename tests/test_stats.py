@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+import stats
+
+
+def test_windows_count_by_age(core):
+    now = datetime(2025, 6, 1, 12, 0, 0)
+    cursor = core.connection.cursor()
+    for age in (timedelta(minutes=5), timedelta(hours=3), timedelta(days=3), timedelta(days=10)):
+        stats.record_raised(cursor, None, 'intrusion', now - age)
+    core.connection.commit()
+
+    result = stats.summary(core.connection, now)
+    assert [result[window]['raised'] for window in ('hour', 'day', 'week')] == [1, 2, 3]
+    assert result['hour']['rows'] == [{'module_id': None, 'alarm_type': 'intrusion', 'raised': 1,
+                                       'acknowledged': 0, 'mtta': None}]
+    # Minutos de más de una hora (3) y la hora de hace 10 días
+    assert stats.prune(cursor, now) == 4
+    assert stats.summary(core.connection, now)['week']['raised'] == 3
+
+
+def test_core_keeps_counters_and_mtta(core):
+    module_id = core.register_module('door', 'normal')
+    first = core.trigger_alarm(module_id, 'intrusion')
+    core.trigger_alarm(module_id, 'intrusion')
+    core.trigger_alarm(module_id, 'tamper')
+    assert core.acknowledge_alarm(first, acknowledged_by='operator')
+
+    hour = core.get_alarm_stats()['hour']
+    assert (hour['raised'], hour['acknowledged']) == (3, 1)
+    rows = {row['alarm_type']: row for row in hour['rows']}
+    assert rows['intrusion']['module_id'] == module_id
+    assert (rows['intrusion']['raised'], rows['intrusion']['acknowledged']) == (2, 1)
+    assert 0 <= rows['intrusion']['mtta'] < 60
+    assert rows['tamper']['mtta'] is None